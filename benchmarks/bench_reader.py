@@ -0,0 +1,243 @@
+#coding=UTF-8
+"""
+Benchmark of reading ehyd files.
+
+Writes synthetic files (see ehyd_synthetic.py) and measures how long
+  * parsing the header,
+  * parsing the values,
+  * the quality checks,
+  * the whole ehyd_reader
+take for a long daily csv file, a monthly csv file with moved coordinates and
+duplicated days and a .dat file with several values per day, and how long
+ehyd_read_many takes for a folder of --n-files files. It also checks that
+daily stations over the same dates need less memory as CompactStations than
+as a dataframe.
+
+Along with the timings, a fingerprint of the output (a hash of the metadata,
+dates and values) gets stored, so a faster version can be checked to still
+give the exact same results. The files are the same on every run (as long as
+numpy's random numbers don't change).
+
+Run it from anywhere with
+
+    python benchmarks/bench_reader.py
+
+Use --save results.json to keep the results and --baseline results.json to
+compare against them later. The script exits with an error if an output
+differs from the baseline or a timing got more than --tolerance times slower.
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import ehyd_synthetic
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import ehyd_reader
+
+# The single files, as arguments of ehyd_synthetic.make_station.
+CASES = {
+    'csv_daily': dict(datatype='Riverwater', start='1940-01-01', seed=1),
+    'csv_monthly': dict(datatype='Groundwater', start='1940-01-01', moves=2,
+                        duplicates=1, month_gaps=3, seed=2),
+    'dat_subdaily': dict(datatype='Riverwater', start='1990-01-01',
+                         input_type='dat', per_day=4, seed=3),
+}
+
+
+def fingerprint(ehyd_df):
+    """
+    Returns a hash of the column header, dates and values of a dataframe
+    from ehyd_reader or ehyd_read_many.
+    """
+    digest = hashlib.sha1(repr(list(ehyd_df.columns)).encode())
+    digest.update(ehyd_df.index.values.astype('datetime64[ns]').tobytes())
+    digest.update(ehyd_df.to_numpy(dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def measure(function, repeat):
+    """
+    Runs function repeat times. Returns the times in ms and the result of the
+    last run.
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times, result
+
+
+def summary(times, output=None):
+    result = {'median_ms': statistics.median(times), 'min_ms': min(times)}
+    if output is not None:
+        result['fingerprint'] = fingerprint(output)
+    return result
+
+
+def bench_file(filename, input_type, repeat):
+    """
+    Times the steps of reading a single file.
+    """
+    with open(filename, 'r', encoding='cp1252') as f1:
+        file_text = f1.read()
+    header, data_start = ehyd_reader._split_header(file_text, input_type)
+    data_text = file_text[data_start:]
+    hydro_tS = ehyd_reader._read_values(data_text, input_type)
+
+    results = {}
+    times, _ = measure(
+        lambda: ehyd_reader._split_header(file_text, input_type), repeat)
+    results['header'] = summary(times)
+    times, _ = measure(
+        lambda: ehyd_reader._read_values(data_text, input_type), repeat)
+    results['values'] = summary(times)
+    # The checks may change the series, so every run gets its own copy.
+    times = []
+    for i in range(repeat):
+        copied = hydro_tS.copy()
+        times += measure(lambda: ehyd_reader._check_station(
+            dict(header), copied, input_type), 1)[0]
+    results['checks'] = summary(times)
+    times, output = measure(
+        lambda: ehyd_reader.ehyd_reader(filename, 'df',
+                                        input_type=input_type), repeat)
+    results['ehyd_reader'] = summary(times, output)
+    return results
+
+
+def bench_many(files, repeat, workers):
+    """
+    Times reading a whole folder with ehyd_read_many.
+    """
+    results = {}
+    for name, n_workers in [('read_many', 1), ('read_many_workers', workers)]:
+        times, (stations, errors) = measure(
+            lambda: ehyd_reader.ehyd_read_many(files, workers=n_workers),
+            repeat)
+        results[name] = summary(times, stations)
+        results[name]['errors'] = sorted(os.path.basename(filename)
+                                         for filename in errors)
+    return results
+
+
+def bench_memory(directory, n_files=16):
+    """
+    Compares the memory of n_files daily stations over the same dates, as a
+    dataframe and as CompactStations.
+    """
+    files = []
+    for number in range(n_files):
+        filename = os.path.join(directory, 'daily_%02d.csv' % number)
+        ehyd_synthetic.make_station(filename, 'Riverwater', start='1976-01-01',
+                                    month_gaps=0, hzb=200000 + number,
+                                    seed=number)
+        files.append(filename)
+    stations, errors = ehyd_reader.ehyd_read_many(files)
+    compact, errors = ehyd_reader.ehyd_read_many(files, output_type='compact')
+    return {'wide_bytes': int(stations.memory_usage().sum()),
+            'compact_bytes': int(compact.nbytes)}
+
+
+def run_benchmark(repeat, n_files, workers):
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for case, arguments in CASES.items():
+            input_type = arguments.get('input_type', 'csv')
+            filename = os.path.join(temp_dir, case + '.' + input_type)
+            ehyd_synthetic.make_station(filename, **arguments)
+            for stage, result in bench_file(filename, input_type,
+                                            repeat).items():
+                results['%s/%s' % (case, stage)] = result
+        files = ehyd_synthetic.make_directory(
+            os.path.join(temp_dir, 'many'), n_files, seed=0)
+        # Reading many files takes a while, so it doesn't get repeated as
+        # often.
+        for stage, result in bench_many(files, max(1, repeat // 3),
+                                        workers).items():
+            results['%d_files/%s' % (n_files, stage)] = result
+        memory_dir = os.path.join(temp_dir, 'memory')
+        os.makedirs(memory_dir)
+        results['aligned_daily/memory'] = bench_memory(memory_dir)
+    return results
+
+
+def check(results, baseline=None, tolerance=1.5):
+    """
+    Returns a list of everything that went wrong.
+    """
+    problems = []
+    for name, result in results.items():
+        # CompactStations are meant to need less memory than a dataframe.
+        if result.get('compact_bytes', 0) > result.get('wide_bytes', 0):
+            problems.append('%s: CompactStations need %d bytes, more than '
+                            'the %d bytes of a dataframe'
+                            % (name, result['compact_bytes'],
+                               result['wide_bytes']))
+    if baseline is None:
+        return problems
+    for name, result in results.items():
+        if name not in baseline or 'median_ms' not in result:
+            continue
+        old = baseline[name]
+        if 'fingerprint' in old and old['fingerprint'] != result.get(
+                'fingerprint'):
+            problems.append('%s gives a different output' % name)
+        if old.get('errors', []) != result.get('errors', []):
+            problems.append('%s fails for different files' % name)
+        allowed_ms = old['median_ms'] * tolerance
+        if result['median_ms'] > allowed_ms:
+            problems.append('%s took %.1f ms, more than %.1f ms'
+                            % (name, result['median_ms'], allowed_ms))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of runs per measurement')
+    parser.add_argument('--n-files', type=int, default=50,
+                        help='number of files for ehyd_read_many')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of workers for ehyd_read_many')
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against these results')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='allowed slowdown compared to the baseline')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeat, args.n_files, args.workers)
+    for name, result in results.items():
+        if 'median_ms' not in result:
+            print('%-32s %9.2f MB compact, %.2f MB as dataframe'
+                  % (name, result['compact_bytes'] / 1e6,
+                     result['wide_bytes'] / 1e6))
+            continue
+        print('%-32s %9.1f ms (min %.1f ms)  %s'
+              % (name, result['median_ms'], result['min_ms'],
+                 result.get('fingerprint', '')[:12]))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f1:
+            baseline = json.load(f1)
+    if args.save:
+        with open(args.save, 'w') as f1:
+            json.dump(results, f1, indent=2)
+
+    problems = check(results, baseline, args.tolerance)
+    for problem in problems:
+        print('FAILED:', problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#coding=UTF-8
+"""
+Benchmark of the startup time of ehyd_reader.
+
+Measures, each in a fresh python process, how long it takes to
+  * import ehyd_reader,
+  * read the header of a small file with parse_header for the first time,
+  * read a small file with ehyd_reader for the first time,
+and which heavy modules (pandas, numpy, ...) get imported along the way.
+Importing ehyd_reader must not import any of them, and reading only the header
+must not import pandas.
+
+Run it from anywhere with
+
+    python benchmarks/bench_startup.py
+
+Use --save results.json to keep the results and --baseline results.json to
+compare against them later. The script exits with an error if one of the
+checks above fails or a timing got more than --tolerance times slower than the
+baseline.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import ehyd_synthetic
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'numpy', 'sklearn', 'pyarrow']
+
+# Each snippet prints the time it took in ms and the heavy modules that got
+# imported, as json.
+SNIPPETS = {
+    'import': '''
+import time
+start = time.perf_counter()
+import ehyd_reader
+stop = time.perf_counter()
+''',
+    'first_parse_header': '''
+import time
+import ehyd_reader
+start = time.perf_counter()
+ehyd_reader.parse_header(FILENAME)
+stop = time.perf_counter()
+''',
+    'first_ehyd_reader': '''
+import time
+import ehyd_reader
+start = time.perf_counter()
+ehyd_reader.ehyd_reader(FILENAME, 'df')
+stop = time.perf_counter()
+''',
+}
+SNIPPET_END = '''
+import json, sys
+print(json.dumps({'ms': (stop - start) * 1000,
+                  'modules': [name for name in HEAVY_MODULES
+                              if name in sys.modules]}))
+'''
+
+# The modules each step is allowed to import.
+ALLOWED_MODULES = {
+    'import': [],
+    'first_parse_header': [],
+    'first_ehyd_reader': ['pandas', 'numpy', 'pyarrow'],
+}
+
+
+def run_snippet(name, filename):
+    code = ('HEAVY_MODULES = %r\nFILENAME = %r\n' % (HEAVY_MODULES, filename)
+            + SNIPPETS[name] + SNIPPET_END)
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def run_benchmark(repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, 'benchmark.csv')
+        # 50 years of monthly groundwater levels.
+        ehyd_synthetic.make_station(filename, 'Groundwater',
+                                    start='1970-01-01', length=600, seed=0)
+        for name in SNIPPETS:
+            runs = [run_snippet(name, filename) for i in range(repeat)]
+            results[name] = {
+                'median_ms': statistics.median(run['ms'] for run in runs),
+                'min_ms': min(run['ms'] for run in runs),
+                'modules': runs[0]['modules']}
+    return results
+
+
+def check(results, baseline=None, tolerance=1.5):
+    """
+    Returns a list of everything that went wrong.
+    """
+    problems = []
+    for name, result in results.items():
+        unwanted = [module for module in result['modules']
+                    if module not in ALLOWED_MODULES[name]]
+        if unwanted:
+            problems.append('%s imports %s' % (name, ', '.join(unwanted)))
+        if baseline is not None and name in baseline:
+            allowed_ms = baseline[name]['median_ms'] * tolerance
+            if result['median_ms'] > allowed_ms:
+                problems.append('%s took %.1f ms, more than %.1f ms'
+                                % (name, result['median_ms'], allowed_ms))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of fresh processes per measurement')
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against these results')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='allowed slowdown compared to the baseline')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeat)
+    for name, result in results.items():
+        print('%-20s %8.1f ms (min %.1f ms)  imports: %s'
+              % (name, result['median_ms'], result['min_ms'],
+                 ', '.join(result['modules']) or '-'))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f1:
+            baseline = json.load(f1)
+    if args.save:
+        with open(args.save, 'w') as f1:
+            json.dump(results, f1, indent=2)
+
+    problems = check(results, baseline, args.tolerance)
+    for problem in problems:
+        print('FAILED:', problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
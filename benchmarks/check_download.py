@@ -0,0 +1,187 @@
+#coding=UTF-8
+"""
+Check of ehyd_download against a local server.
+
+Starts a small http server on localhost that answers like ehyd (with
+synthetic files, see ehyd_synthetic.py), but also drops connections, answers
+503 with a Retry-After, 404 and 304, and checks that ehyd_download
+  * retries dropped connections and 503, and waits out the Retry-After,
+  * doesn't retry a 404, but reports it as an error of the station,
+  * tries the next file number if a file is empty,
+  * sends the ETag of the last run and keeps the state on a 304.
+Nothing gets downloaded from ehyd itself.
+
+Run it from anywhere with
+
+    python benchmarks/check_download.py
+
+The script exits with an error if one of the checks fails.
+"""
+import argparse
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import ehyd_synthetic
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import ehyd_download
+
+# What the server answers to the requests for each station, one after the
+# other: a status (with headers), 'drop' to close the connection without an
+# answer or 'file' for the file of the station. Once these are used up, it
+# answers with the file, or 304 if the ETag fits.
+PLANS = {
+    100001: ['drop', (503, {'Retry-After': '1'}), (503, {})],
+    100002: [(404, {})],
+    100003: [],
+}
+# Stations whose file 2 is empty, so file 3 has to be tried.
+EMPTY_FILE_2 = [100003]
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        HZB = int(query['id'][0])
+        file = int(query['file'][0])
+        server = self.server
+        with server.lock:
+            server.requests.append((HZB, file,
+                                    self.headers.get('If-None-Match')))
+            server.times.setdefault(HZB, []).append(time.perf_counter())
+            plan = server.plans[HZB]
+            answer = plan.pop(0) if plan else 'file'
+        if answer == 'drop':
+            self.close_connection = True
+            return
+        if answer == 'file':
+            etag = '"%d-%d"' % (HZB, file)
+            if file == 2 and HZB in EMPTY_FILE_2:
+                body = b''
+            elif self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            else:
+                body = server.files[HZB]
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        status, headers = answer
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(directory):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.times = {}
+    server.plans = {HZB: list(plan) for HZB, plan in PLANS.items()}
+    server.files = {}
+    for number, HZB in enumerate(PLANS):
+        filename = os.path.join(directory, '%d.csv' % HZB)
+        ehyd_synthetic.make_station(filename, 'Groundwater',
+                                    start='1990-01-01', hzb=HZB, seed=number)
+        with open(filename, 'rb') as f1:
+            server.files[HZB] = f1.read()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_checks(server):
+    problems = []
+
+    def expect(condition, problem):
+        if not condition:
+            problems.append(problem)
+
+    url = ('http://127.0.0.1:%d/{kind}?id={HZB}&file={file}'
+           % server.server_address[1])
+    state = {}
+    stations, errors = ehyd_download.ehyd_download(
+        list(PLANS), files=[2, 3], workers=3, retries=3, backoff=0.01,
+        timeout=10, state=state, url=url)
+    requests = server.requests[:]
+    # The second request of 100001 got the Retry-After.
+    times = server.times[100001]
+    seconds = times[2] - times[1] if len(times) > 2 else 0
+
+    expect(stations.get(100001) is not None and 100001 not in errors,
+           '100001 should be read after the retries, got %r'
+           % errors.get(100001))
+    expect(sum(HZB == 100001 for HZB, _, _ in requests) == 4,
+           '100001 should take 4 requests (drop, 503, 503, file), took %d'
+           % sum(HZB == 100001 for HZB, _, _ in requests))
+    expect(seconds >= 1,
+           'the Retry-After of 1 s should be waited out, waited %.2f s'
+           % seconds)
+    expect('404' in errors.get(100002, ''),
+           '100002 should fail with 404, got %r' % errors.get(100002))
+    expect(sum(HZB == 100002 for HZB, _, _ in requests) == 1,
+           'a 404 should not be retried')
+    expect(stations.get(100003) is not None
+           and state.get('100003', {}).get('file') == 3,
+           '100003 should be read from file 3, got %r'
+           % state.get('100003'))
+
+    # The second run sends the ETags and gets 304 for everything that
+    # worked, which keeps the state as it was.
+    before = {HZB: dict(entry) for HZB, entry in state.items()}
+    del server.requests[:]
+    stations, errors = ehyd_download.ehyd_download(
+        [100001, 100003], files=[2, 3], workers=2, backoff=0.01, timeout=10,
+        state=state, url=url)
+    expect(stations == {100001: None, 100003: None} and not errors,
+           'unchanged stations should give None, got %r and %r'
+           % ({HZB: type(output).__name__
+               for HZB, output in stations.items()}, errors))
+    expect(state == before, 'a 304 should keep the state')
+    expect(sorted(server.requests) == [(100001, 2, '"100001-2"'),
+                                       (100003, 3, '"100003-3"')],
+           'the second run should ask for the known files with their ETag, '
+           'sent %r' % sorted(server.requests))
+    return problems, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(directory)
+        try:
+            problems, seconds = run_checks(server)
+        finally:
+            server.shutdown()
+            server.server_close()
+    print('waited %.2f s for a Retry-After of 1 s' % seconds)
+    for problem in problems:
+        print('FAILED:', problem)
+    if not problems:
+        print('all checks passed')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,315 @@
+#coding=UTF-8
+"""
+Generator for synthetic ehyd files.
+
+The data from ehyd can't be shared, so the benchmarks (and anybody who wants
+to try something out) need files that look like the real thing instead. The
+files written here have the same layout as the ones from ehyd.gv.at: cp1252,
+a header with the metadata of the station, the values with a decimal comma
+(or the space separated .dat layout with a decimal dot), 'Lücke' for missing
+values, and the quirks ehyd_reader has to deal with: stations that got moved
+(several rows of coordinates), missing coordinates, duplicated days and
+whole months without any dates, like around 1945.
+
+The values are random, but look roughly like groundwater levels, river
+stages, precipitation or spring flows.
+
+Write a single file with make_station, or a folder full of different
+stations with make_directory:
+
+    python benchmarks/ehyd_synthetic.py synthetic_files -n 100
+"""
+import argparse
+import os
+
+import numpy as np
+
+DATATYPES = ('Groundwater', 'Riverwater', 'Precipitation', 'Spring')
+
+# Daily data for everything but groundwater, like on ehyd.
+_DEFAULT_FREQ = {'Groundwater': 'MS', 'Riverwater': 'D',
+                 'Precipitation': 'D', 'Spring': 'D'}
+
+
+def _header_lines(datatype, hzb, coordinates, input_type, rng):
+    """
+    Returns the lines of the header, up to and including 'Werte:'.
+    """
+    if input_type == 'dat':
+        def line(key, value=''):
+            return '%s  %s' % (key, value) if value != '' else key
+    else:
+        def line(key, value=''):
+            return '%s;%s' % (key, value) if value != '' else key
+
+    def number(value):
+        text = '%.2f' % value
+        return text if input_type == 'dat' else text.replace('.', ',')
+
+    elev = rng.uniform(150, 1500)
+    # The elevation of river and precipitation stations comes two lines
+    # after its title, which is split at the ':' in dat files.
+    if input_type == 'dat':
+        elev_row = line('Höhe [m ü.A.]:', number(elev))
+    else:
+        elev_row = line('01.01.1950', '   ' + number(elev))
+    lines = [line('Messstelle:', 'Synthetic %d' % hzb),
+             line('HZB-Nummer:', hzb),
+             line('HD-Nummer:', 'uw%d' % (hzb % 1000)),
+             line('DBMS-Nummer:', 6000000 + hzb % 100000)]
+    if datatype == 'Groundwater':
+        lines += [line('Porengrundwassergebiet:', '380 Grazer Feld'),
+                  line('Grundwasserkörper:',
+                       'Grazer Feld (Graz/Andritz - Wildon) [MUR]')]
+    elif datatype == 'Riverwater':
+        lines += [line('Gewässer:', 'Mur'),
+                  line('Einzugsgebiet:', '   4.360,1')]
+    elif datatype == 'Precipitation':
+        lines += [line('Niederschlagsmessstelle:', 'ja')]
+    elif datatype == 'Spring':
+        # Springs have the river they drain into as well, it's only the
+        # 'Geländehöhe-Hauptquelle' below that makes them a spring.
+        lines += [line('Gewässer:', 'Mur')]
+    lines += [line('Dienststelle:', 'HD-Steiermark'),
+              line('Messstellenbetreiber:', 'Hydrographischer Dienst')]
+    if rng.random() < 0.3:
+        lines.append(line('Bundesland:', 'Steiermark'))
+
+    # One row of coordinates for every location the station ever had.
+    if input_type == 'dat':
+        lines += ['Koordinaten:', 'gültig seit:  Länge:  Breite:']
+    else:
+        lines += ['Geographische Koordinaten (Referenzellipsoid: Bessel '
+                  '1841):',
+                  'gültig seit:;Länge (Grad,Min,Sek):;Breite (Grad,Min,Sek):']
+    for year, coordinate in coordinates:
+        if coordinate is None:
+            lon, lat = '0', '0'
+        else:
+            lon, lat = coordinate
+        if input_type == 'dat':
+            lines.append('01.01.%d  %s  %s' % (year, lon, lat))
+        else:
+            lines.append('01.01.%d             ;%s         ;%s'
+                         % (year, lon, lat))
+    lines.append(line('Exportzeitreihe:', 'Synthetisch'))
+
+    if datatype == 'Groundwater':
+        lines += [line('Messpunkthöhe:', number(elev)),
+                  line('Sohllage:', number(elev - rng.uniform(5, 40)))]
+    elif datatype == 'Riverwater':
+        lines += ['Pegelnullpunkt:', line('gültig seit:', 'Höhe [m ü.A.]:'),
+                  elev_row]
+    elif datatype == 'Precipitation':
+        lines += ['Höhe:', line('gültig seit:', 'Höhe [m ü.A.]:'), elev_row]
+    elif datatype == 'Spring':
+        lines += [line('Geländehöhe-Hauptquelle:', number(elev))]
+    lines.append('Werte:')
+    return lines
+
+
+def _coordinates(moves, missing_coords, rng):
+    """
+    Returns the rows of coordinates (year, (lon, lat)) of a station, the
+    last one being the current location.
+    """
+    lon = np.array([15, rng.integers(0, 60), rng.integers(0, 60)])
+    lat = np.array([47, rng.integers(0, 60), rng.integers(0, 60)])
+    rows = []
+    for move in range(moves + 1):
+        if move > 0:
+            # Move it by up to a minute (~1.8 km).
+            lon[2] = (lon[2] + rng.integers(1, 60)) % 60
+            lat[1] = (lat[1] + rng.integers(0, 2)) % 60
+        rows.append((1950 + 10 * move,
+                     ('%02d %02d %02d' % tuple(lon),
+                      '%02d %02d %02d' % tuple(lat))))
+    if missing_coords:
+        rows[-1] = (rows[-1][0], None)
+    return rows
+
+
+def _values(datatype, n, rng):
+    """
+    Returns n values that look a bit like the datatype, with a seasonal
+    cycle and some noise.
+    """
+    season = np.sin(np.linspace(0, 2 * np.pi * n / 365.25, n))
+    if datatype == 'Precipitation':
+        values = rng.gamma(0.6, 6, n) * (rng.random(n) < 0.45)
+        return np.round(values, 1)
+    if datatype == 'Riverwater':
+        return np.round(150 + 40 * season + rng.gamma(2, 10, n), 0)
+    if datatype == 'Spring':
+        return np.round(np.abs(20 + 8 * season + rng.normal(0, 2, n)), 3)
+    walk = np.cumsum(rng.normal(0, 0.05, n))
+    return np.round(350 + walk + 0.5 * season, 2)
+
+
+def make_station(filename, datatype='Groundwater', freq=None,
+                 start='1940-01-01', length=None, input_type='csv', moves=0,
+                 missing_coords=False, gap_share=0.02, duplicates=0,
+                 month_gaps=1, per_day=1, hzb=None, seed=None):
+    """
+    Writes a synthetic ehyd file of a single station.
+
+    Returns the HZB number of the station.
+
+    Parameters
+    ----------
+    filename : str
+        the file to write
+    datatype : str
+        'Groundwater', 'Riverwater', 'Precipitation' or 'Spring'
+    freq : str
+        'D' for daily or 'MS' for monthly values. Defaults to monthly for
+        groundwater and daily for everything else.
+    start : str
+        the first date
+    length : int
+        the number of days or months. Defaults to everything from start to
+        the end of 2019.
+    input_type : str
+        'csv' for the csv layout or 'dat' for the dat layout
+    moves : int
+        how often the station got moved, i.e. the number of extra rows of
+        coordinates (up to 3)
+    missing_coords : bool
+        write 0 as the current coordinates, like some stations have. Only
+        for csv files, the dat layout has no way to leave them out.
+    gap_share : float
+        the share of values written as 'Lücke'
+    duplicates : int
+        the number of days written twice
+    month_gaps : int
+        the number of months left out completely, dates and all, starting
+        in April 1945 (or a third into the series, if it doesn't cover 1945).
+        At most a quarter of the months get left out, so short series get
+        shorter gaps or none at all.
+    per_day : int
+        the number of values per day, more than one gives the irregular
+        measurements of dat files
+    hzb : int
+        the HZB number, random if None
+    seed : int
+        seed of the random numbers, to get the same file again
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    if hzb is None:
+        hzb = int(rng.integers(100000, 400000))
+    if freq is None:
+        freq = _DEFAULT_FREQ[datatype]
+    if length is None:
+        dates = pd.date_range(start, '2019-12-31', freq=freq)
+    else:
+        dates = pd.date_range(start, periods=length, freq=freq)
+    if len(dates) < 2:
+        raise ValueError('A station needs at least two dates, not %d. Use a '
+                         'larger length or an earlier start.' % len(dates))
+
+    months = dates.to_period('M')
+    month_gaps = min(month_gaps, ((months[-1] - months[0]).n + 1) // 4)
+    if month_gaps:
+        first_gap = pd.Period('1945-04', 'M')
+        if not months[0] <= first_gap <= months[-1]:
+            first_gap = months[len(months) // 3]
+        missing = (months >= first_gap) & (months < first_gap + month_gaps)
+        dates = dates[~missing]
+    if per_day > 1:
+        hours = np.arange(per_day) * (24 // per_day)
+        dates = pd.DatetimeIndex(
+            (dates.values[:, None]
+             + hours[None, :].astype('timedelta64[h]')).ravel())
+    if duplicates:
+        doubled = rng.choice(len(dates), size=min(duplicates, len(dates)),
+                             replace=False)
+        dates = dates.append(dates[doubled]).sort_values()
+
+    values = _values(datatype, len(dates), rng)
+    if input_type == 'dat':
+        texts = np.char.mod('%g', values)
+    else:
+        texts = np.char.replace(np.char.mod('%g', values), '.', ',')
+    texts = np.where(rng.random(len(dates)) < gap_share, 'Lücke', texts)
+    # strftime is slow, so rearrange the iso dates ('1950-01-31T00:00:00').
+    date_texts = [iso[8:10] + '.' + iso[5:7] + '.' + iso[:4] + ' ' + iso[11:]
+                  for iso in np.datetime_as_string(
+                      dates.values.astype('datetime64[s]')).tolist()]
+    if input_type == 'dat':
+        data_lines = [date + '    ' + text
+                      for date, text in zip(date_texts, texts)]
+    else:
+        data_lines = [date + ';   ' + text + '   ;'
+                      for date, text in zip(date_texts, texts)]
+
+    coordinates = _coordinates(min(moves, 3),
+                               missing_coords and input_type != 'dat', rng)
+    lines = _header_lines(datatype, hzb, coordinates, input_type, rng)
+    with open(filename, 'w', encoding='cp1252') as f1:
+        f1.write('\n'.join(lines + data_lines) + '\n')
+    return hzb
+
+
+def make_directory(directory, n_files=100, input_type='csv', length=None,
+                   seed=0):
+    """
+    Writes n_files synthetic files of different stations into directory.
+
+    The datatypes take turns, and some of the stations get moved, miss
+    coordinates or have duplicated days (csv) or several values per day
+    (dat). Returns the list of files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    extension = '.dat' if input_type == 'dat' else '.csv'
+    files = []
+    # ehyd_reader only removes duplicated days if the length of the series
+    # doesn't fit its dates. A single missing month and a duplicated month
+    # cancel out, so leave out a few months, like in 1945.
+    month_gaps = 3
+    for number in range(n_files):
+        datatype = DATATYPES[number % len(DATATYPES)]
+        filename = os.path.join(directory, 'station_%04d%s'
+                                % (number, extension))
+        moves = int(rng.choice([0, 0, 0, 1, 2]))
+        missing_coords = bool(rng.random() < 0.05)
+        if input_type == 'dat':
+            # Duplicates only get removed from csv files, dat files get
+            # resampled to daily values instead.
+            duplicates = 0
+            per_day = 1 if datatype == 'Groundwater' else int(
+                rng.choice([1, 1, 1, 4]))
+        else:
+            duplicates = int(rng.random() < 0.1)
+            per_day = 1
+        make_station(filename, datatype, length=length,
+                     input_type=input_type, moves=moves,
+                     missing_coords=missing_coords, duplicates=duplicates,
+                     month_gaps=month_gaps, per_day=per_day,
+                     hzb=100000 + number, seed=seed * 100000 + number)
+        files.append(filename)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('directory', help='where to write the files')
+    parser.add_argument('-n', type=int, default=100, help='number of files')
+    parser.add_argument('--dat', action='store_true',
+                        help='write .dat files instead of csv files')
+    parser.add_argument('--length', type=int,
+                        help='number of days or months per file')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.length is not None and args.length < 2:
+        parser.error('--length has to be at least 2')
+    files = make_directory(args.directory, args.n,
+                           'dat' if args.dat else 'csv', args.length,
+                           args.seed)
+    print('Wrote', len(files), 'files to', args.directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+#coding=UTF-8
+"""
+Fast selection of ehyd stations by their metadata.
+
+Put this file next to ehyd_reader.py to use it. Selecting stations with
+xs() on the 20 level column header of a wide dataframe goes through the whole
+header and copies the data for every query. A StationCollection keeps the
+metadata as a table with indexes instead, and the time series in a
+CompactStations, so a query only looks at the stations it finds and the
+series only get touched once they're needed.
+"""
+import numpy as np
+
+from ehyd_reader import EHYD_LEVELS, CompactStation, CompactStations
+
+# Columns with (nearly) unique values, looked up in a dict.
+_HASH_COLUMNS = ['HZB', 'HD_num', 'DBMS_num']
+# Columns with numbers, selected by a range of values.
+_RANGE_COLUMNS = ['lat', 'lon', 'station_move', 'elev', 'depth', 'teufe',
+                  'catchment_size']
+
+
+def _hash_key(column, value):
+    """
+    Turns a value into the key of the hash index of column: HZB numbers are
+    ints, HD and DBMS numbers are text (e.g. 'uw1979' and '6000979').
+    """
+    if column == 'HZB':
+        return int(value)
+    return str(value).strip()
+
+
+def _as_list(value):
+    """
+    Returns value as a list, if it isn't one (or a tuple or set) already.
+    """
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+        return list(value)
+    return [value]
+
+
+class StationCollection:
+    """
+    Many stations with indexes on their metadata, for fast queries.
+
+    The metadata is a dataframe with a row per station, with the types of
+    CompactStations (HZB as integer, numbers as floats and categories for
+    the datatype, province, ...). On top of it, there are
+      * hash indexes on HZB, HD_num and DBMS_num,
+      * an index for every categorical column (datatype, catchment_symbol,
+        region_name, province, operator, data_error and meta_error), with
+        the stations of every category,
+      * sorted indexes on the numbers (lat, lon, elev, depth, ...), for
+        ranges of values.
+    A query starts with the condition that matches the fewest stations and
+    only checks those against the other conditions, so it doesn't get
+    slower with more stations loaded. It returns a StationSelection, which
+    only holds the positions of the stations. The time series stay in the
+    arrays of the collection until they're used.
+
+    Parameters
+    ----------
+    stations : CompactStations, DataFrame or list
+        the stations: from ehyd_read_many (as 'compact' or 'df'), or a list
+        of CompactStation or of dataframes from ehyd_reader
+
+    Examples
+    --------
+    stations, errors = ehyd_read_many('downloads/*.csv', output_type='compact')
+    collection = StationCollection(stations)
+    collection[314922].to_series()
+    wells = collection.select(datatype='Groundwater', catchment_symbol='MUR',
+                              data_error='no_error', elev=(400, None))
+    wells.metadata
+    wells.to_dataframe()
+    """
+
+    def __init__(self, stations):
+        import pandas as pd
+
+        if isinstance(stations, pd.DataFrame):
+            stations = CompactStations.from_dataframe(stations)
+        elif not isinstance(stations, CompactStations):
+            stations = [CompactStation.from_dataframe(station)
+                        if isinstance(station, pd.DataFrame) else station
+                        for station in stations]
+            stations = CompactStations.from_stations(stations)
+        self.stations = stations
+        metadata = stations.metadata.reset_index(drop=True)
+        self.metadata = metadata
+
+        self._hash = {}
+        self._keys = {}
+        for column in _HASH_COLUMNS:
+            keys = np.array([None if pd.isna(value)
+                             else _hash_key(column, value)
+                             for value in metadata[column]], dtype=object)
+            positions = {}
+            for position, key in enumerate(keys):
+                if key is not None:
+                    positions.setdefault(key, []).append(position)
+            self._hash[column] = {key: np.array(found, dtype=np.int64)
+                                  for key, found in positions.items()}
+            self._keys[column] = keys
+
+        self._categories = {}
+        self._codes = {}
+        for column in metadata.columns:
+            if not isinstance(metadata[column].dtype, pd.CategoricalDtype):
+                continue
+            codes = metadata[column].cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order],
+                                     np.arange(-1, len(
+                                         metadata[column].cat.categories)),
+                                     side='left')
+            bounds = np.append(bounds, len(codes))
+            # The stations of each category (None for the missing ones),
+            # sorted by position.
+            self._categories[column] = {
+                category: order[bounds[code + 1]:bounds[code + 2]]
+                for code, category in enumerate(
+                    [None] + list(metadata[column].cat.categories), -1)}
+            self._codes[column] = codes
+
+        self._sorted = {}
+        for column in _RANGE_COLUMNS:
+            values = metadata[column].to_numpy(dtype=float)
+            # NaN end up at the end, where no range reaches them.
+            order = np.argsort(values, kind='stable')
+            self._sorted[column] = (values, order, values[order])
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def __repr__(self):
+        return '<StationCollection: %d stations>' % len(self)
+
+    def __getitem__(self, HZB):
+        """
+        Returns the station with this HZB number, as a CompactStation whose
+        arrays are views into the arrays of the collection.
+        """
+        positions = self._hash['HZB'].get(_hash_key('HZB', HZB))
+        if positions is None:
+            raise KeyError(HZB)
+        return self.stations[int(positions[0])]
+
+    @property
+    def columns(self):
+        """
+        The columns that can be used in select.
+        """
+        return (_HASH_COLUMNS + list(self._categories)
+                + list(self._sorted))
+
+    def _candidates(self, column, value):
+        """
+        Returns the positions of the stations matching a single condition,
+        sorted.
+        """
+        if column in self._hash:
+            found = [self._hash[column].get(_hash_key(column, key))
+                     for key in _as_list(value)]
+            found = [positions for positions in found if positions is not None]
+            return np.unique(np.concatenate(found + [np.empty(0, np.int64)]))
+        if column in self._categories:
+            found = [self._categories[column].get(category,
+                                                  np.empty(0, np.int64))
+                     for category in _as_list(value)]
+            if len(found) == 1:
+                return found[0]
+            return np.unique(np.concatenate(found))
+        low, high = self._range(value)
+        values, order, sorted_values = self._sorted[column]
+        start = np.searchsorted(sorted_values, low, side='left')
+        end = np.searchsorted(sorted_values, high, side='right')
+        return np.sort(order[start:end])
+
+    def _size(self, column, value):
+        """
+        Returns how many stations match a single condition, without finding
+        them.
+        """
+        if column in self._hash:
+            return sum(len(self._hash[column].get(_hash_key(column, key),
+                                                  ()))
+                       for key in _as_list(value))
+        if column in self._categories:
+            return sum(len(self._categories[column].get(category, ()))
+                       for category in _as_list(value))
+        low, high = self._range(value)
+        sorted_values = self._sorted[column][2]
+        return int(np.searchsorted(sorted_values, high, side='right')
+                   - np.searchsorted(sorted_values, low, side='left'))
+
+    @staticmethod
+    def _range(value):
+        """
+        Returns the lowest and highest value of a range (low, high), where
+        None is open ended. A single number is a range of its own.
+        """
+        if isinstance(value, (list, tuple)):
+            low, high = value
+        else:
+            low, high = value, value
+        return (-np.inf if low is None else low,
+                np.inf if high is None else high)
+
+    def _matches(self, positions, column, value):
+        """
+        Returns which of the stations at positions match a single condition.
+        """
+        if column in self._hash:
+            wanted = {_hash_key(column, key) for key in _as_list(value)}
+            return np.array([key in wanted
+                             for key in self._keys[column][positions]],
+                            dtype=bool)
+        if column in self._categories:
+            categories = self.metadata[column].cat.categories
+            wanted = [-1 if category is None else categories.get_loc(category)
+                      for category in _as_list(value)
+                      if category is None or category in categories]
+            return np.isin(self._codes[column][positions], wanted)
+        low, high = self._range(value)
+        values = self._sorted[column][0][positions]
+        return (values >= low) & (values <= high)
+
+    def _filter(self, positions, conditions):
+        """
+        Returns the positions matching all conditions, starting from the
+        given positions (or all stations if None).
+        """
+        unknown = set(conditions) - set(self.columns)
+        if unknown:
+            raise ValueError('Can not select by %s, only by %s.'
+                             % (', '.join(sorted(unknown)),
+                                ', '.join(self.columns)))
+        conditions = list(conditions.items())
+        if positions is None:
+            if not conditions:
+                return np.arange(len(self))
+            # Start with the condition that matches the fewest stations.
+            conditions.sort(key=lambda condition: self._size(*condition))
+            positions = self._candidates(*conditions.pop(0))
+        for column, value in conditions:
+            if len(positions) == 0:
+                break
+            positions = positions[self._matches(positions, column, value)]
+        return positions
+
+    def select(self, **conditions):
+        """
+        Returns the stations matching all conditions, as a StationSelection.
+
+        A condition can be a single value or a list of values (any of them)
+        for HZB, HD_num, DBMS_num and the categorical columns (None for
+        stations where it's missing), and a range (low, high) for the
+        numbers, including both ends, with None for open ended.
+
+        Examples
+        --------
+        collection.select(datatype='Groundwater', province='Steiermark')
+        collection.select(HZB=[314922, 315010])
+        collection.select(datatype=['Riverwater', 'Precipitation'],
+                          elev=(None, 300))
+        collection.select(data_error=['no_error', '14+dayGap'],
+                          lat=(47, 48), lon=(15, 16))
+        """
+        return StationSelection(self, self._filter(None, conditions))
+
+
+class StationSelection:
+    """
+    The result of a query on a StationCollection.
+
+    Only holds the positions of the stations in the collection. Their
+    metadata and time series get looked up when they're used, the series as
+    views into the arrays of the collection as long as possible.
+
+    Selections can be narrowed down with select, and combined with & (in
+    both) and | (in either).
+    """
+
+    def __init__(self, collection, positions):
+        self.collection = collection
+        self.positions = np.asarray(positions, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return '<StationSelection: %d of %d stations>' % (
+            len(self), len(self.collection))
+
+    def __getitem__(self, number):
+        """
+        Returns the number-th station of the selection, as a CompactStation
+        whose arrays are views into the arrays of the collection.
+        """
+        return self.collection.stations[int(self.positions[number])]
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+    def __and__(self, other):
+        return StationSelection(self.collection, np.intersect1d(
+            self.positions, other.positions, assume_unique=True))
+
+    def __or__(self, other):
+        return StationSelection(self.collection, np.union1d(
+            self.positions, other.positions))
+
+    @property
+    def metadata(self):
+        """
+        The metadata of the selected stations, as a dataframe.
+        """
+        return self.collection.metadata.iloc[self.positions]
+
+    @property
+    def HZB(self):
+        """
+        The HZB numbers of the selected stations.
+        """
+        return self.collection.metadata['HZB'].to_numpy()[self.positions]
+
+    def select(self, **conditions):
+        """
+        Returns the stations of this selection that also match conditions,
+        see StationCollection.select.
+        """
+        return StationSelection(self.collection, self.collection._filter(
+            self.positions, conditions))
+
+    def to_compact(self):
+        """
+        Returns the selected stations as CompactStations, with copies of
+        their series.
+        """
+        stations = self.collection.stations
+        ranges = list(zip(stations.offsets[self.positions].tolist(),
+                          stations.offsets[self.positions + 1].tolist()))
+        # The series of each station are one slice of days and levels, so
+        # they get copied slice by slice, keeping the packed levels as they
+        # are. The empty slice keeps the dtype for an empty selection.
+        days = np.concatenate([stations.days[start:stop]
+                               for start, stop in ranges]
+                              + [stations.days[:0]])
+        levels = np.concatenate([stations.levels[start:stop]
+                                 for start, stop in ranges]
+                                + [stations.levels[:0]])
+        lengths = [stop - start for start, stop in ranges]
+        return CompactStations(
+            self.metadata.reset_index(drop=True), days, levels,
+            np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+            stations.scale,
+            [stations.header[position] for position in self.positions])
+
+    def to_dataframe(self):
+        """
+        Returns the selected stations as a single dataframe, with the column
+        header of ehyd_reader, like the output of ehyd_read_many.
+        """
+        import pandas as pd
+
+        if len(self) == 0:
+            return pd.DataFrame(columns=pd.MultiIndex.from_tuples(
+                [], names=EHYD_LEVELS))
+        return pd.concat([station.to_dataframe() for station in self],
+                         axis=1).sort_index()
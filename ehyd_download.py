@@ -0,0 +1,273 @@
+#coding=UTF-8
+"""
+Downloads many stations from ehyd.gv.at and reads them straight away.
+
+Put this file next to ehyd_reader.py to use it. Only needs the standard
+library (and what ehyd_reader needs for reading).
+
+ehyd has no api, but every file on the page of a station has a fixed url,
+made of the kind of station, its HZB number and the number of the file:
+
+    https://ehyd.gv.at/eHYD/MessstellenExtraData/gw?id=314922&file=2
+
+ehyd_download gets the files of many stations at once:
+  * a few threads download at the same time (not too many, it's a public
+    website), each keeping its connection open for the next station,
+  * failed downloads (connection errors, 429 and 5xx answers) get retried a
+    few times, waiting a bit longer every time,
+  * the ETag and Last-Modified of every file can be kept, so the next run
+    only downloads what changed since,
+  * the files get read by ehyd_reader right from memory, they only get
+    written to disk if save_dir is given.
+"""
+import http.client
+import io
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+from ehyd_reader import ehyd_reader
+
+EHYD_URL = ('https://ehyd.gv.at/eHYD/MessstellenExtraData/{kind}?id={HZB}'
+            '&file={file}')
+# The kind of station in the url, for the datatypes of ehyd_reader.
+EHYD_KINDS = {'Groundwater': 'gw', 'Riverwater': 'owf',
+              'Precipitation': 'nlv', 'Spring': 'qu'}
+# Answers that are worth another try.
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class _Connections(threading.local):
+    """
+    The open connections of a single thread, one per host. Every thread of
+    the pool gets its own, since a connection can only be used by one
+    request at a time. All connections of all threads are kept in
+    everything as well, so close_all can close them once the threads are
+    done.
+    """
+    def __init__(self, everything):
+        self.open = {}
+        self.everything = everything
+
+    def get(self, scheme, netloc, timeout):
+        key = (scheme, netloc)
+        if key not in self.open:
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(netloc,
+                                                         timeout=timeout)
+            else:
+                connection = http.client.HTTPConnection(netloc,
+                                                        timeout=timeout)
+            self.open[key] = connection
+            self.everything.append(connection)
+        return self.open[key]
+
+    def drop(self, scheme, netloc):
+        connection = self.open.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def close_all(self):
+        for connection in self.everything:
+            connection.close()
+
+
+def _request(connections, url, headers, timeout):
+    """
+    Sends a single GET request over the open connection to the host (or a
+    new one). Returns the status, the headers and the body of the answer.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    connection = connections.get(parts.scheme, parts.netloc, timeout)
+    try:
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+    except (OSError, http.client.HTTPException):
+        # The server may have closed the connection in the meantime, start
+        # over with a new one on the next try.
+        connections.drop(parts.scheme, parts.netloc)
+        raise
+    if response.will_close:
+        connections.drop(parts.scheme, parts.netloc)
+    return response.status, response.headers, body
+
+
+def _fetch(connections, url, known, retries, backoff, timeout):
+    """
+    Downloads url, retrying on errors. known holds the ETag and
+    Last-Modified of the last download, if any. Returns the status, the
+    headers and the body of the answer.
+    """
+    headers = {'Accept-Encoding': 'identity'}
+    if known.get('etag'):
+        headers['If-None-Match'] = known['etag']
+    if known.get('last_modified'):
+        headers['If-Modified-Since'] = known['last_modified']
+    for attempt in range(retries + 1):
+        # Some randomness, so the threads don't all come back at once.
+        wait = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        try:
+            status, answer_headers, body = _request(connections, url,
+                                                    headers, timeout)
+        except (OSError, http.client.HTTPException):
+            if attempt == retries:
+                raise
+        else:
+            if status not in _RETRY_STATUS or attempt == retries:
+                return status, answer_headers, body
+            # The server asked to wait at least this long, so that doesn't
+            # get shortened by the randomness.
+            retry_after = answer_headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                wait = max(wait, int(retry_after))
+        time.sleep(wait)
+
+
+def _download_one(connections, HZB, kind, files, url, output_type, known,
+                  retries, backoff, timeout, save_dir, reader_args):
+    """
+    Downloads and reads a single station, trying the file numbers in files
+    until one isn't empty. Returns the output (None if it didn't change
+    since the last download) and the new entry of the state.
+    """
+    if known.get('file') in files:
+        # Start with the file that worked last time.
+        files = [known['file']] + [file for file in files
+                                   if file != known['file']]
+    for file in files:
+        station_url = url.format(kind=kind, HZB=HZB, file=file)
+        station_known = known if known.get('file') == file else {}
+        status, headers, body = _fetch(connections, station_url,
+                                       station_known, retries, backoff,
+                                       timeout)
+        if status == 304:
+            return None, known
+        if status != 200:
+            raise ValueError('%s answered with %d %s'
+                             % (station_url, status,
+                                http.client.responses.get(status, '')))
+        if body.strip():
+            break
+    else:
+        raise ValueError('Station %s has no data in the files %s'
+                         % (HZB, ', '.join(str(file) for file in files)))
+
+    entry = {'etag': headers.get('ETag'),
+             'last_modified': headers.get('Last-Modified'),
+             'file': file}
+    if save_dir is not None:
+        filename = os.path.join(save_dir, '%s.csv' % HZB)
+        with open(filename, 'wb') as f1:
+            f1.write(body)
+    if output_type == 'raw':
+        return body, entry
+    source = io.BytesIO(body)
+    # ehyd_reader names the source in its warnings and errors.
+    source.name = station_url
+    return ehyd_reader(source, output_type, **reader_args), entry
+
+
+def ehyd_download(HZB, datatype='Groundwater', files=None,
+                  output_type='df', workers=4, retries=3, backoff=1.0,
+                  timeout=60, state=None, state_file=None, save_dir=None,
+                  url=EHYD_URL, **reader_args):
+    """
+    Downloads the files of many stations from ehyd and reads them.
+
+    Returns a dict with the output of ehyd_reader for every station (by HZB
+    number), and a dict with the stations that couldn't be downloaded or
+    read, and what went wrong. Stations that didn't change since the last
+    download (see state) are None in the outputs.
+
+    Parameters
+    ----------
+    HZB : list
+        the HZB numbers of the stations
+    datatype : str
+        'Groundwater', 'Riverwater', 'Precipitation' or 'Spring', gives the
+        kind of station in the url (see EHYD_KINDS)
+    files : list
+        the numbers of the file on the page of the station (e.g. 2 for the
+        monthly groundwater levels), tried one after the other until one
+        isn't empty
+    output_type : str
+        'df', 'dict' or 'compact' (see ehyd_reader), or 'raw' for the
+        downloaded bytes
+    workers : int
+        number of downloads at the same time
+    retries : int
+        how often a failed download gets tried again
+    backoff : float
+        seconds to wait before the first retry, doubled for every retry. A
+        Retry-After of the server gets waited out as well.
+    timeout : float
+        seconds to wait for the server
+    state : dict
+        the ETag and Last-Modified of every station from the last run, gets
+        updated in place. Stations that didn't change since are not
+        downloaded again.
+    state_file : str
+        json file to keep the state in between runs, instead of state
+    save_dir : str
+        folder to keep the downloaded files in, as <HZB>.csv
+    url : str
+        the url of a file, with {kind}, {HZB} and {file} to be filled in
+    **reader_args
+        passed on to ehyd_reader, e.g. interpolate='True'
+
+    Examples
+    --------
+    stations, errors = ehyd_download([314922, 319913], 'Groundwater',
+                                     files=[2], workers=4)
+    # Keep track of what's already there, and only get what changed:
+    stations, errors = ehyd_download([314922, 319913], files=[2],
+                                     state_file='ehyd_state.json',
+                                     save_dir='downloads')
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    kind = EHYD_KINDS.get(datatype, datatype)
+    if files is None:
+        files = [2]
+    if state_file is not None and os.path.exists(state_file):
+        with open(state_file, encoding='utf-8') as f1:
+            state = json.load(f1)
+    elif state is None:
+        state = {}
+    if save_dir is not None:
+        os.makedirs(save_dir, exist_ok=True)
+
+    connections = _Connections([])
+
+    def download(station):
+        known = state.get(str(station), {})
+        return _download_one(connections, station, kind, list(files), url,
+                             output_type, known, retries, backoff, timeout,
+                             save_dir, reader_args)
+
+    results = {}
+    errors = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(station, executor.submit(download, station))
+                       for station in HZB]
+            for station, future in futures:
+                try:
+                    results[station], state[str(station)] = future.result()
+                except Exception as error:
+                    errors[station] = '%s: %s' % (type(error).__name__,
+                                                  error)
+    finally:
+        # The threads are done, don't leave their connections open until
+        # the garbage collector comes around.
+        connections.close_all()
+
+    if state_file is not None:
+        with open(state_file, 'w', encoding='utf-8') as f1:
+            json.dump(state, f1, indent=1)
+    return results, errors
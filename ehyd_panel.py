@@ -0,0 +1,343 @@
+#coding=UTF-8
+"""
+Panels of many ehyd stations on a common frequency.
+
+Put this file next to ehyd_reader.py to use it. A panel is a dataframe with
+one row per day, month or year and one column per station, backed by a
+single 2-D NumPy array, so stations with different frequencies (e.g. daily
+river stages and monthly groundwater levels) can be compared directly and
+gaps can be filled for all stations at once. ehyd_trends tests panels for
+trends.
+"""
+import numpy as np
+
+from ehyd_reader import EHYD_LEVELS, CompactStations, _unpack_levels
+
+# How the values of each datatype get aggregated, if not given otherwise.
+# Everything else gets averaged.
+PANEL_AGGREGATION = {'Precipitation': 'sum'}
+
+# The units of NumPy dates that belong to each frequency.
+_PANEL_UNITS = {'D': 'D', 'MS': 'M', 'YS': 'Y'}
+
+
+def _panel_input(stations):
+    """
+    Brings the stations into the same shape, no matter where they come
+    from: the dates (as days since 1970) and the values of all stations one
+    after another, offsets telling where each station starts, and the column
+    header of the panel.
+    """
+    import pandas as pd
+
+    if isinstance(stations, CompactStations):
+        days = stations.days
+        values = np.asarray(_unpack_levels(stations.levels, stations.scale),
+                            dtype=float)
+        offsets = stations.offsets
+        # The header of ehyd_reader, not the typed metadata, so the columns
+        # are the same as for the stations as dataframes.
+        columns = pd.MultiIndex.from_tuples(stations.header,
+                                            names=EHYD_LEVELS)
+    elif isinstance(stations, pd.DataFrame):
+        # A wide dataframe, e.g. from ehyd_read_many. All stations share the
+        # dates, so go through it one station after another.
+        station_days = stations.index.values.astype('datetime64[D]').astype(
+            np.int64)
+        days = np.tile(station_days, stations.shape[1])
+        values = stations.to_numpy(dtype=float).T.ravel()
+        offsets = np.arange(stations.shape[1] + 1) * len(stations)
+        columns = stations.columns
+    else:
+        # A list of dataframes, e.g. from ehyd_reader.
+        stations = list(stations)
+        days = np.concatenate(
+            [station_df.index.values.astype('datetime64[D]').astype(np.int64)
+             for station_df in stations] + [np.empty(0, dtype=np.int64)])
+        values = np.concatenate(
+            [station_df.iloc[:, 0].to_numpy(dtype=float)
+             for station_df in stations] + [np.empty(0)])
+        offsets = np.concatenate(
+            ([0], np.cumsum([len(station_df) for station_df in stations])))
+        columns = pd.MultiIndex.from_tuples(
+            [station_df.columns[0] for station_df in stations],
+            names=stations[0].columns.names if stations else EHYD_LEVELS)
+    return days, values, offsets, columns
+
+
+def build_panel(stations, freq='MS', how=None, start=None, end=None,
+                min_count=1, block_size=500):
+    """
+    Puts many stations into a single dataframe on a common frequency.
+
+    The values of each station get aggregated to days, months or years,
+    depending on its datatype: by default precipitation gets summed up and
+    everything else averaged (see PANEL_AGGREGATION). All stations are done
+    in one go, without resampling them one by one.
+    Values are not spread out to a finer frequency, e.g. monthly
+    groundwater levels in a daily panel only show up on the first day of
+    each month, all other days are NaN.
+
+    Returns a dataframe with a row for every day, month or year from the
+    first to the last value (or from start to end) and a column for each
+    station, with the column header of the stations. All values are in a
+    single 2-D NumPy array, see DataFrame.to_numpy().
+
+    Parameters
+    ----------
+    stations : CompactStations, DataFrame or list of DataFrame
+        the stations, from ehyd_read_many (as 'df' or 'compact') or a list of
+        dataframes from ehyd_reader
+    freq : str
+        can be 'D' for days, 'MS' for months or 'YS' for years
+    how : dict
+        the aggregation for each datatype, one of 'mean', 'sum', 'min' or
+        'max', e.g. {'Precipitation': 'sum', 'Riverwater': 'max'}.
+        Datatypes that are not in how get averaged.
+    start, end : str or Timestamp
+        the first and last date of the panel
+    min_count : int
+        the number of valid values a day, month or year needs, else it is
+        NaN. E.g. 28 for monthly sums of daily precipitation, to avoid sums
+        over only a few days.
+    block_size : int
+        number of stations aggregated at once, which limits the memory
+        needed on the way
+
+    Examples
+    --------
+    stations, errors = ehyd_read_many('downloads/*.csv', output_type='compact')
+    # Monthly means of all levels and monthly sums of precipitation:
+    panel = build_panel(stations, 'MS', start='1970-01-01', end='2019-12-31')
+    panel.corr()
+    """
+    import pandas as pd
+
+    if freq not in _PANEL_UNITS:
+        raise ValueError("freq can be 'D', 'MS' or 'YS', not %r." % freq)
+    unit = _PANEL_UNITS[freq]
+    how = PANEL_AGGREGATION if how is None else how
+    days, values, offsets, columns = _panel_input(stations)
+    n_stations = len(offsets) - 1
+
+    if 'datatype' in columns.names:
+        datatypes = columns.get_level_values('datatype')
+    else:
+        datatypes = [None] * n_stations
+    methods = np.array([how.get(datatype, 'mean') for datatype in datatypes],
+                       dtype=object)
+    unknown = set(methods) - {'mean', 'sum', 'min', 'max'}
+    if unknown:
+        raise ValueError('Unknown aggregation %s.' % ', '.join(unknown))
+
+    # Number the days, months or years, and find the range of the panel.
+    periods = days.astype('datetime64[D]').astype(
+        'datetime64[%s]' % unit).astype(np.int64)
+    valid = ~np.isnan(values)
+    if start is not None:
+        first = np.datetime64(pd.Timestamp(start), unit).astype(np.int64)
+    elif valid.any():
+        first = periods[valid].min()
+    else:
+        first = 0
+    if end is not None:
+        last = np.datetime64(pd.Timestamp(end), unit).astype(np.int64)
+    elif valid.any():
+        last = periods[valid].max()
+    else:
+        last = first - 1
+    n_periods = max(int(last - first + 1), 0)
+
+    panel = np.full((n_periods, n_stations), np.nan)
+    for block_start in range(0, n_stations, block_size):
+        block_end = min(block_start + block_size, n_stations)
+        block = slice(offsets[block_start], offsets[block_end])
+        block_periods = periods[block]
+        block_values = values[block]
+        # The station of each value, counted from the start of the block.
+        stations_in_block = np.repeat(
+            np.arange(block_end - block_start),
+            np.diff(offsets[block_start:block_end + 1]))
+        keep = (valid[block] & (block_periods >= first)
+                & (block_periods <= last))
+        cells = ((block_periods[keep] - first) * (block_end - block_start)
+                 + stations_in_block[keep])
+        kept_values = block_values[keep]
+        shape = (n_periods, block_end - block_start)
+        size = shape[0] * shape[1]
+
+        count = np.bincount(cells, minlength=size).reshape(shape)
+        total = np.bincount(cells, weights=kept_values,
+                            minlength=size).reshape(shape)
+        block_methods = methods[block_start:block_end]
+        result = np.full(shape, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[:, block_methods == 'mean'] = (
+                total / count)[:, block_methods == 'mean']
+        result[:, block_methods == 'sum'] = total[:, block_methods == 'sum']
+        for method, ufunc, fill in [('min', np.minimum, np.inf),
+                                    ('max', np.maximum, -np.inf)]:
+            if (block_methods == method).any():
+                extreme = np.full(size, fill)
+                ufunc.at(extreme, cells, kept_values)
+                extreme = extreme.reshape(shape)
+                result[:, block_methods == method] = extreme[
+                    :, block_methods == method]
+        result[count < max(min_count, 1)] = np.nan
+        panel[:, block_start:block_end] = result
+
+    index = pd.date_range(np.datetime64(int(first), unit), periods=n_periods,
+                          freq=freq, name='date')
+    return pd.DataFrame(panel, index=index, columns=columns, copy=False)
+
+
+def panel_seasons(index):
+    """
+    Returns the season of each date of a panel (counted from 0) and the
+    number of seasons: the day of the year for daily panels, else the month.
+    Used for the climatology of fill_gaps and the seasonal trend tests.
+    """
+    import pandas as pd
+
+    freq = index.freqstr if index.freq is not None else pd.infer_freq(index)
+    if freq == 'D':
+        return index.dayofyear.to_numpy() - 1, 366
+    return index.month.to_numpy() - 1, 12
+
+
+def fill_gaps(panel, method='linear', max_gap=None, block_size=500):
+    """
+    Fills gaps in many stations at once.
+
+    Works on a panel (see build_panel) or any dataframe with a DatetimeIndex
+    and one column per station. Only gaps with values on both sides get
+    filled, NaN at the start or end of a station stay as they are.
+
+    The methods are
+      * 'linear': a straight line between the values on both sides of the
+        gap, as interpolate() in ehyd_reader does,
+      * 'time': the same, but weighted by the time between the dates, which
+        only makes a difference for months or years of different length,
+      * 'climatology': the mean of the station for the same day of the year
+        (daily panels) or month (all others), over all years.
+
+    Returns the filled panel and a dataframe with a row per station and the
+    columns 'filled' (number of values filled in), 'gaps_filled' (number of
+    gaps filled), 'longest_filled' (length of the longest gap filled, in
+    steps of the panel), 'unfilled' (number of NaN left inside the station,
+    since their gap was too long) and 'longest_unfilled'.
+
+    Parameters
+    ----------
+    panel : DataFrame
+        the stations, with dates as index
+    method : str
+        can be 'linear', 'time' or 'climatology'
+    max_gap : int or str
+        the longest gap to fill, everything longer is left alone. A number
+        (14 or 14.0) is the number of missing values, i.e. steps of the
+        panel. A time like '15D' (or a Timedelta) is the time from the last
+        value before the gap to the first value after it, e.g. '15D' fills up
+        to 14 missing days in a daily panel. Plain numbers are never read as
+        a time.
+    block_size : int
+        number of stations filled at once, which limits the memory needed on
+        the way
+
+    Examples
+    --------
+    panel = build_panel(stations, 'D')
+    # Fill up to 14 missing days, like the 14+dayGap of ehyd_reader:
+    filled, report = fill_gaps(panel, 'linear', max_gap=14)
+    # Fill longer gaps of monthly data with the mean of the month:
+    filled, report = fill_gaps(monthly_panel, 'climatology', max_gap=12)
+    """
+    import pandas as pd
+
+    if method not in ('linear', 'time', 'climatology'):
+        raise ValueError("method can be 'linear', 'time' or 'climatology', "
+                         "not %r." % method)
+    values = panel.to_numpy(dtype=float, copy=True)
+    n_rows, n_stations = values.shape
+    dates = panel.index.values.astype('datetime64[s]').astype(np.int64)
+    # A number is a count of missing values, anything else a time span (in
+    # seconds from here on), so 14.0 doesn't turn into 14 nanoseconds.
+    max_span = None
+    if isinstance(max_gap, (bool, np.bool_)):
+        raise ValueError('max_gap has to be a number of missing values or a '
+                         'time like \'15D\', not %r.' % max_gap)
+    if max_gap is not None and not isinstance(max_gap, (int, float,
+                                                        np.number)):
+        max_span = pd.Timedelta(max_gap).total_seconds()
+        max_gap = None
+    if method == 'climatology':
+        season, n_seasons = panel_seasons(panel.index)
+
+    rows = np.arange(n_rows)[:, None]
+    report = {name: np.zeros(n_stations, dtype=np.int64)
+              for name in ['filled', 'gaps_filled', 'longest_filled',
+                           'unfilled', 'longest_unfilled']}
+    for block_start in range(0, n_stations, block_size):
+        block = slice(block_start, min(block_start + block_size, n_stations))
+        block_values = values[:, block]
+        valid = ~np.isnan(block_values)
+        # The rows of the last value before and the next value after each
+        # row, -1 and n_rows if there is none.
+        before = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+        after = np.minimum.accumulate(
+            np.where(valid, rows, n_rows)[::-1], axis=0)[::-1]
+        inside = ~valid & (before >= 0) & (after < n_rows)
+        before = np.clip(before, 0, n_rows - 1)
+        after = np.clip(after, 0, n_rows - 1)
+        gap_length = after - before - 1
+
+        if max_span is not None:
+            fill = inside & (dates[after] - dates[before] <= max_span)
+        elif max_gap is not None:
+            fill = inside & (gap_length <= max_gap)
+        else:
+            fill = inside
+
+        if method == 'climatology':
+            columns = np.broadcast_to(np.arange(block_values.shape[1]),
+                                      block_values.shape)
+            cells = season[:, None] * block_values.shape[1] + columns
+            size = n_seasons * block_values.shape[1]
+            total = np.bincount(cells[valid], weights=block_values[valid],
+                                minlength=size)
+            count = np.bincount(cells[valid], minlength=size)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                climatology = total / count
+            filling = climatology[cells]
+        else:
+            value_before = np.take_along_axis(block_values, before, axis=0)
+            value_after = np.take_along_axis(block_values, after, axis=0)
+            if method == 'time':
+                position = (dates[rows] - dates[before]).astype(float)
+                width = (dates[after] - dates[before]).astype(float)
+            else:
+                position = (rows - before).astype(float)
+                width = (after - before).astype(float)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                filling = value_before + ((value_after - value_before)
+                                          * position / width)
+        # Days or months without a climatology stay NaN.
+        fill &= ~np.isnan(filling)
+        block_values[fill] = filling[fill]
+
+        # What got filled. A gap starts where the row before it was valid.
+        gap_start = inside & (before == rows - 1)
+        unfilled = inside & ~fill
+        report['filled'][block] = fill.sum(axis=0)
+        report['gaps_filled'][block] = (gap_start & fill).sum(axis=0)
+        report['longest_filled'][block] = np.where(fill, gap_length,
+                                                   0).max(axis=0, initial=0)
+        report['unfilled'][block] = unfilled.sum(axis=0)
+        report['longest_unfilled'][block] = np.where(
+            unfilled, gap_length, 0).max(axis=0, initial=0)
+        values[:, block] = block_values
+
+    filled = pd.DataFrame(values, index=panel.index, columns=panel.columns,
+                          copy=False)
+    return filled, pd.DataFrame(report, index=panel.columns)
+
@@ -1,372 +1,757 @@
 #coding=UTF-8
+import io
+import mmap
+import os
+import re
+import sys
+import time
 
+# The dates in ehyd files always come as e.g. '01.01.1970 00:00:00', so there
+# is no need to let pandas guess the format for every file.
+EHYD_DATE_FORMAT = '%d.%m.%Y %H:%M:%S'
 
-def ehyd_reader(filename, output_type, write_csv='False',
-                input_type='csv', interpolate='False'):
+# The levels of the column MultiIndex of the 'df' output, i.e. the metadata
+# of a station, in the order they appear in.
+EHYD_LEVELS = ['datatype', 'station_name', 'HZB', 'HD_num', 'DBMS_num',
+               'catchment_name', 'catchment_symbol', 'subcatchment',
+               'region_name', 'province', 'operator', 'catchment_size', 'lat',
+               'lon', 'station_move', 'elev', 'depth', 'teufe', 'data_error',
+               'meta_error']
+
+# The fast parser turns the padded ehyd data section into a plain table with
+# ';' as separator, which the C engine of pandas can read. Anything else
+# (tabs, padding at the start or the end of a line, ...) makes the C engine or
+# the date parser fail, so that the python engine takes over.
+_CSV_SEPARATOR = re.compile(r' *; *')
+_DAT_SEPARATOR = re.compile(r' {2,10}')
+
+# What ehyd_reader reads as the content of a file instead of its path.
+_BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+# Compressed files get decompressed while reading, by their extension.
+_COMPRESSIONS = {'.gz': 'gzip', '.xz': 'lzma', '.bz2': 'bz2'}
+# A file inside of a zip archive, e.g. 'bundle.zip/314922.csv'.
+_ZIP_MEMBER = re.compile(r'(.*?\.zip)[/\\](.+)$', re.IGNORECASE)
+
+
+def _source_name(source):
     """
-    Reads in a CSV file containing a hydrologic time series (filename).
-    
-    Meant to be used with files obtained from ehyd.gv.at, taking into
-    account the intricacies of this data (ISO 8859-15 file, use of
-    german Umlauts, using the term "Lücke" for NaN, decimal comma).
-    
-    Can also read in .dat files, which get used internally in the
-    governement agencies. Those follow the same format as the csv files
-    but use a decimal dot and variable spaces as delimiter. Note that 
-    these files can have very irregular measurements, so handling these
-    is still experimental!
-    
-    Use 'dict' or 'df' to specify wether you want a dict or dataframe as
-    output.
-    
-    If you want a "proper" CSV file in your working directory, use
-    "write_csv=True".
-    
-    Set interpolate to 'True' if you want to interpolate over missing
-    data. For small gaps, this should be OK, but if 'data_error'
-    indicates a lot of missing data, this is probably going to cause
-    issues when further handling the data.
+    Returns a name for what ehyd_reader reads: the path of a file, the name
+    of a file-like object (e.g. the url it came from) or '<bytes>'.
+    """
+    if isinstance(source, _BUFFER_TYPES):
+        return '<bytes>'
+    if hasattr(source, 'read'):
+        return str(getattr(source, 'name', '<file>'))
+    return str(source)
+
+
+def _split_member(path):
+    """
+    Splits the path of a file in a zip archive ('bundle.zip/314922.csv')
+    into the archive and the name of the file in it. Returns the path and
+    None for anything else.
+    """
+    path = os.fspath(path)
+    match = _ZIP_MEMBER.match(path)
+    if match is None or os.path.exists(path):
+        return path, None
+    return match.group(1), match.group(2).replace('\\', '/')
+
+
+def _open_binary(path):
+    """
+    Opens a file for reading bytes. Files in a zip archive (see
+    _split_member) and gzip, xz and bz2 files get decompressed on the fly.
+    """
+    archive, member = _split_member(path)
+    if member is not None:
+        import zipfile
+
+        # The member keeps the archive open until it gets closed itself.
+        return zipfile.ZipFile(archive).open(member)
+    compression = _COMPRESSIONS.get(os.path.splitext(archive)[1].lower())
+    if compression is not None:
+        import importlib
+
+        return importlib.import_module(compression).open(archive, 'rb')
+    return open(archive, 'rb')
+
+
+def _open_text(path):
+    """
+    Opens an ehyd file for reading its text, like _open_binary.
+    """
+    archive, member = _split_member(path)
+    if member is None and os.path.splitext(
+            archive)[1].lower() not in _COMPRESSIONS:
+        return open(archive, 'r', encoding='cp1252')
+    return io.TextIOWrapper(_open_binary(path), encoding='cp1252')
+
+
+def _decode(content):
+    """
+    Decodes the content of an ehyd file (bytes or a memory map of the file)
+    as cp1252, with the same newline handling as opening the file.
+    """
+    text = str(content, 'cp1252')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def _read_text(source):
+    """
+    Returns the text of an ehyd file, given its path (see _open_text), its
+    content as bytes or memory map, or a file-like object (binary or text)
+    to read it from. Compressed files only get decompressed once, the
+    header and the values both get parsed from the text.
+    """
+    if isinstance(source, _BUFFER_TYPES):
+        return _decode(source)
+    if not hasattr(source, 'read'):
+        with _open_text(source) as f1:
+            return f1.read()
+    text = source.read()
+    if isinstance(text, str):
+        return text
+    return _decode(text)
+
+
+def _new_record(filename):
+    """
+    Returns an empty record of reading a file, see ReadStats.
+    """
+    return {'filename': _source_name(filename), 'HZB': None,
+            'data_error': None,
+            'error': None, 'total': 0.0, 'stages': {}, 'counts': {},
+            'warnings': []}
+
+
+def _lap(record, stage, start):
+    """
+    Adds the time since start (from time.perf_counter) to a stage of record
+    and returns the current time, to start the next stage. Does nothing but
+    that if record is None, i.e. if nobody asked for the timings.
+    """
+    now = time.perf_counter()
+    if record is not None:
+        stages = record['stages']
+        stages[stage] = stages.get(stage, 0.0) + now - start
+    return now
+
+
+def _logger():
+    """
+    Returns the logger of ehyd_reader, or None if logging hasn't been
+    imported yet. In that case, nobody can have set up logging to show the
+    messages, and importing logging just to throw them away would slow down
+    importing ehyd_reader and parse_header.
+    """
+    logging = sys.modules.get('logging')
+    if logging is None:
+        return None
+    logger = logging.getLogger('ehyd_reader')
+    if not logger.handlers:
+        # Without any handler, logging would print warnings to stderr. A
+        # library should stay quiet unless asked otherwise, see ehyd_logging.
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def _note(record, code, *message, **details):
+    """
+    Adds a warning about a station to record (see ReadStats), with a short
+    code (e.g. 'station_moved'), the message and the details that go along
+    with it (e.g. the distance), so it can be counted and filtered later.
+    The message also goes to the logger 'ehyd_reader', with the warning as
+    'ehyd_warning' of the log record.
+    """
+    warning = dict(details, code=code,
+                   message=' '.join(str(part).strip() for part in message))
+    if record is not None:
+        record['warnings'].append(warning)
+    logger = _logger()
+    if logger is not None:
+        logger.warning('%s', warning['message'],
+                       extra={'ehyd_warning': warning})
+
+
+def _debug(message, *args):
+    """
+    Sends a message that's only of interest when debugging to the logger
+    'ehyd_reader'.
+    """
+    logger = _logger()
+    if logger is not None:
+        logger.debug(message, *args)
+
+
+def ehyd_logging(level='WARNING', handler=None):
+    """
+    Shows the messages of ehyd_reader, e.g. which stations got moved or have
+    gaps in their data.
+
+    By default, ehyd_reader doesn't print anything. The warnings come with
+    the output instead ('warnings' of the 'dict' output, attrs['warnings']
+    of the 'df' output, see also ReadStats) and go to the logger
+    'ehyd_reader', which can be set up like any other logger. This function
+    is a shortcut that adds a handler (printing to stderr, unless another
+    handler is given) to that logger. Returns the handler, so it can be
+    removed again.
 
     Parameters
     ----------
-    filename : str
-        path to and name of the file to be read
-    output_type : str
-        can be 'df' for a dataframe as output or 'dict" for a dictionary
-    write_csv : bool
-    input_type : str
-        can be 'csv' for a CSV file or 'dat' for a DAT file
-    interpolate : bool
-    
+    level : str or int
+        'WARNING' for the warnings about stations, 'DEBUG' to also see which
+        file is being read, or any other level of logging
+    handler : logging.Handler
+        where the messages should go, e.g. a logging.FileHandler
+
     Examples
     --------
-    # Read in a csv file and output a dataframe:
-    ehyd_df = ehyd_reader('filename.csv', output_type='df')
-    # Read in a dat file and output a dictionary and a csv file:
-    ehyd_dict = ehyd_reader('filename.dat', output_type='dict', 
-                            input_type='dat', write_csv='True')    
-    
+    # Print the warnings while reading, like older versions did:
+    handler = ehyd_logging()
+    ehyd_df = ehyd_reader('filename.csv', 'df')
+    # Remove it again:
+    import logging
+    logging.getLogger('ehyd_reader').removeHandler(handler)
     """
+    import logging
 
-    # Import the needed modules.
-    import pandas as pd
+    logger = logging.getLogger('ehyd_reader')
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(
+            '%(name)s %(levelname)s: %(message)s'))
+    handler.setLevel(level)
+    logger.addHandler(handler)
+    if logger.getEffectiveLevel() > handler.level:
+        logger.setLevel(level)
+    return handler
+
+
+def _parse_ehyd_dates(date_strings):
+    """
+    Turns ehyd date strings ('DD.MM.YYYY HH:MM:SS') into datetime64 values.
+
+    Works directly on the bytes of all strings at once, instead of parsing
+    them one by one. Raises a ValueError if any of the strings doesn't
+    follow the format exactly or isn't a valid date.
+
+    Parameters
+    ----------
+    date_strings : array-like of str
+        the dates, as found in the first column of the data
+    """
+    import numpy as np
+
+    # One byte more than needed, so we can check that nothing got cut off.
+    # Non-ASCII characters raise a UnicodeEncodeError, which is a ValueError.
+    raw = np.asarray(date_strings, dtype='S20')
+    raw = raw.view(np.uint8).reshape(-1, 20)
+    digits = raw.astype(np.int64) - ord('0')
+    digit_cols = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+    layout_ok = (((digits[:, digit_cols] >= 0)
+                  & (digits[:, digit_cols] <= 9)).all()
+                 and (raw[:, [2, 5]] == ord('.')).all()
+                 and (raw[:, 10] == ord(' ')).all()
+                 and (raw[:, [13, 16]] == ord(':')).all()
+                 and (raw[:, 19] == 0).all())
+    if not layout_ok:
+        raise ValueError('Dates not in the ehyd format')
+
+    day = digits[:, 0]*10 + digits[:, 1]
+    month = digits[:, 3]*10 + digits[:, 4]
+    year = (digits[:, 6]*1000 + digits[:, 7]*100 + digits[:, 8]*10
+            + digits[:, 9])
+    hour = digits[:, 11]*10 + digits[:, 12]
+    minute = digits[:, 14]*10 + digits[:, 15]
+    second = digits[:, 17]*10 + digits[:, 18]
+    # Stay well within the range pandas can handle with nanoseconds.
+    if (year.min() < 1678 or year.max() > 2261 or month.min() < 1
+            or month.max() > 12 or day.min() < 1 or hour.max() > 23
+            or minute.max() > 59 or second.max() > 59):
+        raise ValueError('Dates out of range')
+
+    months = ((year - 1970)*12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1)
+    # Days like the 31.04. end up in the next month.
+    if (days.astype('datetime64[M]') != months).any():
+        raise ValueError('Invalid day of the month')
+    dates = days.astype('datetime64[s]') + (hour*3600 + minute*60 + second)
+    return dates
+
+
+# All the keywords the header of an ehyd file gets searched for, in the order
+# they get handled. Some of them can be found anywhere in a line, not only at
+# its start, e.g. 'Grundwasser' in 'Grundwasserkörper', so every line gets
+# searched for all of them at once with a single regular expression.
+# 'Geländehöhe-Hauptquelle' has to come before 'Hauptquelle', since the
+# regular expression only finds the first of two overlapping keywords.
+_HEADER_KEYS = ('Gew\xe4sser', 'Niederschlag', 'Hauptquelle', 'Grundwasser',
+                'Dienststelle', 'Bundesland', 'Messstellenbetreiber',
+                'HZB-Nummer', 'HD-Nummer', 'DBMS-Nummer', 'Einzugsgebiet',
+                'Koordinaten', 'Messpunkthöhe:', 'Sohllage',
+                'Geländehöhe-Hauptquelle', 'Pegelnullpunkt', 'Höhe:',
+                'Werte:')
+_HEADER_KEYWORD = re.compile('|'.join(
+    re.escape(key) for key in sorted(_HEADER_KEYS, key=len, reverse=True)))
+
+
+# A lot of metadata start with ';' and end with a newline.
+# Lets define a little function for that.
+def _csv_splitter(tester):
+    start_str = tester.find(';')+1
+    end_str = tester.find('\n')
+    t_str = tester[start_str:end_str]
+    return t_str
+
+
+def _dat_splitter(tester):
+    start_str = tester.find(':')+1
+    end_str = tester.find('\n')
+    t_str = tester[start_str:end_str].lstrip()
+    return t_str
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calculates the distance in meters between two points on earth.
+
+    The points are given as lat and lon in decimal degrees, as they come out
+    of coord_calculator. Works with numpy arrays as well, following the usual
+    broadcasting rules, so the distances between many points can be
+    calculated at once.
+    Uses the haversine formula, see
+    https://en.wikipedia.org/wiki/Haversine_formula
+    in the same way as the haversine distance of scikit-learn, which gives
+    the exact same results.
+
+    Parameters
+    ----------
+    lat1, lon1 : float or array
+        coordinates of the first point(s)
+    lat2, lon2 : float or array
+        coordinates of the second point(s)
+    """
     import numpy as np
-    import re
-    from sklearn.metrics.pairwise import haversine_distances
-    from math import radians
-    # The last two imports are needed to figure out how much the station moved
-    # over its lifetime. If that's not needed, the whole stuff around the 
-    # variable "station_move" can be removed.
-
-    # A lot of metadata start with ';' and end with a newline.
-    # Lets define a little function for that.
-    def csv_splitter(tester):
-        start_str = tester.find(';')+1
-        end_str = tester.find('\n')
-        t_str = tester[start_str:end_str]
-        return t_str
-
-    def dat_splitter(tester):
-        start_str = tester.find(':')+1
-        end_str = tester.find('\n')
-        t_str = tester[start_str:end_str].lstrip()
-        return t_str
+
+    # Needs to be turned into radians to work with.
+    lat1 = np.radians(lat1)
+    lon1 = np.radians(lon1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lon2)
+    sin_lat = np.sin(0.5 * (lat1 - lat2))
+    sin_lon = np.sin(0.5 * (lon1 - lon2))
+    result = sin_lat * sin_lat + np.cos(lat1) * np.cos(lat2) * sin_lon * sin_lon
+    # Multiply with earth radius in meters to get the distance.
+    return 2 * np.arcsin(np.sqrt(result)) * 6371 * 1000
+
+
+def coord_calculator(raw_coords, input_type='csv'):
+    """
+    Turns a line of coordinates from an ehyd file into decimal degrees.
+
+    The coordinates are given as degrees, minutes and seconds, e.g.
+    '01.01.1966             ;15 26 49         ;47 06 31' in csv files.
+    Returns a tuple of (lat, lon), which is (NaN, NaN) if the coordinates
+    are missing, i.e. set to 0.
+
+    Parameters
+    ----------
+    raw_coords : str
+        the line containing the coordinates
+    input_type : str
+        can be 'csv' for a CSV file or 'dat' for a DAT file
+    """
+    coord_string = str(raw_coords)
     if input_type == 'dat':
-        splitter = dat_splitter
+        coord_list = re.findall(r"\d{2}\s\d{2}\s\d{2}", coord_string)
+        raw_longitude = coord_list[0]
+        raw_latitude = coord_list[1]
+    else:
+        longitude_start = coord_string.find(';')+1
+        longitude_end = coord_string.rfind(';')-1
+        latitude_start = coord_string.rfind(';')+1
+        latitude_end = coord_string.find('\n')
+        raw_longitude = coord_string[longitude_start:longitude_end]
+        raw_latitude = coord_string[latitude_start:latitude_end]
+    # Remove trailing whitespace.
+    stripped_lon = raw_longitude.rstrip()
+    stripped_lat = raw_latitude.rstrip()
+    # There can be cases where lat and lon are missing i.e. meaning they're
+    # set to 0. If that's the case, all the stuff below fails. so we gotta
+    # test for that.
+    if stripped_lat == '0':
+        # Same as numpy.nan, but reading only the header shouldn't need to
+        # import numpy.
+        lat = float('nan')
+        lon = float('nan')
     else:
-        splitter = csv_splitter
+        # Grab the parts and turn them into floats
+        s_deg_lon = stripped_lon[0:2]
+        deg_lon = float(s_deg_lon)
+        s_min_lon = stripped_lon[3:5]
+        min_lon = float(s_min_lon)
+        s_sec_lon = stripped_lon[6:8]
+        sec_lon = float(s_sec_lon)
+        s_deg_lat = stripped_lat[0:2]
+        deg_lat = float(s_deg_lat)
+        s_min_lat = stripped_lat[3:5]
+        min_lat = float(s_min_lat)
+        s_sec_lat = stripped_lat[6:8]
+        sec_lat = float(s_sec_lat)
+        # Put it all together
+        lon = deg_lon + (min_lon / 60) + (sec_lon / 3600)
+        lat = deg_lat + (min_lat / 60) + (sec_lat / 3600)
+        lon = round(lon, 8)
+        lat = round(lat, 8)
+        # Should only result in 6 decimals,
+        # but the division could result in a repeating decimal,
+        # so let's keep that at a sane size.
+    return lat, lon
 
-    # define a long-ish function to read the coordinates,
-    # needed twice, later
-    def coord_calculator(raw_coords):
-        nonlocal meta_error
-        coord_string = str(raw_coords)
-        if input_type == 'dat':
-            coord_list = re.findall(r"\d{2}\s\d{2}\s\d{2}", coord_string)
-            raw_longitude = coord_list[0]
-            raw_latitude = coord_list[1]
-        else:
-            longitude_start = coord_string.find(';')+1
-            longitude_end = coord_string.rfind(';')-1
-            latitude_start = coord_string.rfind(';')+1
-            latitude_end = coord_string.find('\n')
-            raw_longitude = coord_string[longitude_start:longitude_end]
-            raw_latitude = coord_string[latitude_start:latitude_end]
-        # Remove trailing whitespace.
-        stripped_lon = raw_longitude.rstrip()
-        stripped_lat = raw_latitude.rstrip()
-        # There can be cases where lat and lon are missing i.e. meaning they're
-        # set to 0. If that's the case, all the stuff below fails. so we gotta
-        # test for that.
-        if stripped_lat == '0':
-            lat = np.nan
-            lon = np.nan
-            print('Station', HZB, 'is missing coordinates!')
-            meta_error = 'missing_coords'
-        else:
-            # Grab the parts and turn them into floats
-            s_deg_lon = stripped_lon[0:2]
-            deg_lon = float(s_deg_lon)
-            s_min_lon = stripped_lon[3:5]
-            min_lon = float(s_min_lon)
-            s_sec_lon = stripped_lon[6:8]
-            sec_lon = float(s_sec_lon)
-            s_deg_lat = stripped_lat[0:2]
-            deg_lat = float(s_deg_lat)
-            s_min_lat = stripped_lat[3:5]
-            min_lat = float(s_min_lat)
-            s_sec_lat = stripped_lat[6:8]
-            sec_lat = float(s_sec_lat)
-            # Put it all together
-            lon = deg_lon + (min_lon / 60) + (sec_lon / 3600)
-            lat = deg_lat + (min_lat / 60) + (sec_lat / 3600)
-            lon = round(lon, 8)
-            lat = round(lat, 8)
-            # Should only result in 6 decimals,
-            # but the division could result in a repeating decimal,
-            # so let's keep that at a sane size.
-        return lat, lon
 
-    # since filename is kinda generic, change it to current_csv
-    current_csv = filename
+def _scan_header(table, input_type='csv', record=None):
+    """
+    Extracts the metadata from the lines of the header of an ehyd file.
 
-    f1 = open(current_csv, 'r', encoding='cp1252')
-    table = f1.readlines(3000)
-    # Reads in only 3000 characters/bytes. Most ehyd files appear to contain 
-    # around 1500 characters in the metadata, so this has a good margin of 
-    # error. Since readlines is quite fast, this limitation can also be
-    # discarded without much of a penalty( ~100µs vs. 9ms for a 1MB file).
-    f1.close()
+    table has to contain the lines of the header, including their newlines,
+    up to and including the 'Werte:' line. Returns a dict with the metadata,
+    which also contains 'werte_start', the number of the 'Werte:' line.
+    Metadata that can't be found in the header is missing from the dict,
+    unless it's one of those that are known to be missing in some files,
+    which are set to 'NaN'.
+    The warnings about the coordinates get added to record (see ReadStats),
+    if given.
+    """
+    if input_type == 'dat':
+        splitter = _dat_splitter
+    else:
+        splitter = _csv_splitter
 
     # Extract the name of the station:
-    station_name_line = table[0]
-    station_name = splitter(station_name_line)
+    header = {'station_name': splitter(table[0])}
 
     # Set metadata that might not be in every file to the 'NaN' string, to show
     # that they're not available.
-    province = 'NaN'
-    catchment_size = 'NaN'
-    catchment_symbol = 'NaN'
-    station_move = 'NaN'
-    subcatchment = 'NaN'
-    region_name = 'NaN'
+    header['province'] = 'NaN'
+    header['catchment_size'] = 'NaN'
+    header['catchment_symbol'] = 'NaN'
+    header['station_move'] = 'NaN'
+    header['subcatchment'] = 'NaN'
+    header['region_name'] = 'NaN'
     # set depth to not available for things that do not have it
-    depth = 'NaN'
-    elev = 'NaN'
+    header['depth'] = 'NaN'
+    header['elev'] = 'NaN'
 
-    # Grab various important information from the header and find the line in
-    # which the data starts.
-    # Will fail when a file is smaller than 40 lines, but such short time
-    # series do not make sense to work with.
-    # Will also fail if the headers of the csvs get bigger than 40 lines.
-    # As of now, they're around 34, so 40 leaves a bit of a margin.
-    # If it fails, increase header_counter as you see fit.
     # AS of now, this can only handle groundwater levels, river levels,
     # precipitation and spring flows. If it shall be extended to other types,
     # some logic is needed to distinguish between the different possibilities
-    # that one of the current 'datatype' can contain. E.g. river temperature 
+    # that one of the current 'datatype' can contain. E.g. river temperature
     # not only needs to search for 'Gew\xe4sser' as of now, but also for
     # 'WTemperatur'.
     # Thus, we set the datatype to NA at first, and change it only for files
     # that fit the rest of the Analysis:
-    datatype = 'NA'
-    meta_error = 'no_error'
-    data_error = 'no_error'
-    header_counter = 0
-    while header_counter < 40:
-        tester_list = table[header_counter]
-        tester = str(tester_list)  # must be turned into a string,
-        # otherwise we cant find strings in it.
-        if 'Gew\xe4sser' in tester:
-            datatype = 'Riverwater'
-            catchment_name = splitter(tester)
-        if 'Niederschlag' in tester:
-            datatype = 'Precipitation'
-            catchment_name = station_name
-            # Catchment name is set to the name of the station.
-        if 'Hauptquelle' in tester:
-            datatype = 'Spring'
-        if 'Grundwasser' in tester:
-            datatype = 'Groundwater'
-            catchment_name = splitter(tester)
-            # Gets the written name and short symbol for the catchment, e.g.
-            # 'Grazer Feld (Graz/Andritz - Wildon) [MUR]'
-            # the Murdurchbruchstal is missing the [MUR] marker.
-            # So we have to deal with that too.
-            if '[' in catchment_name:
-                name_end = catchment_name.find(']')
-                name_start = name_end - 3
-                catchment_symbol = catchment_name[name_start:name_end]
-            else:
-                catchment_symbol = 'NA'
-            # Gets the short symbol for the catchment, such as
-            # MUR, DRA (=Drau), DUJ (=Danube below Jochenstein) etc
-            groundwaterbody_name = table[header_counter - 1]
-            # Normally there are two names for the groundwater body, the larger
-            # 'Grundwasserkörper' and the subregion 'PorenGW-Gebiet' which can
-            # be very local (few square km).
-            subcatchment = splitter(groundwaterbody_name)
-        if 'Dienststelle' in tester:
-            region_name = splitter(tester)
-            # Who is responsible for the station. Mostly indicates which state.
-            # E.g. 'HD-Steiermark'. Can overlap with 'Messstellenbetreiber' and
-            # 'Bundesland', the latter being rare, however.
-            # For Vienna and Lower Austria, it can also contain
-            # 'HD-Wien (MA 45)' or 'Magistratsabteilung 31' with added clutter
-            # or no indication of the state.
-            # In this case there can also be a 'Bundesland' row:
-        if 'Bundesland' in tester:
-            province = splitter(tester)
-            # And to complicate matters further, there can also be a
-            # 'Messstellenbetreiber', i.e. who operates (or owns?) the station:
-        if 'Messstellenbetreiber' in tester:
-            operator = splitter(tester)
-        if 'HZB-Nummer' in tester:
-            # Keep the unique identifier used in ehyd
-            HZB = int(splitter(tester))
-            print('HZB:', HZB)
-        if 'HD-Nummer' in tester:
-            # Besides the HZB number, there's often also the HD number, used by
-            # the state authorities. Often, this number is also included in the
-            # name of the station. Can also contain letters and spaces, so
-            # we'll leave that as a string.
-            HD_num = splitter(tester)
-        if 'DBMS-Nummer' in tester:
-            # Some stations also have a DBMS number besides or instead of the
-            # HD number. Seems like it's only numbers, but nothing known about
-            # it, so lets keep it string.
-            DBMS_num = splitter(tester)
-        if 'Einzugsgebiet' in tester:
-            # find the size of the catchment
-            catchment_size = splitter(tester)
-        if 'Koordinaten' in tester:
-            # Sometimes a station gets moved and there will be all the
-            # coordinates it ever had listed in the file. The lines below try
-            # to find the last (=most current) coordinates by searching for the
-            # term 'Exportzeitreihe' which comes after the last location.
-            coord_tester = table[header_counter + 3]
-            if 'Exportzeitreihe' in coord_tester:
-                # This means there is only one row of Coordinates, so the
-                # station didn't move.
-                coord_values = header_counter + 2
-                coords_changed = 'False'
-            else:
-                # There's more than one row of Coordinates. We need to set the
-                # first one as old_coords to calculate the distance.
-                print('Station got moved during its livetime.')
-                coords_changed = 'True'
-                meta_error = 'Station_moved'
-                old_coords = table[header_counter + 2]
-                old_coords = coord_calculator(old_coords)
-                coord_tester = table[header_counter + 4]
+    header['datatype'] = 'NA'
+    header['meta_error'] = 'no_error'
+
+    # Grab various important information from the header and find the line in
+    # which the data starts.
+    for header_counter, tester in enumerate(table):
+        found_keys = _HEADER_KEYWORD.findall(tester)
+        if not found_keys:
+            continue
+        if 'Geländehöhe-Hauptquelle' in found_keys:
+            found_keys.append('Hauptquelle')
+        for key in sorted(set(found_keys), key=_HEADER_KEYS.index):
+            if key == 'Gew\xe4sser':
+                header['datatype'] = 'Riverwater'
+                header['catchment_name'] = splitter(tester)
+            elif key == 'Niederschlag':
+                header['datatype'] = 'Precipitation'
+                header['catchment_name'] = header['station_name']
+                # Catchment name is set to the name of the station.
+            elif key == 'Hauptquelle':
+                header['datatype'] = 'Spring'
+            elif key == 'Grundwasser':
+                header['datatype'] = 'Groundwater'
+                catchment_name = splitter(tester)
+                header['catchment_name'] = catchment_name
+                # Gets the written name and short symbol for the catchment,
+                # e.g. 'Grazer Feld (Graz/Andritz - Wildon) [MUR]'
+                # the Murdurchbruchstal is missing the [MUR] marker.
+                # So we have to deal with that too.
+                if '[' in catchment_name:
+                    name_end = catchment_name.find(']')
+                    name_start = name_end - 3
+                    header['catchment_symbol'] = catchment_name[
+                        name_start:name_end]
+                else:
+                    header['catchment_symbol'] = 'NA'
+                # Gets the short symbol for the catchment, such as
+                # MUR, DRA (=Drau), DUJ (=Danube below Jochenstein) etc
+                groundwaterbody_name = table[header_counter - 1]
+                # Normally there are two names for the groundwater body, the
+                # larger 'Grundwasserkörper' and the subregion
+                # 'PorenGW-Gebiet' which can be very local (few square km).
+                header['subcatchment'] = splitter(groundwaterbody_name)
+            elif key == 'Dienststelle':
+                header['region_name'] = splitter(tester)
+                # Who is responsible for the station. Mostly indicates which
+                # state. E.g. 'HD-Steiermark'. Can overlap with
+                # 'Messstellenbetreiber' and 'Bundesland', the latter being
+                # rare, however.
+                # For Vienna and Lower Austria, it can also contain
+                # 'HD-Wien (MA 45)' or 'Magistratsabteilung 31' with added
+                # clutter or no indication of the state.
+                # In this case there can also be a 'Bundesland' row:
+            elif key == 'Bundesland':
+                header['province'] = splitter(tester)
+                # And to complicate matters further, there can also be a
+                # 'Messstellenbetreiber', i.e. who operates (or owns?) the
+                # station:
+            elif key == 'Messstellenbetreiber':
+                header['operator'] = splitter(tester)
+            elif key == 'HZB-Nummer':
+                # Keep the unique identifier used in ehyd
+                header['HZB'] = int(splitter(tester))
+                _debug('HZB: %s', header['HZB'])
+            elif key == 'HD-Nummer':
+                # Besides the HZB number, there's often also the HD number,
+                # used by the state authorities. Often, this number is also
+                # included in the name of the station. Can also contain
+                # letters and spaces, so we'll leave that as a string.
+                header['HD_num'] = splitter(tester)
+            elif key == 'DBMS-Nummer':
+                # Some stations also have a DBMS number besides or instead of
+                # the HD number. Seems like it's only numbers, but nothing
+                # known about it, so lets keep it string.
+                header['DBMS_num'] = splitter(tester)
+            elif key == 'Einzugsgebiet':
+                # find the size of the catchment
+                header['catchment_size'] = splitter(tester)
+            elif key == 'Koordinaten':
+                # Sometimes a station gets moved and there will be all the
+                # coordinates it ever had listed in the file. The lines below
+                # try to find the last (=most current) coordinates by
+                # searching for the term 'Exportzeitreihe' which comes after
+                # the last location.
+                HZB = header.get('HZB')
+                coord_tester = table[header_counter + 3]
                 if 'Exportzeitreihe' in coord_tester:
-                    coord_values = header_counter + 3
+                    # This means there is only one row of Coordinates, so the
+                    # station didn't move.
+                    coord_values = header_counter + 2
+                    coords_changed = 'False'
                 else:
-                    coord_tester = table[header_counter + 5]
+                    # There's more than one row of Coordinates. We need to set
+                    # the first one as old_coords to calculate the distance.
+                    _note(record, 'station_moved',
+                          'Station got moved during its livetime.')
+                    coords_changed = 'True'
+                    header['meta_error'] = 'Station_moved'
+                    old_coords = coord_calculator(table[header_counter + 2],
+                                                  input_type)
+                    if old_coords[0] != old_coords[0]:
+                        _note(record, 'missing_coords',
+                              'Station', HZB, 'is missing coordinates!')
+                        header['meta_error'] = 'missing_coords'
+                    coord_tester = table[header_counter + 4]
                     if 'Exportzeitreihe' in coord_tester:
-                        coord_values = header_counter + 4
+                        coord_values = header_counter + 3
+                    else:
+                        coord_tester = table[header_counter + 5]
+                        if 'Exportzeitreihe' in coord_tester:
+                            coord_values = header_counter + 4
+                        else:
+                            coord_values = header_counter + 5
+                            _note(record, 'moved_4_times',
+                                  'Station', HZB, 'has been moved at least 4 times! \n',
+                                  'Coordinates might be of an older location, please check this station!')
+
+                coords = coord_calculator(table[coord_values], input_type)
+                if coords[0] != coords[0]:
+                    # NaN is the only thing that isn't equal to itself.
+                    _note(record, 'missing_coords',
+                          'Station', HZB, 'is missing coordinates!')
+                    header['meta_error'] = 'missing_coords'
+                if coords_changed == 'True':
+                    # Print info about how far the station got moved.
+                    # Sometimes, coordinates are missing, so we need some
+                    # routine to deal with missing coordinates
+                    if header['meta_error'] == 'missing_coords':
+                        _note(record, 'unknown_move',
+                              'Station', HZB, 'was moved by an unknown distance! \n',
+                              'Using the coordinates of the older location!')
+                        coords = old_coords
+                    else:
+                        # Uses the haversine distance, see
+                        # https://en.wikipedia.org/wiki/Haversine_formula
+                        station_move = haversine(coords[0], coords[1],
+                                                 old_coords[0], old_coords[1])
+                        station_move = round(station_move, 2)
+                        # Rounded to two decimals (=centimeters).
+                        header['station_move'] = station_move
+                        _note(record, 'move_distance',
+                              'Sation', HZB, 'was moved by',
+                              int(station_move), 'meters.',
+                              meters=float(station_move))
+                header['lat'] = coords[0]
+                header['lon'] = coords[1]
+            elif key == 'Messpunkthöhe:':
+                elev = tester.replace(",", ".")
+                elev = splitter(elev)
+                header['elev'] = float(elev)
+            elif key == 'Sohllage':
+                depth = tester.replace(",", ".")
+                depth = splitter(depth)
+                header['depth'] = float(depth)
+            elif key == 'Geländehöhe-Hauptquelle':
+                # can be an elevation of a spring.
+                # but is this really needed? What about Pegelnullpunk?
+                elev = tester.replace(",", ".")
+                elev = splitter(elev)
+                if elev == '':
+                    header['elev'] = 'NaN'
+                else:
+                    header['elev'] = float(elev)
+            elif key == 'Pegelnullpunkt':
+                if header['datatype'] == 'Spring' and header['elev'] == 'NaN':
+                    elev = tester.replace(",", ".")
+                    elev = splitter(elev)
+                    header['elev'] = float(elev)
+                if header['datatype'] == 'Riverwater':
+                    elev = str(table[header_counter+2])
+                    elev = elev.replace(",", ".")
+                    elev = splitter(elev)
+                    if elev == '':
+                        header['elev'] = 'NaN'
                     else:
-                        coord_values = header_counter + 5
-                        print('Station', HZB, 'has been moved at least 4 times! \n',
-                              'Coordinates might be of an older location, please check this station!')
-
-            coords = coord_calculator(table[coord_values])
-            lat = coords[0]
-            lon = coords[1]
-            if coords_changed == 'True':
-                # Print info about how far the station got moved. Sometimes, 
-                # coordinates are missing, so we need some routine to deal with
-                # missing coordinates
-                if meta_error == 'missing_coords':
-                    print('Station', HZB, 'was moved by an unknown distance! \n',
-                          'Using the coordinates of the older location!')
-                    coords = old_coords
-                    lat = coords[0]
-                    lon = coords[1]
+                        header['elev'] = float(elev)
+            elif key == 'Höhe:':
+                # Should also test for datatype == 'Precipitation', but this
+                # fails. Seems like 'Höhe:' only gets used in precip, but a
+                # test would still be nice.
+                elev = str(table[header_counter+2])
+                elev = elev.replace(",", ".")
+                elev = splitter(elev)
+                if elev == '':
+                    header['elev'] = 'NaN'
                 else:
-                    # Uses the haversine distance from scikit learn. see
-                    # https://scikit-learn.org/stable/modules/generated/sklearn.metrics.pairwise.haversine_distances.html
-                    # or
-                    # https://en.wikipedia.org/wiki/Haversine_formula
-                    # could probably also be implemented without scikit-learn.
-                    # Needs to be turned into radians to work with.
-                    coords_rad = [radians(i) for i in coords]
-                    old_coords_rad = [radians(i) for i in old_coords]
-                    station_move = haversine_distances(
-                        [coords_rad, old_coords_rad]) * 6371 * 1000
-                    # Multiply with earth radius in meters to get the distance.
-                    station_move = round(station_move[0, 1], 2)
-                    # output is an array, this should get the distance without
-                    # the rest, rounded to two decimals (=centimeters).
-                    print('Sation', HZB, 'was moved by',
-                          int(station_move), 'meters.')
-
-        if 'Messpunkthöhe:' in tester:
-            elev = tester.replace(",", ".")
-            elev = splitter(elev)
-            elev = float(elev)
-        if 'Sohllage' in tester:
-            depth = tester.replace(",", ".")
-            depth = splitter(depth)
-            depth = float(depth)
-        if 'Geländehöhe-Hauptquelle' in tester:
-            # can be an elevation of a spring.
-            # but is this really needed? What about Pegelnullpunk?
-            elev = tester.replace(",", ".")
-            elev = splitter(elev)
-            if elev == '':
-                elev = 'NaN'
-            else:
-                elev = float(elev)
-        if 'Pegelnullpunkt' in tester and datatype == 'Spring' and elev == 'NaN':
-            elev = tester.replace(",", ".")
-            elev = splitter(elev)
-            elev = float(elev)
-        if 'Pegelnullpunkt' in tester and datatype == 'Riverwater':
-            elev = str(table[header_counter+2])
-            elev = elev.replace(",", ".")
-            elev = splitter(elev)
-            if elev == '':
-                elev = 'NaN'
-            else:
-                elev = float(elev)
-        if 'Höhe:' in tester:# and datatype == 'Precipitation':
-            # Should also test for datatype, but this fails.
-            # Seems like 'Höhe:' only gets used in precip, but a test would
-            # still be nice.
-            elev = str(table[header_counter+2])
-            elev = elev.replace(",", ".")
-            elev = splitter(elev)
-            if elev == '':
-                elev = 'NaN'
-            else:
-                elev = float(elev)
-        # Can also have a lot of different values if the station moved.
-        # Still missing something to detect that and to give info about changes
-        # station location. Uses the first value it finds. Will probably not
-        # be totally wrong, but isn't the most recent value.
-        if 'Werte:' in tester:
-            werte_start = header_counter
-            # Finds the line where the data starts
-        header_counter += 1
-
-    if depth != 'NaN':
-        teufe = round((elev - depth), 2)
+                    header['elev'] = float(elev)
+                # Can also have a lot of different values if the station
+                # moved. Still missing something to detect that and to give
+                # info about changes station location. Uses the first value it
+                # finds. Will probably not be totally wrong, but isn't the
+                # most recent value.
+            elif key == 'Werte:':
+                # Finds the line where the data starts
+                header['werte_start'] = header_counter
+
+    if header['depth'] != 'NaN':
+        header['teufe'] = round((header['elev'] - header['depth']), 2)
         # Due to how floating point numbers work, we sometimes run into values
         # like 11.799999999999983 where it should be 11.8 so lets round it to
         # take care of that.
     else:
-        teufe = 'NaN'
+        header['teufe'] = 'NaN'
+
+    return header
+
+
+def _split_header(file_text, input_type='csv', record=None):
+    """
+    Splits the text of an ehyd file into its header and data section.
+
+    Returns the metadata found in the header (see _scan_header) and the
+    position in file_text where the values start, i.e. the start of the line
+    after the 'Werte:' line. Only the header gets split into lines, the data
+    section is left alone for the data parser.
+    """
+    werte_pos = file_text.find('Werte:')
+    if werte_pos == -1:
+        raise ValueError("No 'Werte:' line found, this doesn't look like "
+                         "an ehyd file.")
+    data_start = file_text.find('\n', werte_pos) + 1
+    if data_start == 0:
+        # No newline after the 'Werte:' line, so there's no data either.
+        data_start = len(file_text)
+    header = _scan_header(file_text[:data_start].splitlines(keepends=True),
+                          input_type, record)
+    return header, data_start
+
+
+def parse_header(filename, input_type='csv'):
+    """
+    Reads only the metadata from the header of an ehyd file.
+
+    Stops reading at the 'Werte:' line, so the time series itself is never
+    touched. This is much quicker than reading the whole file with
+    ehyd_reader, if only the metadata is needed.
+
+    Returns a dict with the same metadata as the 'dict' output of ehyd_reader,
+    apart from 'timeseries' and 'data_error', which need the data. It also
+    contains 'werte_start', the number of the line in which the values start.
+
+    Parameters
+    ----------
+    filename : str, bytes or file-like
+        path to and name of the file to be read, or the file itself (see
+        ehyd_reader)
+    input_type : str
+        can be 'csv' for a CSV file or 'dat' for a DAT file
+
+    Examples
+    --------
+    # Get the coordinates of a station:
+    header = parse_header('filename.csv')
+    print(header['lat'], header['lon'])
+    """
+    if isinstance(filename, _BUFFER_TYPES) or hasattr(filename, 'read'):
+        # Already in memory (or has to be read anyway), no need to stop early.
+        return _split_header(_read_text(filename), input_type)[0]
+    table = []
+    with _open_text(filename) as f1:
+        for line in f1:
+            table.append(line)
+            if 'Werte:' in line:
+                break
+        else:
+            raise ValueError("No 'Werte:' line found, this doesn't look like "
+                             "an ehyd file.")
+    return _scan_header(table, input_type)
+
+
+def _read_values_python(source, skiprows, input_type):
+    """
+    Reads the data section of an ehyd file with the python engine of pandas.
+
+    This is the original way of reading the values. It is slow, since it
+    needs a regular expression as separator and has to guess the date
+    format, but it can deal with about anything. Used as a fallback for the
+    fast parser.
+
+    Parameters
+    ----------
+    source : str or file-like
+        path to the file or a buffer containing the file
+    skiprows : int
+        number of lines before the first value
+    input_type : str
+        can be 'csv' for a CSV file or 'dat' for a DAT file
+    """
+    import pandas as pd
 
     if input_type == 'dat':
-        seperator = '\s{2,10}'
+        seperator = r'\s{2,10}'
         deci = '.'
     else:
-        seperator = '\s*\;\s*'
+        seperator = r'\s*\;\s*'
         deci = ','
 
-    hydro_tS = pd.read_csv(current_csv,
-                           skiprows=werte_start+1, decimal=deci,  
+    hydro_tS = pd.read_csv(source,
+                           skiprows=skiprows, decimal=deci,
                            sep=seperator, usecols=[0, 1], index_col=0,
                            dayfirst=True, parse_dates=True, engine='python',
                            encoding='cp1252', names=['date', 'level'],
@@ -375,81 +760,392 @@ def ehyd_reader(filename, output_type, write_csv='False',
     # cp1252. If ehyd gets updated at some point in time or this is adapeted
     # to other files, 'encoding='cp1252'' might have to be changed to some more
     # common format.
+    return hydro_tS
 
-    # The data sometimes gets read as object, but we need float.
-    hydro_tS.level = hydro_tS.level.astype(float)
 
-    # Normalize the whole thing to get rid of hours and minutes.
-    # If those are needed, the following line can be removed,
-    # but it'll wreak havok with irregular times.
-    hydro_tS.index = hydro_tS.index.normalize()
+def _read_values_fast(data_text, input_type):
+    """
+    Reads the data section of an ehyd file with the C engine of pandas.
 
-    # get the lowest and the largest date
-    min_date = hydro_tS.index.min()
-    max_date = hydro_tS.index.max()
-    mini_date_1 = str(min_date)
-    maxi_date_1 = str(max_date)
-    mini_date = mini_date_1[0:10]
-    maxi_date = maxi_date_1[0:10]
-    # hardcoded to get rid of the hours and seconds.
-    # Might fail if anything in the date format changes.
+    The padding around the separators is turned into a plain ';' with a
+    single regular expression pass over the whole text, which leaves a table
+    the C engine can read. The dates are parsed all at once with the fixed
+    EHYD_DATE_FORMAT instead of letting pandas guess the format.
+    Gives exactly the same values as _read_values_python (the C engine uses
+    the same float conversion as the python engine), but raises a ValueError
+    if the data doesn't follow the usual ehyd layout, so the caller can fall
+    back to the python engine.
 
-    min_year = min_date.year
-    max_year = max_date.year
-    data_years = max_year - min_year
+    Parameters
+    ----------
+    data_text : str
+        the data section of the file, i.e. everything after the 'Werte:' line
+    input_type : str
+        can be 'csv' for a CSV file or 'dat' for a DAT file
+    """
+    import pandas as pd
 
-    # Check if there is a gap in the index, which can cause issues with some
-    # further procsessing. First we need to find the frequency of the data.
-    # We also need to get rid of the hours of the day, else days with multiple
-    # measurements will wreak havoc.
-    firstdate = hydro_tS.index[0]
-    seconddate = hydro_tS.index[1]
-    datedelta = seconddate - firstdate
-    # Pandas timedelta. Seems like it defaults to days, but just to make sure:
-    dayinterval_1 = datedelta.days
-    # Results in an int with the number of days between two days.
-    # 1=daily timeseries; 28-31=monthly
-    # However, some csv files can havechanging intervals. Let's do a few more
-    # tests to find out, by probing the interval at the end and in the middle.
-    lastdate = hydro_tS.index[-1]
-    second_lastdate = hydro_tS.index[-2]
-    datedelta = lastdate - second_lastdate
-    dayinterval_2 = datedelta.days
-    middate = hydro_tS.index[len(hydro_tS.index)//2]
-    smiddate = hydro_tS.index[len(hydro_tS.index)//2 - 1]
-    datedelta = middate - smiddate
-    dayinterval_3 = datedelta.days
+    if input_type == 'dat':
+        data_text = _DAT_SEPARATOR.sub(';', data_text)
+        deci = '.'
+    else:
+        data_text = _CSV_SEPARATOR.sub(';', data_text)
+        deci = ','
 
-    if dayinterval_1 == dayinterval_2 == dayinterval_3 == 1:
-        TS_freq = 'D'
-        #hydro_tS = hydro_tS.asfreq(TS_freq)
+    hydro_tS = pd.read_csv(io.StringIO(data_text), sep=';', header=None,
+                           decimal=deci, usecols=[0, 1], index_col=0,
+                           engine='c', names=['date', 'level'],
+                           dtype={'date': str}, na_values='Lücke')
+    if hydro_tS.level.dtype.kind not in 'fi':
+        # Something in the values is neither a number nor 'Lücke'. Let the
+        # python engine deal with it (and fail the same way it always did).
+        raise ValueError('Non numeric values in the data section')
+    if len(hydro_tS) == 0:
+        raise ValueError('No values in the data section')
+    dates = _parse_ehyd_dates(hydro_tS.index)
+    # Use the same resolution pandas would use when parsing the dates itself,
+    # which depends on the version of pandas.
+    date_type = pd.to_datetime(hydro_tS.index[:1],
+                               format=EHYD_DATE_FORMAT).dtype
+    hydro_tS.index = pd.DatetimeIndex(dates.astype(date_type), name='date')
+    return hydro_tS
 
-    elif min(dayinterval_1, dayinterval_2, dayinterval_3) > 1:
-        if min(dayinterval_1, dayinterval_2, dayinterval_3) > 27:
-            TS_freq = 'MS'
-            #hydro_tS = hydro_tS.asfreq(TS_freq)
-        else:
-            TS_freq = 'MS'
-            #hydro_tS = hydro_tS.asfreq(TS_freq)
-            print('Station', HZB, 'has irregular monthly times! \n',
-                  'Check the index before doing calculations on it.')
-            data_error = 'Irregular_measure_times_M'
 
-    else:
-        TS_freq = 'D'
-        if input_type == 'dat':
-            hydro_tS = hydro_tS.resample(TS_freq).mean()
-            print('Station', HZB, 'has multiples measurements per day. \n',
-              'Resampled to daily.')
-        else:
-            print('Station', HZB, 'has irregular measurement times! \n',
-              'Check the index before doing calculations on it.')
-        data_error = 'Irregular_measure_times_D'
-    # The commented out
-    #hydro_tS = hydro_tS.asfreq(TS_freq)
-    # lines can resample it to the frequency it apparently has.
-    # Will pad missing dates and insert NaN as a value,
-    # which will then be taken care of by the stuff below.
+def _runs(flags):
+    """
+    Run-length encoding of the True values in a boolean array. Returns the
+    positions where the runs start and end (exclusive).
+    """
+    import numpy as np
+
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def quality_report(hydro_tS):
+    """
+    Analyses the quality of a time series in a single pass over its dates
+    and values.
+
+    Where the checks in ehyd_reader only look at a few dates to guess the
+    frequency and boil everything down to a single data_error, this looks at
+    every interval between two dates and keeps all the details. Works on the
+    dataframe of ehyd_reader (the first column gets used) or any Series with
+    a DatetimeIndex. The dates are taken as days, hours and minutes are
+    ignored.
+
+    Returns a dict with:
+      * 'start', 'end': the first and the last date,
+      * 'length', 'valid', 'nan': the number of entries, valid values and
+        NaN,
+      * 'intervals': a Series with the number of times each interval (in
+        days) between two following dates occurs,
+      * 'frequency': the dominant frequency, 'D' (daily), 'MS' (monthly),
+        'YS' (yearly), some number of days like '7D' or None if there are
+        less than two dates,
+      * 'duplicates': a Series with the number of entries of each date that
+        occurs more than once,
+      * 'gaps': a dataframe with the 'start', 'end' and 'length' (in steps
+        of the frequency) of each run of missing dates,
+      * 'nan_runs': a dataframe with the 'start', 'end' and 'length' of each
+        run of NaN values,
+      * 'coverage': a dataframe with the number of valid values, the number
+        of 'expected' values and the 'coverage' (valid/expected) of each
+        calendar year, according to the frequency.
+
+    Parameters
+    ----------
+    hydro_tS : DataFrame or Series
+        the time series, e.g. from ehyd_reader with output_type='df'
+
+    Examples
+    --------
+    # Find the longest gap of a station:
+    report = quality_report(ehyd_reader('filename.csv', output_type='df'))
+    report['gaps'].sort_values('length').tail(1)
+    # The same, but reading the file only once:
+    ehyd_df, report = ehyd_reader('filename.csv', 'df', quality='True')
+    """
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(hydro_tS, pd.DataFrame):
+        hydro_tS = hydro_tS.iloc[:, 0]
+    values = hydro_tS.to_numpy(dtype=float)
+    dates = hydro_tS.index.values.astype('datetime64[D]')
+    days = dates.astype(np.int64)
+    isnan = np.isnan(values)
+    report = {'start': hydro_tS.index.min(), 'end': hydro_tS.index.max(),
+              'length': len(values), 'valid': int((~isnan).sum()),
+              'nan': int(isnan.sum())}
+
+    # All intervals between two dates, in days.
+    steps = np.diff(days)
+    sizes, counts = np.unique(steps, return_counts=True)
+    report['intervals'] = pd.Series(counts, index=pd.Index(sizes,
+                                    name='days'), name='count')
+
+    # The dominant frequency. Months and years don't have a fixed number of
+    # days, so all intervals of 28-31 and 365-366 days count together.
+    classes = {'D': counts[sizes == 1].sum(),
+               'MS': counts[(sizes >= 28) & (sizes <= 31)].sum(),
+               'YS': counts[(sizes >= 365) & (sizes <= 366)].sum()}
+    frequency = max(classes, key=classes.get)
+    if classes[frequency] == 0:
+        frequency = None
+    real_steps = sizes > 0
+    if len(sizes[real_steps]):
+        largest = counts[real_steps].argmax()
+        if counts[real_steps][largest] > classes[frequency or 'D']:
+            frequency = '%dD' % sizes[real_steps][largest]
+    report['frequency'] = frequency
+
+    # Dates that occur more than once.
+    duplicated = np.flatnonzero(steps == 0)
+    if np.any(steps < 0):
+        # Not sorted, so duplicates don't have to follow each other.
+        duplicate_dates = pd.Series(dates).value_counts()
+        duplicate_dates = duplicate_dates[duplicate_dates > 1].sort_index()
+    else:
+        duplicate_dates = pd.Series(dates[duplicated]).value_counts(
+            ).sort_index() + 1
+    duplicate_dates.index = pd.DatetimeIndex(duplicate_dates.index,
+                                             name='date')
+    report['duplicates'] = duplicate_dates.rename('count')
+
+    # Missing dates, counted in steps of the frequency.
+    if frequency == 'MS':
+        periods = dates.astype('datetime64[M]').astype(np.int64)
+        unit, step = 'M', 1
+    elif frequency == 'YS':
+        periods = dates.astype('datetime64[Y]').astype(np.int64)
+        unit, step = 'Y', 1
+    else:
+        periods = days
+        unit = 'D'
+        step = int(frequency[:-1]) if frequency and frequency != 'D' else 1
+    period_steps = np.diff(periods)
+    gap = np.flatnonzero(period_steps > step)
+    gap_start = (periods[gap] + step).astype('datetime64[%s]' % unit)
+    gap_end = (periods[gap + 1] - step).astype('datetime64[%s]' % unit)
+    report['gaps'] = pd.DataFrame(
+        {'start': pd.DatetimeIndex(gap_start.astype('datetime64[s]')),
+         'end': pd.DatetimeIndex(gap_end.astype('datetime64[s]')),
+         'length': period_steps[gap] // step - 1})
+
+    # Runs of NaN values.
+    starts, ends = _runs(isnan)
+    report['nan_runs'] = pd.DataFrame(
+        {'start': hydro_tS.index[starts], 'end': hydro_tS.index[ends - 1],
+         'length': ends - starts})
+
+    # Valid values per calendar year, compared to how many there should be.
+    # Dates with more than one valid value only count once.
+    valid_periods = np.unique(periods[~isnan]).astype('datetime64[%s]' % unit)
+    valid_years, valid = np.unique(valid_periods.astype('datetime64[Y]'),
+                                   return_counts=True)
+    all_years = np.unique(dates.astype('datetime64[Y]'))
+    coverage = pd.DataFrame(
+        {'valid': pd.Series(valid, index=valid_years.astype(np.int64) + 1970)
+         .reindex(all_years.astype(np.int64) + 1970, fill_value=0)})
+    coverage.index.name = 'year'
+    if frequency == 'D':
+        expected = ((all_years + 1).astype('datetime64[D]')
+                    - all_years.astype('datetime64[D]')).astype(np.int64)
+    elif frequency == 'MS':
+        expected = 12
+    elif frequency == 'YS':
+        expected = 1
+    elif frequency is not None:
+        expected = ((all_years + 1).astype('datetime64[D]')
+                    - all_years.astype('datetime64[D]')).astype(np.int64)
+        expected = expected / step
+    else:
+        expected = np.nan
+    coverage['expected'] = expected
+    coverage['coverage'] = coverage['valid'] / coverage['expected']
+    report['coverage'] = coverage
+
+    return report
+
+
+def _read_values(data_text, input_type='csv', parser='fast', record=None):
+    """
+    Reads the data section of an ehyd file with the fast parser, or with the
+    python engine if parser is 'python' or the fast parser can't deal with it.
+    With record (see ReadStats), files read by the python engine get counted
+    as 'python_parser'.
+    """
+    if parser == 'fast':
+        try:
+            return _read_values_fast(data_text, input_type)
+        except ValueError:
+            # Not the usual layout, the python engine has to take over.
+            pass
+    if record is not None:
+        record['counts']['python_parser'] = 1
+    return _read_values_python(io.StringIO(data_text), 0, input_type)
+
+
+def _read_raw(filename, input_type='csv', parser='fast', record=None):
+    """
+    Reads an ehyd file without checking its data. Returns the metadata from
+    the header and the time series as it was read.
+
+    If record is given (see ReadStats), the time of reading the file, the
+    header and the values and the number of bytes, header lines and rows get
+    added to it.
+    """
+    start = time.perf_counter()
+    # since filename is kinda generic, change it to current_csv
+    current_csv = filename
+
+    # Read the whole file at once. The header only gets split into lines up to
+    # the 'Werte:' line, the rest of the text goes straight to the data parser.
+    # filename can also be the file itself, as bytes or file-like object.
+    file_text = _read_text(current_csv)
+    # Due to the weird format of the csv files, they appear to be enconded as
+    # cp1252. If ehyd gets updated at some point in time or this is adapeted
+    # to other files, 'encoding='cp1252'' might have to be changed to some more
+    # common format.
+    start = _lap(record, 'read_file', start)
+
+    header, data_start = _split_header(file_text, input_type, record)
+    start = _lap(record, 'header', start)
+    hydro_tS = _read_values(file_text[data_start:], input_type, parser,
+                            record)
+    _lap(record, 'parse', start)
+    if record is not None:
+        # cp1252 has a single byte per character.
+        record['counts'].update(bytes=len(file_text),
+                                header_lines=header['werte_start'] + 1,
+                                rows=len(hydro_tS))
+        record['HZB'] = header.get('HZB')
+    return header, hydro_tS
+
+
+def _read_station(filename, input_type='csv', interpolate='False',
+                  parser='fast', quality='False', record=None):
+    """
+    Reads an ehyd file and checks its data, the work horse of ehyd_reader.
+
+    Returns the metadata from the header, the data_error, the time series
+    as a dataframe with a single 'level' column and the quality_report of the
+    series as it was read (None, unless quality is 'True').
+    """
+    header, hydro_tS = _read_raw(filename, input_type, parser, record)
+    data_error, hydro_tS, report = _check_station(header, hydro_tS,
+                                                  input_type, interpolate,
+                                                  quality, record)
+    return header, data_error, hydro_tS, report
+
+
+def _check_station(header, hydro_tS, input_type='csv', interpolate='False',
+                   quality='False', record=None):
+    """
+    Checks the time series of a station as it was read and cleans it up
+    (removing duplicates, resampling dat files, interpolating).
+
+    Returns the data_error, the time series and the quality_report (None,
+    unless quality is 'True').
+    If record is given (see ReadStats), the time of the stages 'normalize',
+    'quality' and 'checks', the number of values left and the warnings get
+    added to it.
+    """
+    start = time.perf_counter()
+    # Import the needed modules.
+    import pandas as pd
+
+    HZB = header.get('HZB')
+    data_error = 'no_error'
+
+    # The data sometimes gets read as object, but we need float.
+    hydro_tS.level = hydro_tS.level.astype(float)
+
+    # Normalize the whole thing to get rid of hours and minutes.
+    # If those are needed, the following line can be removed,
+    # but it'll wreak havok with irregular times.
+    hydro_tS.index = hydro_tS.index.normalize()
+    start = _lap(record, 'normalize', start)
+
+    # The full analysis, before anything gets removed or resampled below.
+    # The data_error deliberately doesn't come from it, but from the checks
+    # below as before, so it stays the same for existing analyses (see the
+    # README). The report is the one to trust where the two differ.
+    report = None
+    if quality == 'True':
+        report = quality_report(hydro_tS)
+        start = _lap(record, 'quality', start)
+
+    # get the lowest and the largest date
+    min_date = hydro_tS.index.min()
+    max_date = hydro_tS.index.max()
+    mini_date_1 = str(min_date)
+    maxi_date_1 = str(max_date)
+    mini_date = mini_date_1[0:10]
+    maxi_date = maxi_date_1[0:10]
+    # hardcoded to get rid of the hours and seconds.
+    # Might fail if anything in the date format changes.
+
+    min_year = min_date.year
+    max_year = max_date.year
+    data_years = max_year - min_year
+
+    # Check if there is a gap in the index, which can cause issues with some
+    # further procsessing. First we need to find the frequency of the data.
+    # We also need to get rid of the hours of the day, else days with multiple
+    # measurements will wreak havoc.
+    firstdate = hydro_tS.index[0]
+    seconddate = hydro_tS.index[1]
+    datedelta = seconddate - firstdate
+    # Pandas timedelta. Seems like it defaults to days, but just to make sure:
+    dayinterval_1 = datedelta.days
+    # Results in an int with the number of days between two days.
+    # 1=daily timeseries; 28-31=monthly
+    # However, some csv files can havechanging intervals. Let's do a few more
+    # tests to find out, by probing the interval at the end and in the middle.
+    lastdate = hydro_tS.index[-1]
+    second_lastdate = hydro_tS.index[-2]
+    datedelta = lastdate - second_lastdate
+    dayinterval_2 = datedelta.days
+    middate = hydro_tS.index[len(hydro_tS.index)//2]
+    smiddate = hydro_tS.index[len(hydro_tS.index)//2 - 1]
+    datedelta = middate - smiddate
+    dayinterval_3 = datedelta.days
+
+    if dayinterval_1 == dayinterval_2 == dayinterval_3 == 1:
+        TS_freq = 'D'
+        #hydro_tS = hydro_tS.asfreq(TS_freq)
+
+    elif min(dayinterval_1, dayinterval_2, dayinterval_3) > 1:
+        if min(dayinterval_1, dayinterval_2, dayinterval_3) > 27:
+            TS_freq = 'MS'
+            #hydro_tS = hydro_tS.asfreq(TS_freq)
+        else:
+            TS_freq = 'MS'
+            #hydro_tS = hydro_tS.asfreq(TS_freq)
+            _note(record, 'irregular_monthly_times',
+                  'Station', HZB, 'has irregular monthly times! \n',
+                  'Check the index before doing calculations on it.')
+            data_error = 'Irregular_measure_times_M'
+
+    else:
+        TS_freq = 'D'
+        if input_type == 'dat':
+            hydro_tS = hydro_tS.resample(TS_freq).mean()
+            _note(record, 'resampled_daily',
+                  'Station', HZB, 'has multiples measurements per day. \n',
+                  'Resampled to daily.')
+        else:
+            _note(record, 'irregular_times',
+                  'Station', HZB, 'has irregular measurement times! \n',
+                  'Check the index before doing calculations on it.')
+        data_error = 'Irregular_measure_times_D'
+    # The commented out
+    #hydro_tS = hydro_tS.asfreq(TS_freq)
+    # lines can resample it to the frequency it apparently has.
+    # Will pad missing dates and insert NaN as a value,
+    # which will then be taken care of by the stuff below.
 
     # Built a empty date range with the same start, end and frequency as the
     # orignal data and get its length:
@@ -472,22 +1168,22 @@ def ehyd_reader(filename, output_type, write_csv='False',
             # the ~ is apparently a reversal of the booleans in that duplicated.
             # see
             # https://stackoverflow.com/questions/13035764/remove-rows-with-duplicate-indices-pandas-dataframe-and-timeseries
-            print('Two measurements at one day. first measurement deleted')
+            _note(record, 'duplicates_removed',
+                  'Two measurements at one day. first measurement deleted')
         data_error = 'double_measurement'
     if lengthdifference > 4:
         # Apparently, there is some issues around 1945 (war?) where total
         # months are missing, including dates.
         data_error = 'gap_data'
-        print('there is a gap in the data')
-        print('lengthdifference')
-        print(lengthdifference)
+        _note(record, 'gap', 'there is a gap in the data, lengthdifference',
+              lengthdifference, missing=int(lengthdifference))
     if data_years < 5:
         # Data that is too short can't reliably be used for many statistics.
         data_error = 'short_data'
-        print('time series very short')
+        _note(record, 'short_data', 'time series very short')
     if min_year > 2010:
         data_error = 'short_data'
-        print('time series very short')
+        _note(record, 'short_data', 'time series very short')
     else:
         # count the NaNs:
         real_count = hydro_tS.level.count()  # counts only valid numbers
@@ -497,7 +1193,8 @@ def ehyd_reader(filename, output_type, write_csv='False',
         ten_percent = percent_data*10
         if NaN_number > ten_percent:
             data_error = '10+percent_gap'
-            print('10 percent of data missing')
+            _note(record, 'nan_10_percent', '10 percent of data missing',
+                  nan=int(NaN_number))
 
         # Count how many NaNs there are following each other
         consecutive_NaNs = hydro_tS.level.isna().astype(int).groupby(
@@ -505,10 +1202,14 @@ def ehyd_reader(filename, output_type, write_csv='False',
 
         if TS_freq == 'D' and consecutive_NaNs > 14:
             data_error = '14+dayGap'
-            print('more than 14 consecutive NaN in daily data')
+            _note(record, 'nan_run',
+                  'more than 14 consecutive NaN in daily data',
+                  longest=int(consecutive_NaNs))
         if TS_freq == 'MS' and consecutive_NaNs > 3:
             data_error = '3+monthsGap'
-            print('more than 3 consecutive NaN in monthly data')
+            _note(record, 'nan_run',
+                  'more than 3 consecutive NaN in monthly data',
+                  longest=int(consecutive_NaNs))
 
         if interpolate == 'True':
             # Get rid of the NaN in the dataset.
@@ -518,33 +1219,2301 @@ def ehyd_reader(filename, output_type, write_csv='False',
             # this is probably not a valid approach.
             hydro_tS.level = hydro_tS.level.interpolate()
 
+    _lap(record, 'checks', start)
+    if record is not None:
+        record['counts']['values'] = len(hydro_tS)
+        record['data_error'] = data_error
+    return data_error, hydro_tS, report
+
+
+# Stands for NaN in the levels of a station stored as scaled integers.
+_COMPACT_NAN = -2**31
+
+
+def _pack_levels(values, scale=None):
+    """
+    Turns float values into the levels of a CompactStation: float32, or
+    int32 holding value*scale if scale is given.
+    """
+    import numpy as np
+
+    if scale is None:
+        return values.astype(np.float32)
+    scaled = np.round(values * scale)
+    if np.nanmax(np.abs(scaled), initial=0) >= 2**31 - 1:
+        raise ValueError('The values are too large for scale=%s.' % scale)
+    return np.where(np.isnan(scaled), _COMPACT_NAN, scaled).astype(np.int32)
+
+
+def _unpack_levels(levels, scale=None):
+    """
+    Turns the levels of a CompactStation back into floats. Without scale,
+    the float32 levels themselves are returned, without a copy.
+    """
+    import numpy as np
+
+    if scale is None:
+        return levels
+    values = levels / scale
+    values[levels == _COMPACT_NAN] = np.nan
+    return values
+
+
+def _pack_days(days, offsets):
+    """
+    Packs the dates (days since 1970) of one or more stations, one after
+    another with offsets telling where each station starts. Most stations
+    have a value every day (or every n days), so only their first day and
+    the step get kept. Only the days of the other stations are stored,
+    as int32, which covers more than five million years.
+
+    Returns the first day and the step of every station (int64), whether
+    it is regular (bool) and the days of the irregular ones.
+    """
+    import numpy as np
+
+    days = np.asarray(days, dtype=np.int64)
+    lengths = np.diff(offsets)
+    has_days = lengths > 0
+    starts = np.zeros(len(lengths), dtype=np.int64)
+    starts[has_days] = days[offsets[:-1][has_days]]
+    steps = np.ones(len(lengths), dtype=np.int64)
+    has_step = lengths > 1
+    steps[has_step] = days[offsets[:-1][has_step] + 1] - starts[has_step]
+    expected = _unpack_days(starts, steps, offsets)
+    # The number of days that don't fit start and step, for every station.
+    misfits = np.bincount(np.repeat(np.arange(len(lengths)), lengths),
+                          weights=days != expected, minlength=len(lengths))
+    regular = misfits == 0
+    irregular_days = days[np.repeat(~regular, lengths)]
+    if len(irregular_days) == 0 or np.abs(irregular_days).max() < 2**31:
+        irregular_days = irregular_days.astype(np.int32)
+    return starts, steps, regular, irregular_days
+
+
+def _unpack_days(starts, steps, offsets, regular=None, irregular_days=None):
+    """
+    Turns packed dates (see _pack_days) back into days since 1970 (int64),
+    one station after another.
+    """
+    import numpy as np
+
+    lengths = np.diff(offsets)
+    steps_taken = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    days = (np.repeat(starts, lengths)
+            + np.repeat(steps, lengths) * steps_taken)
+    if regular is not None and not regular.all():
+        days[np.repeat(~regular, lengths)] = irregular_days
+    return days
+
+
+class CompactStation:
+    """
+    A single station, kept in as little memory as possible.
+
+    Instead of a dataframe with a 20 level column header, the metadata is a
+    tuple (in the order of EHYD_LEVELS) and the time series is a NumPy
+    array of the values as float32, which is plenty for the two or three
+    decimals of the ehyd data. With scale (e.g. 100 for two decimals), the
+    levels get stored as int32 holding value*scale instead, which keeps the
+    decimals exact. NaN is stored as the smallest int32 then.
+
+    The dates of a station with a value every day (or every n days) are
+    only kept as the first day and the step, the dates of all others as
+    int32 days since 1970-01-01. days gives them as int64 days since
+    1970-01-01 either way.
+
+    Get one with ehyd_reader(filename, output_type='compact'). The metadata
+    can be looked up like in a dict, e.g. station['HZB'].
+
+    Examples
+    --------
+    station = ehyd_reader('filename.csv', output_type='compact')
+    station['HZB'], station.dates, station.values
+    # As a pandas Series, sharing the values with the station:
+    station.to_series()
+    """
+    __slots__ = ('metadata', 'levels', 'scale', 'start', 'step',
+                 'irregular_days')
+
+    def __init__(self, metadata, days, levels, scale=None):
+        import numpy as np
+
+        self.metadata = tuple(metadata)
+        self.levels = levels
+        self.scale = scale
+        starts, steps, regular, irregular_days = _pack_days(
+            days, np.array([0, len(levels)]))
+        self.start = int(starts[0])
+        self.step = int(steps[0])
+        self.irregular_days = None if regular[0] else irregular_days
+
+    @classmethod
+    def _from_packed(cls, metadata, levels, scale, start, step,
+                     irregular_days):
+        """
+        Makes a CompactStation from days that are packed already.
+        """
+        station = cls.__new__(cls)
+        station.metadata = tuple(metadata)
+        station.levels = levels
+        station.scale = scale
+        station.start = int(start)
+        station.step = int(step)
+        station.irregular_days = irregular_days
+        return station
+
+    @classmethod
+    def from_dataframe(cls, station_df, scale=None):
+        """
+        Makes a CompactStation from a station dataframe of ehyd_reader.
+        """
+        import numpy as np
+
+        metadata = [value.item() if hasattr(value, 'item') else value
+                    for value in station_df.columns[0]]
+        days = station_df.index.values.astype('datetime64[D]').astype(
+            np.int64)
+        levels = _pack_levels(station_df.iloc[:, 0].to_numpy(dtype=float),
+                              scale)
+        return cls(metadata, days, levels, scale)
+
+    def __getitem__(self, name):
+        return self.metadata[EHYD_LEVELS.index(name)]
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __repr__(self):
+        return '<CompactStation %s %s (%s), %d values>' % (
+            self['datatype'], self['HZB'], self['station_name'], len(self))
+
+    @property
+    def header(self):
+        """
+        The metadata as a dict.
+        """
+        return dict(zip(EHYD_LEVELS, self.metadata))
+
+    @property
+    def regular(self):
+        """
+        Whether the station has a value every step days.
+        """
+        return self.irregular_days is None
+
+    @property
+    def days(self):
+        """
+        The dates as days since 1970-01-01 (int64), unpacked on every call.
+        """
+        import numpy as np
+
+        if self.irregular_days is not None:
+            return self.irregular_days.astype(np.int64)
+        return self.start + self.step * np.arange(len(self), dtype=np.int64)
+
+    @property
+    def dates(self):
+        """
+        The dates as a NumPy datetime64[D] array.
+        """
+        return self.days.view('datetime64[D]')
+
+    @property
+    def values(self):
+        """
+        The values as floats. Without scale, these are the float32 levels
+        themselves, without a copy.
+        """
+        return _unpack_levels(self.levels, self.scale)
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the time series, in bytes.
+        """
+        nbytes = self.levels.nbytes
+        if self.irregular_days is not None:
+            nbytes += self.irregular_days.nbytes
+        return nbytes
+
+    def to_series(self):
+        """
+        Returns the time series as a pandas Series. Without scale, the Series
+        shares its values with the station, only the dates get converted.
+        """
+        import pandas as pd
+
+        index = pd.DatetimeIndex(self.dates.astype('datetime64[s]'),
+                                 name='date')
+        return pd.Series(self.values, index=index, name='level', copy=False)
+
+    def to_dataframe(self):
+        """
+        Returns the station as a dataframe like the 'df' output of
+        ehyd_reader, with float64 values.
+        """
+        import pandas as pd
+
+        station_df = self.to_series().astype(float).to_frame()
+        station_df.columns = pd.MultiIndex.from_product(
+            [[value] for value in self.metadata], names=EHYD_LEVELS)
+        return station_df
+
+
+class CompactStations:
+    """
+    Many stations, kept in as little memory as possible.
+
+    All the values are stored one after another in a single NumPy array
+    (levels, see CompactStation), with offsets telling where each station
+    starts. The dates are packed like those of CompactStation: the first
+    day and step of every station (starts and steps), and the int32 days
+    of the stations that aren't regular one after another in
+    irregular_days. days unpacks all of them, as int64 days since
+    1970-01-01. The metadata is a dataframe with one row per station and
+    the columns of EHYD_LEVELS, with proper types as in ehyd_catalog (e.g.
+    HZB as integer, catchment_size as float and categories for the
+    datatype, province, ...). header keeps the metadata of every station as
+    ehyd_reader gives it, as a tuple (e.g. 'NaN' for missing values and
+    catchment_size as written in the file), for the column header of
+    dataframes. Getting a single station gives a CompactStation with that
+    header, whose levels are a view into the levels of all stations,
+    without a copy.
+
+    Get it with ehyd_read_many(files, output_type='compact').
+
+    Examples
+    --------
+    stations, errors = ehyd_read_many('downloads/*.csv', output_type='compact')
+    stations.metadata.query("datatype == 'Groundwater'")
+    stations[0].to_series()
+    """
+    __slots__ = ('metadata', 'header', 'levels', 'offsets', 'scale',
+                 'starts', 'steps', 'regular', 'irregular_days',
+                 'irregular_offsets')
+
+    def __init__(self, metadata, days, levels, offsets, scale=None,
+                 header=None):
+        self.metadata = metadata
+        if header is None:
+            header = list(metadata[EHYD_LEVELS].itertuples(index=False,
+                                                           name=None))
+        self.header = [tuple(station_header) for station_header in header]
+        self.levels = levels
+        self.offsets = offsets
+        self.scale = scale
+        self._set_days(*_pack_days(days, offsets))
+
+    def _set_days(self, starts, steps, regular, irregular_days):
+        import numpy as np
+
+        self.starts = starts
+        self.steps = steps
+        self.regular = regular
+        self.irregular_days = irregular_days
+        # Where the days of each station start in irregular_days.
+        self.irregular_offsets = np.concatenate(
+            ([0], np.cumsum(np.where(regular, 0, np.diff(self.offsets)))))
+
+    @classmethod
+    def from_stations(cls, stations, scale=None):
+        """
+        Puts many CompactStation (with the same scale) together.
+        """
+        import numpy as np
+
+        stations = list(stations)
+        if stations:
+            scale = stations[0].scale
+        if any(station.scale != scale for station in stations):
+            raise ValueError('All stations need the same scale.')
+        lengths = [len(station) for station in stations]
+        offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+        levels = np.concatenate(
+            [station.levels for station in stations]
+            + [np.empty(0, dtype=np.float32 if scale is None else np.int32)])
+        metadata = metadata_table([station.metadata for station in stations],
+                                  EHYD_LEVELS)
+        metadata['data_error'] = metadata['data_error'].astype('category')
+        compact = cls.__new__(cls)
+        compact.metadata = metadata
+        compact.header = [station.metadata for station in stations]
+        compact.levels = levels
+        compact.offsets = offsets
+        compact.scale = scale
+        # The days are packed already, put them together as they are.
+        irregular_days = [station.irregular_days for station in stations
+                          if not station.regular]
+        compact._set_days(
+            np.array([station.start for station in stations],
+                     dtype=np.int64),
+            np.array([station.step for station in stations], dtype=np.int64),
+            np.array([station.regular for station in stations], dtype=bool),
+            np.concatenate(irregular_days) if irregular_days
+            else np.empty(0, dtype=np.int32))
+        return compact
+
+    @classmethod
+    def from_dataframe(cls, stations, scale=None):
+        """
+        Makes CompactStations from a dataframe with the column MultiIndex of
+        ehyd_reader, e.g. the output of ehyd_read_many. Since the stations in
+        such a dataframe share their dates, only the dates from the first to
+        the last valid value of each station are kept, but dates in between
+        that only other stations have stay in as NaN. Use ehyd_read_many with
+        output_type='compact' to keep only the own dates of each station.
+        """
+        compact = []
+        for position in range(stations.shape[1]):
+            station_df = stations.iloc[:, [position]]
+            level = station_df.iloc[:, 0]
+            station_df = station_df.loc[level.first_valid_index():
+                                        level.last_valid_index()]
+            compact.append(CompactStation.from_dataframe(station_df, scale))
+        return cls.from_stations(compact, scale)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        start, end = self.offsets[position], self.offsets[position + 1]
+        irregular_days = None
+        if not self.regular[position]:
+            irregular_days = self.irregular_days[
+                self.irregular_offsets[position]:
+                self.irregular_offsets[position + 1]]
+        return CompactStation._from_packed(
+            self.header[position], self.levels[start:end],
+            self.scale, self.starts[position], self.steps[position],
+            irregular_days)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def __repr__(self):
+        return '<CompactStations: %d stations, %d values>' % (
+            len(self), len(self.levels))
+
+    @property
+    def days(self):
+        """
+        The dates of all stations as days since 1970-01-01 (int64), one
+        station after another. Unpacked on every call.
+        """
+        return _unpack_days(self.starts, self.steps, self.offsets,
+                            self.regular, self.irregular_days)
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the time series, in bytes.
+        """
+        return (self.levels.nbytes + self.offsets.nbytes
+                + self.starts.nbytes + self.steps.nbytes
+                + self.regular.nbytes + self.irregular_days.nbytes
+                + self.irregular_offsets.nbytes)
+
+    def to_long(self):
+        """
+        Returns all time series as a long dataframe with the columns 'HZB',
+        'date' and 'level'.
+        """
+        import numpy as np
+        import pandas as pd
+
+        lengths = np.diff(self.offsets)
+        return pd.DataFrame({
+            'HZB': np.repeat(self.metadata['HZB'].to_numpy(), lengths),
+            'date': self.days.view('datetime64[D]').astype('datetime64[s]'),
+            'level': _unpack_levels(self.levels, self.scale)})
+
+
+def _build_output(header, data_error, hydro_tS, output_type,
+                  write_csv='False', warnings=None):
+    """
+    Puts together the output of ehyd_reader from the results of
+    _read_station and writes the csv file, if wanted. The warnings (see
+    _note) go into attrs of the 'df' output and into the 'dict' output.
+    """
+    import pandas as pd
+
+    HZB = header.get('HZB')
+    warnings = list(warnings or [])
+
     if output_type == 'df' or write_csv == 'True':
+        metadata = dict(header, data_error=data_error)
         output_header = pd.MultiIndex.from_product(
-            [[datatype], [station_name], [HZB], [HD_num],
-             [DBMS_num], [catchment_name], [catchment_symbol],
-             [subcatchment], [region_name], [province], [operator],
-             [catchment_size], [lat], [lon], [station_move],
-             [elev], [depth], [teufe], [data_error], [meta_error]],
-            names=['datatype', 'station_name', 'HZB', 'HD_num',
-                   'DBMS_num', 'catchment_name', 'catchment_symbol',
-                   'subcatchment', 'region_name', 'province', 'operator',
-                   'catchment_size', 'lat', 'lon', 'station_move',
-                   'elev', 'depth', 'teufe', 'data_error', 'meta_error'])
+            [[metadata[level]] for level in EHYD_LEVELS], names=EHYD_LEVELS)
         hydro_tS.columns = output_header
+        hydro_tS.attrs['warnings'] = warnings
         output = hydro_tS
     if write_csv == 'True':
         filename_out = str('%s.csv' % (HZB))
         hydro_tS.to_csv(filename_out, sep=';')
 
     if output_type == 'dict':
-        output = {'data_error': data_error, 'meta_error': meta_error,
-                  'station_name': station_name, 'catchment_name': catchment_name,
-                  'catchment_symbol': catchment_symbol,
-                  'subcatchment': subcatchment, 'region_name': region_name, 'HZB': HZB,
-                  'HD_num': HD_num, 'DBMS_num': DBMS_num, 'province': province,
-                  'operator': operator, 'catchment_size': catchment_size,
-                  'lat': lat, 'lon': lon, 'elev': elev, 'depth': depth,
-                  'teufe': teufe, 'station_move': station_move,
-                  'datatype': datatype, 'timeseries': hydro_tS}
+        output = {'data_error': data_error, 'meta_error': header['meta_error'],
+                  'station_name': header['station_name'],
+                  'catchment_name': header['catchment_name'],
+                  'catchment_symbol': header['catchment_symbol'],
+                  'subcatchment': header['subcatchment'],
+                  'region_name': header['region_name'], 'HZB': header['HZB'],
+                  'HD_num': header['HD_num'], 'DBMS_num': header['DBMS_num'],
+                  'province': header['province'],
+                  'operator': header['operator'],
+                  'catchment_size': header['catchment_size'],
+                  'lat': header['lat'], 'lon': header['lon'],
+                  'elev': header['elev'], 'depth': header['depth'],
+                  'teufe': header['teufe'],
+                  'station_move': header['station_move'],
+                  'datatype': header['datatype'], 'timeseries': hydro_tS,
+                  'warnings': warnings}
+
+    if output_type == 'compact':
+        import numpy as np
+
+        metadata = dict(header, data_error=data_error)
+        output = CompactStation(
+            [metadata[level].item() if hasattr(metadata[level], 'item')
+             else metadata[level] for level in EHYD_LEVELS],
+            hydro_tS.index.values.astype('datetime64[D]').astype(np.int64),
+            _pack_levels(hydro_tS.iloc[:, 0].to_numpy(dtype=float)))
 
     return output
+
+
+def ehyd_reader(filename, output_type, write_csv='False',
+                input_type='csv', interpolate='False', parser='fast',
+                quality='False', stats=None):
+    """
+    Reads in a CSV file containing a hydrologic time series (filename).
+    
+    Meant to be used with files obtained from ehyd.gv.at, taking into
+    account the intricacies of this data (ISO 8859-15 file, use of
+    german Umlauts, using the term "Lücke" for NaN, decimal comma).
+    
+    Can also read in .dat files, which get used internally in the
+    governement agencies. Those follow the same format as the csv files
+    but use a decimal dot and variable spaces as delimiter. Note that 
+    these files can have very irregular measurements, so handling these
+    is still experimental!
+
+    Instead of the name of a file, the file itself can be given, as bytes
+    (e.g. downloaded from ehyd, see ehyd_download.py), a memory map of the
+    file or as a file-like object, so it doesn't have to be saved to disk
+    first. Compressed files ('314922.csv.gz', also .xz and .bz2) and files
+    in a zip archive ('bundle.zip/314922.csv') can be read by their path,
+    without extracting them first. See ehyd_read_archive for reading all
+    files of an archive.
+    
+    Use 'dict' or 'df' to specify wether you want a dict or dataframe as
+    output. Use 'meta' to only get the metadata from the header as a dict
+    (see parse_header), without reading the time series. Use 'compact' to
+    get a CompactStation, which needs a lot less memory than a dataframe.
+    
+    If you want a "proper" CSV file in your working directory, use
+    "write_csv=True". For many stations, ehyd_export writes a simpler format
+    that is a lot quicker to write and to read back in (see ehyd_load).
+    
+    Set interpolate to 'True' if you want to interpolate over missing
+    data. For small gaps, this should be OK, but if 'data_error'
+    indicates a lot of missing data, this is probably going to cause
+    issues when further handling the data.
+
+    By default, the values are read with a fast parser based on the C engine
+    of pandas and a fixed date format. Files that don't fit this layout are
+    automatically read with the (much slower) python engine instead. Use
+    parser='python' to always use the python engine. Both give exactly the
+    same results.
+
+    Set quality to 'True' to get a detailed analysis of the time series (see
+    quality_report) along with the output. The analysis is done on the
+    series as it was read, before duplicates get removed or dat files get
+    resampled.
+
+    Nothing gets printed. Warnings about the station (e.g. that it got moved,
+    or has gaps in its data) come with the output, as a list of dicts with a
+    short 'code', the 'message' and details: under 'warnings' of the 'dict'
+    output and in attrs['warnings'] of the 'df' output. They also go to the
+    logger 'ehyd_reader', see ehyd_logging to show them while reading.
+
+    To find out where the time goes, pass a ReadStats (or any function
+    taking a dict) as stats. Once the file is read, it gets a record with the
+    time of each stage of reading the file, the number of bytes and values
+    and the warnings, see ReadStats.
+
+    Parameters
+    ----------
+    filename : str, bytes or file-like
+        path to and name of the file to be read (also compressed or in a
+        zip archive), or its content
+    output_type : str
+        can be 'df' for a dataframe as output, 'dict" for a dictionary,
+        'meta' for a dictionary with only the metadata or 'compact' for a
+        CompactStation
+    write_csv : bool
+    input_type : str
+        can be 'csv' for a CSV file or 'dat' for a DAT file
+    interpolate : bool
+    parser : str
+        can be 'fast' for the C engine based parser or 'python' for the
+        python engine of pandas
+    quality : bool
+        if 'True', a tuple of the output and the quality_report is returned
+    stats : callable
+        gets called with the record of reading the file, e.g. a ReadStats
+
+    Examples
+    --------
+    # Read in a csv file and output a dataframe:
+    ehyd_df = ehyd_reader('filename.csv', output_type='df')
+    # Read in a dat file and output a dictionary and a csv file:
+    ehyd_dict = ehyd_reader('filename.dat', output_type='dict', 
+                            input_type='dat', write_csv='True')    
+    
+    """
+
+    if output_type == 'meta':
+        # Stops at the 'Werte:' line, so the data doesn't get read at all.
+        return parse_header(filename, input_type)
+
+    # The record collects the warnings, even if nobody asked for the stats.
+    record = _new_record(filename)
+    first = time.perf_counter()
+    header, data_error, hydro_tS, report = _read_station(
+        filename, input_type, interpolate, parser, quality, record)
+    start = time.perf_counter()
+    output = _build_output(header, data_error, hydro_tS, output_type,
+                           write_csv, record['warnings'])
+    if stats is not None:
+        _lap(record, 'output', start)
+        record['total'] = time.perf_counter() - first
+        stats(record)
+    if quality == 'True':
+        return output, report
+    return output
+
+
+def _longest_run(flags, carry=0):
+    """
+    Finds the longest run of True in flags, where the first run continues a
+    run of carry Trues from before (e.g. from the previous chunk).
+
+    Returns the longest run and the length of the run at the end of flags,
+    which is the carry for the next call.
+    """
+    import numpy as np
+
+    if len(flags) == 0:
+        return carry, carry
+    breaks = np.flatnonzero(~flags)
+    if len(breaks) == 0:
+        return carry + len(flags), carry + len(flags)
+    # The runs end right before each False.
+    runs = np.diff(breaks, prepend=-1) - 1
+    runs[0] += carry
+    tail = len(flags) - breaks[-1] - 1
+    return max(int(runs.max()), tail), tail
+
+
+def _aggregate_daily(hydro_tS):
+    """
+    Aggregates a chunk of values to days. Returns a dataframe indexed by the
+    day (as days since 1970) with the sum, count (of valid values), number
+    of lines, min and max of each day.
+    """
+    import numpy as np
+    import pandas as pd
+
+    days = hydro_tS.index.values.astype('datetime64[D]').astype(np.int64)
+    values = pd.DataFrame({'day': days,
+                           'level': hydro_tS.level.to_numpy(dtype=float)})
+    daily = values.groupby('day')['level'].agg(['sum', 'count', 'size',
+                                                'min', 'max'])
+    return daily.rename(columns={'size': 'lines'})
+
+
+def ehyd_read_daily(filename, input_type='dat', chunk_size=2**22,
+                    out_file=None):
+    """
+    Reads a (very long) ehyd file in chunks and aggregates it to daily values.
+
+    Meant for the .dat files, which can contain many measurements per day
+    over decades, so reading them as a whole with ehyd_reader needs a lot of
+    memory. Here, only chunk_size characters of the file are read and parsed
+    at a time and the values get aggregated to days right away, so the full
+    series is never held in memory. The values of a day that is split
+    between two chunks get carried over and aggregated along with the rest
+    of the day, so every day is summed up in one go, in the same order as
+    by the resampling in ehyd_reader, and the daily means are exactly the
+    same. Days without any values get filled in with NaN, just like the
+    resampling in ehyd_reader does.
+    The values need to be in chronological order, as they are in the ehyd
+    files. Daily files come out as they are (with NaN for missing days).
+    Files with fewer values than one a day, like the monthly groundwater
+    levels, raise a ValueError, since spreading them out to days only adds
+    NaN; use ehyd_reader for those.
+
+    The data_error gets determined at the end with the same checks as in
+    ehyd_reader, applied to the daily values (with 'Irregular_measure_times_D'
+    if any day has more than one measurement).
+
+    Returns a dict with the same metadata as the 'dict' output of
+    ehyd_reader. Its 'timeseries' is a dataframe with one row per day and the
+    columns 'level' (the daily mean), 'min', 'max' and 'count' (the number of
+    valid values on that day). 'daily_stats' contains the numbers behind the
+    data_error: the number of lines and valid values, of days with
+    more than one line or without any line, and the longest runs of NaN
+    lines and days. 'warnings' has the warnings about the station, just like
+    the 'dict' output of ehyd_reader.
+
+    Parameters
+    ----------
+    filename : str
+        path to and name of the file to be read
+    input_type : str
+        can be 'csv' for a CSV file or 'dat' for a DAT file
+    chunk_size : int
+        number of characters read and parsed at once
+    out_file : str
+        if given, the daily values get written to this csv file as soon as
+        they are complete instead of being returned, so even the daily
+        values never have to fit into memory. 'timeseries' is None then.
+
+    Examples
+    --------
+    # Daily means of a long dat file:
+    ehyd_dict = ehyd_read_daily('filename.dat')
+    ehyd_dict['timeseries'].level
+    # Write the daily values straight into a csv file:
+    ehyd_dict = ehyd_read_daily('filename.dat', out_file='daily.csv')
+    """
+    import numpy as np
+    import pandas as pd
+
+    table = []
+    f1 = _open_text(filename)
+    while True:
+        line = f1.readline()
+        if not line:
+            f1.close()
+            raise ValueError("No 'Werte:' line found, this doesn't look like "
+                             "an ehyd file.")
+        table.append(line)
+        if 'Werte:' in line:
+            break
+    # Only used to collect the warnings.
+    record = _new_record(filename)
+    header = _scan_header(table, input_type, record)
+    HZB = header.get('HZB')
+
+    stats = {'lines': 0, 'values': 0, 'days': 0, 'valid_days': 0,
+             'multiple_days': 0, 'missing_days': 0, 'nan_line_run': 0,
+             'nan_day_run': 0}
+    line_carry = 0
+    day_carry = 0
+    first_day = None
+    last_day = None  # the last day that has been put out
+    # The values of the last day of the previous chunk, which may continue
+    # in the next one.
+    pending = None
+    checked = False  # whether the values come at least once a day
+    written = []
+    leftover = ''
+    date_unit = 's'
+
+    def put_out(daily):
+        # Fill in the days without values, count and write them.
+        nonlocal first_day, last_day, day_carry
+        start = daily.index[0] if last_day is None else last_day + 1
+        daily = daily.reindex(np.arange(start, daily.index[-1] + 1))
+        daily[['count', 'lines']] = daily[['count', 'lines']].fillna(0)
+        if first_day is None:
+            first_day = start
+        last_day = daily.index[-1]
+        stats['days'] += len(daily)
+        stats['valid_days'] += int((daily['count'] > 0).sum())
+        stats['multiple_days'] += int((daily['lines'] > 1).sum())
+        stats['missing_days'] += int((daily['lines'] == 0).sum())
+        longest, day_carry = _longest_run(
+            (daily['count'] == 0).to_numpy(), day_carry)
+        stats['nan_day_run'] = max(stats['nan_day_run'], longest)
+
+        output = pd.DataFrame(
+            {'level': daily['sum'].where(daily['count'] > 0) / daily['count'],
+             'min': daily['min'], 'max': daily['max'],
+             'count': daily['count'].astype(np.int64)})
+        output.index = pd.DatetimeIndex(
+            daily.index.to_numpy().astype('datetime64[D]'),
+            name='date').as_unit(date_unit)
+        if out_file is None:
+            written.append(output)
+        else:
+            output.to_csv(out_file, sep=';', mode='w' if start == first_day
+                          else 'a', header=start == first_day)
+
+    while True:
+        text = f1.read(chunk_size)
+        at_end = not text
+        text = leftover + text
+        if not at_end:
+            # Only parse complete lines, the rest goes into the next chunk.
+            cut = text.rfind('\n') + 1
+            text, leftover = text[:cut], text[cut:]
+        if text.strip():
+            hydro_tS = _read_values(text, input_type)
+            hydro_tS.level = hydro_tS.level.astype(float)
+            # Use the same resolution for the days as ehyd_reader.
+            date_unit = hydro_tS.index.unit
+
+            isnan = hydro_tS.level.isna().to_numpy()
+            stats['lines'] += len(isnan)
+            stats['values'] += int((~isnan).sum())
+            longest, line_carry = _longest_run(isnan, line_carry)
+            stats['nan_line_run'] = max(stats['nan_line_run'], longest)
+
+            if pending is not None:
+                hydro_tS = pd.concat([pending, hydro_tS])
+            days = hydro_tS.index.values.astype('datetime64[D]').astype(
+                np.int64)
+            if not checked and len(days) > 1:
+                checked = True
+                step = np.median(np.diff(days))
+                if step > 1:
+                    f1.close()
+                    raise ValueError(
+                        '%s has a value every %d days, ehyd_read_daily is '
+                        'meant for values taken several times a day. Read '
+                        'it with ehyd_reader instead.' % (filename, step))
+            daily = _aggregate_daily(hydro_tS)
+            if last_day is not None and daily.index[0] <= last_day:
+                f1.close()
+                raise ValueError('The values in %s are not in chronological '
+                                 'order.' % filename)
+            # The last day might continue in the next chunk.
+            if len(daily) > 1:
+                put_out(daily.iloc[:-1])
+            pending = hydro_tS[days == daily.index[-1]]
+        if at_end:
+            break
+    f1.close()
+    if pending is None:
+        raise ValueError('No values in %s.' % filename)
+    put_out(_aggregate_daily(pending))
+
+    # The same checks as in ehyd_reader, based on the daily values.
+    data_error = 'no_error'
+    if stats['multiple_days'] > 0:
+        _note(record, 'resampled_daily',
+              'Station', HZB, 'has multiples measurements per day. \n',
+              'Resampled to daily.')
+        data_error = 'Irregular_measure_times_D'
+        real_length = stats['days']
+        NaN_number = stats['days'] - stats['valid_days']
+        consecutive_NaNs = stats['nan_day_run']
+    else:
+        lengthdifference = stats['days'] - stats['lines']
+        if lengthdifference != 0:
+            data_error = 'double_measurement'
+        if lengthdifference > 4:
+            data_error = 'gap_data'
+            _note(record, 'gap', 'there is a gap in the data, lengthdifference',
+                  lengthdifference, missing=int(lengthdifference))
+        real_length = stats['lines']
+        NaN_number = stats['lines'] - stats['values']
+        consecutive_NaNs = stats['nan_line_run']
+    min_year = int(str(np.datetime64(int(first_day), 'D'))[:4])
+    max_year = int(str(np.datetime64(int(last_day), 'D'))[:4])
+    if max_year - min_year < 5:
+        data_error = 'short_data'
+        _note(record, 'short_data', 'time series very short')
+    if min_year > 2010:
+        data_error = 'short_data'
+        _note(record, 'short_data', 'time series very short')
+    else:
+        if NaN_number > real_length / 10:
+            data_error = '10+percent_gap'
+            _note(record, 'nan_10_percent', '10 percent of data missing',
+                  nan=int(NaN_number))
+        if consecutive_NaNs > 14:
+            data_error = '14+dayGap'
+            _note(record, 'nan_run',
+                  'more than 14 consecutive NaN in daily data',
+                  longest=int(consecutive_NaNs))
+
+    if out_file is None:
+        daily = pd.concat(written)
+    else:
+        daily = None
+    output = _build_output(header, data_error, daily, 'dict',
+                           warnings=record['warnings'])
+    output['daily_stats'] = stats
+    return output
+
+
+class ReadStats:
+    """
+    Collects what happened while reading files: how long each stage took,
+    how many bytes and values there were and the warnings.
+
+    Pass it as stats to ehyd_reader, ehyd_reader_cached or ehyd_read_many.
+    For every file read, it gets a record, a plain dict with
+      * 'filename', 'HZB' and 'data_error' of the file,
+      * 'error', the error if the file couldn't be read (ehyd_read_many),
+        otherwise None,
+      * 'total', the time it took to read the file in seconds,
+      * 'stages', the seconds spent in each stage: 'read_file', 'header',
+        'parse' (the values), 'normalize', 'quality', 'checks' and 'output',
+        plus 'cache_read', 'update' and 'cache_write' for
+        ehyd_reader_cached,
+      * 'counts', the number of 'bytes', 'header_lines', 'rows' read and
+        'values' left after the checks, 'python_parser' if the values had to
+        be read by the python engine and 'cache_hit' for ehyd_reader_cached,
+      * 'warnings', a list of dicts with a short 'code' (e.g.
+        'station_moved', 'nan_run'), the 'message' (as in the output) and
+        details like the distance the station got moved ('meters').
+    Stages that didn't happen are missing from the record.
+
+    All records are kept in records. callback, if given, gets called with
+    every record as well, e.g. to send it to a monitoring system.
+    to_frame puts all records into a table and summary sums them up, e.g. to
+    find the files that take longest.
+
+    Examples
+    --------
+    stats = ReadStats()
+    stations, errors = ehyd_read_many('downloads/*.csv', stats=stats)
+    summary = stats.summary()
+    summary['stages']   # where the time went
+    summary['slowest']  # the files that took longest
+    # Write every record to a log file as json:
+    import json
+    log = open('ehyd_stats.jsonl', 'a')
+    stats = ReadStats(lambda record: log.write(json.dumps(record) + '\n'))
+    """
+
+    def __init__(self, callback=None):
+        self.records = []
+        self.callback = callback
+
+    def __call__(self, record):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return '<ReadStats of %d files>' % len(self.records)
+
+    def to_frame(self):
+        """
+        Returns a dataframe with one row per file: filename, HZB, data_error,
+        error, total, the seconds of each stage (NaN if it didn't happen),
+        the counts and the number of warnings.
+        """
+        import pandas as pd
+
+        rows = []
+        for record in self.records:
+            row = {'filename': record['filename'], 'HZB': record['HZB'],
+                   'data_error': record['data_error'],
+                   'error': record['error'], 'total': record['total']}
+            row.update(record['stages'])
+            row.update(record['counts'])
+            row['warnings'] = len(record['warnings'])
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def summary(self, top=10):
+        """
+        Sums up all records. Returns a dict with
+          * 'files', 'failed' and 'total', the number of files, how many of
+            them couldn't be read and the seconds it took to read all of them,
+          * 'stages', a dataframe with the total, mean and max seconds of
+            each stage and its share of the total time,
+          * 'counts', the sums of all counts,
+          * 'warnings', how often each warning code came up,
+          * 'slowest', the top files that took longest (see to_frame).
+        """
+        import pandas as pd
+
+        table = self.to_frame()
+        stage_names = []
+        counts = {}
+        warnings = {}
+        for record in self.records:
+            for stage in record['stages']:
+                if stage not in stage_names:
+                    stage_names.append(stage)
+            for name, value in record['counts'].items():
+                counts[name] = counts.get(name, 0) + value
+            for warning in record['warnings']:
+                warnings[warning['code']] = warnings.get(
+                    warning['code'], 0) + 1
+        total = float(table['total'].sum()) if len(table) else 0.0
+        stages = pd.DataFrame(
+            {'total': [table[name].sum() for name in stage_names],
+             'mean': [table[name].mean() for name in stage_names],
+             'max': [table[name].max() for name in stage_names]},
+            index=pd.Index(stage_names, name='stage'))
+        stages['share'] = stages['total'] / total if total else float('nan')
+        if len(table):
+            slowest = table.nlargest(top, 'total')
+            failed = int(table['error'].notna().sum())
+        else:
+            slowest = table
+            failed = 0
+        return {'files': len(table), 'failed': failed, 'total': total,
+                'stages': stages,
+                'counts': pd.Series(counts, dtype='int64'),
+                'warnings': pd.Series(warnings, dtype='int64').sort_values(
+                    ascending=False),
+                'slowest': slowest}
+
+
+def _run_jobs(function, jobs, workers=None, chunksize=8):
+    """
+    Runs function for every job in a pool of worker processes and returns
+    the results in the order of jobs. With a single worker or job, everything
+    runs in the current process.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers == 1 or len(jobs) < 2:
+        return [function(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, jobs, chunksize=chunksize))
+
+
+def _read_one(job):
+    """
+    Reads a single file for ehyd_read_many.
+
+    Lives on the module level, so it can be sent to the worker processes.
+    Returns the filename, the dataframe (or None), the error (or None) and,
+    if the last item of job is 'True', the record of reading the file (see
+    ReadStats, otherwise None).
+    The error is turned into a string, since not every exception survives
+    being sent back from a worker process.
+    """
+    filename, input_type, interpolate, parser, cache_dir, with_stats = job
+    # The records are sent back along with the dataframe, since the stats of
+    # the caller can't be used in a worker process.
+    records = []
+    stats = records.append if with_stats == 'True' else None
+    start = time.perf_counter()
+    try:
+        if cache_dir is None:
+            station_df = ehyd_reader(filename, 'df', input_type=input_type,
+                                     interpolate=interpolate, parser=parser,
+                                     stats=stats)
+        else:
+            station_df = ehyd_reader_cached(filename, 'df',
+                                            cache_dir=cache_dir,
+                                            input_type=input_type,
+                                            interpolate=interpolate,
+                                            parser=parser, stats=stats)
+    except Exception as error:
+        error = '%s: %s' % (type(error).__name__, error)
+        record = None
+        if stats is not None:
+            record = _new_record(filename)
+            record.update(error=error, total=time.perf_counter() - start)
+        return filename, None, error, record
+    return filename, station_df, None, records[0] if records else None
+
+
+def ehyd_read_each(files, input_type='csv', interpolate='False',
+                   parser='fast', workers=None, chunksize=8, cache_dir=None,
+                   stats=None):
+    """
+    Reads many ehyd files in parallel, each into a dataframe of its own.
+
+    Does the reading for ehyd_read_many, without putting the stations
+    together: each file is read with ehyd_reader(file, 'df') (or
+    ehyd_reader_cached) in a pool of worker processes. Useful to work
+    through many files a batch at a time, e.g. to write them somewhere,
+    without ever having all of them in memory.
+
+    Returns a list with a tuple (filename, dataframe, error) for every file,
+    in the order of files. The dataframe is None if the file couldn't be
+    read, the error is None if it could, else a short description.
+
+    Parameters
+    ----------
+    files : str or list of str
+        a list of files, or a glob pattern such as 'downloads/*.csv'
+    input_type, interpolate, parser : str
+        passed on to ehyd_reader
+    workers, chunksize, cache_dir, stats
+        see ehyd_read_many
+
+    Examples
+    --------
+    for filename, station_df, error in ehyd_read_each('downloads/*.csv'):
+        if error is None:
+            station_df.to_csv(filename + '.plain.csv')
+    """
+    import glob
+
+    if isinstance(files, str):
+        files = sorted(glob.glob(files))
+    with_stats = 'False' if stats is None else 'True'
+    jobs = [(filename, input_type, interpolate, parser, cache_dir, with_stats)
+            for filename in files]
+
+    results = []
+    for filename, station_df, error, record in _run_jobs(_read_one, jobs,
+                                                         workers, chunksize):
+        if record is not None:
+            stats(record)
+        results.append((filename, station_df, error))
+    return results
+
+
+def _check_joinable(station_df):
+    """
+    Raises a ValueError if station_df can't be lined up with the other
+    stations by ehyd_read_many: its dates have to be unique and without a
+    timezone, and its columns need the 20 levels of ehyd_reader.
+    """
+    import pandas as pd
+
+    if not isinstance(station_df.index, pd.DatetimeIndex):
+        raise ValueError('The index has %s instead of dates'
+                         % type(station_df.index).__name__)
+    if station_df.index.tz is not None:
+        raise ValueError('The dates have the timezone %s'
+                         % station_df.index.tz)
+    if not station_df.index.is_unique:
+        duplicated = station_df.index[station_df.index.duplicated()]
+        raise ValueError('%d dates appear more than once, the first is %s'
+                         % (len(duplicated), duplicated[0]))
+    if station_df.columns.nlevels != len(EHYD_LEVELS):
+        raise ValueError('The column header has %d levels instead of %d'
+                         % (station_df.columns.nlevels, len(EHYD_LEVELS)))
+
+
+def ehyd_read_many(files, input_type='csv', interpolate='False',
+                   parser='fast', workers=None, chunksize=8, cache_dir=None,
+                   output_type='df', scale=None, stats=None):
+    """
+    Reads many ehyd files in parallel and combines them into one dataframe.
+
+    Each file is read with ehyd_reader(file, 'df') in a pool of worker
+    processes (see ehyd_read_each). All stations are put together with a single concat at the
+    end, so the result has the same 20-level column MultiIndex as the output
+    of ehyd_reader, with one column per station.
+    Files that can't be read (e.g. because the HD number or the operator is
+    missing in the header) don't stop the whole batch. They're left out of
+    the dataframe and listed in the error report instead. The same goes for
+    stations that can't be lined up with the others for the dataframe, e.g.
+    with a date that appears twice (from an old cache entry, say).
+
+    Note that on Windows (and macOS), the code calling this needs to be
+    protected by an "if __name__ == '__main__':" block, since the worker
+    processes import the calling script.
+
+    Parameters
+    ----------
+    files : str or list of str
+        a list of files, or a glob pattern such as 'downloads/*.csv'
+    input_type : str
+        can be 'csv' for CSV files or 'dat' for DAT files
+    interpolate : bool
+        passed on to ehyd_reader
+    parser : str
+        passed on to ehyd_reader
+    workers : int
+        number of worker processes. Defaults to the number of CPUs. With 1,
+        everything is read in the current process.
+    chunksize : int
+        number of files handed to a worker process at once
+    cache_dir : str
+        if given, the files are read with ehyd_reader_cached, using this
+        directory for the cache
+    output_type : str
+        can be 'df' for a single dataframe with all stations or 'compact'
+        for CompactStations, which need a lot less memory
+    scale : int
+        for 'compact', store the values as integers, multiplied by scale
+        (see CompactStation)
+    stats : callable
+        e.g. a ReadStats, gets called with the record of every file (see
+        ReadStats), including the ones that couldn't be read, in the order
+        of files
+
+    Returns
+    -------
+    stations : DataFrame or CompactStations
+        all stations that could be read, in the order of files. For the
+        dataframe, attrs['warnings'] has the warnings of all files that had
+        any, by file (see ehyd_reader). Use stats to get them for
+        CompactStations.
+    errors : dict
+        the files that couldn't be read, with a short description of the
+        error
+
+    Examples
+    --------
+    # Read all files in the downloads folder with 4 processes:
+    stations, errors = ehyd_read_many('downloads/*.csv', workers=4)
+    """
+    import pandas as pd
+
+    results = ehyd_read_each(files, input_type, interpolate, parser, workers,
+                             chunksize, cache_dir, stats)
+
+    station_dfs = []
+    errors = {}
+    warnings = {}
+    for filename, station_df, error in results:
+        if error is None and output_type != 'compact':
+            try:
+                _check_joinable(station_df)
+            except ValueError as problem:
+                error = 'ValueError: %s' % problem
+        if error is None:
+            station_dfs.append(station_df)
+            if station_df.attrs.get('warnings'):
+                warnings[filename] = station_df.attrs['warnings']
+        else:
+            errors[filename] = error
+
+    if output_type == 'compact':
+        # Every station only keeps its own dates, no need to line them up.
+        stations = CompactStations.from_stations(
+            [CompactStation.from_dataframe(station_df, scale)
+             for station_df in station_dfs], scale)
+    elif station_dfs:
+        # One concat over all stations, instead of growing the dataframe one
+        # station at a time. The dates of all stations get sorted, just like
+        # when concatenating them one by one.
+        stations = pd.concat(station_dfs, axis=1, sort=True)
+    else:
+        stations = pd.DataFrame()
+    if output_type != 'compact':
+        stations.attrs['warnings'] = warnings
+    return stations, errors
+
+
+def _member_input_type(name):
+    """
+    Guesses the input_type of a file from its extension, ignoring the
+    extension of a compression ('314922.dat.gz').
+    """
+    stem, extension = os.path.splitext(name.lower())
+    if extension in _COMPRESSIONS:
+        extension = os.path.splitext(stem)[1]
+    return 'dat' if extension == '.dat' else 'csv'
+
+
+def _read_member(archive, name, content, output_type, input_type,
+                 interpolate, parser, quality, stats):
+    """
+    Reads a single file of an archive from its content, for
+    ehyd_read_archive. Returns the name, the output and the error (or None).
+    """
+    import importlib
+
+    try:
+        compression = _COMPRESSIONS.get(os.path.splitext(name)[1].lower())
+        if compression is not None:
+            content = importlib.import_module(compression).decompress(
+                content)
+        source = io.BytesIO(content)
+        # ehyd_reader names the source in its warnings and errors.
+        source.name = archive + '/' + name
+        output = ehyd_reader(
+            source, output_type,
+            input_type=input_type or _member_input_type(name),
+            interpolate=interpolate, parser=parser, quality=quality,
+            stats=stats)
+    except Exception as error:
+        return name, None, '%s: %s' % (type(error).__name__, error)
+    return name, output, None
+
+
+def ehyd_read_archive(archive, output_type='df', input_type=None,
+                      pattern='*', interpolate='False', parser='fast',
+                      quality='False', stats=None):
+    """
+    Reads all ehyd files in a zip or tar archive, one after the other.
+
+    The archive gets opened only once and every file gets decompressed only
+    once, straight into memory, so there is no need to extract the archive
+    first. Tar archives (also .tar.gz, .tar.xz, ...) get read in a single
+    pass.
+
+    Yields the name of each file, the output of ehyd_reader and None, or
+    the name, None and a short description of the error if it couldn't be
+    read.
+
+    A single file in a zip archive can also be read with ehyd_reader (or
+    ehyd_read_many, ...) by its path, e.g. 'bundle.zip/314922.csv', as well
+    as gzip, xz and bz2 compressed files, e.g. '314922.csv.gz'.
+
+    Parameters
+    ----------
+    archive : str
+        path to and name of the archive
+    output_type, interpolate, parser, quality, stats
+        see ehyd_reader
+    input_type : str
+        'csv' or 'dat', or None to tell by the extension of each file
+    pattern : str
+        only read the files matching this pattern, e.g. '*.dat'
+
+    Examples
+    --------
+    for name, ehyd_df, error in ehyd_read_archive('bundle.zip'):
+        if error is None:
+            print(name, ehyd_df.columns[0])
+    # Or all of them in one dataframe:
+    import pandas as pd
+    stations = pd.concat([ehyd_df for name, ehyd_df, error
+                          in ehyd_read_archive('bundle.tar.xz')
+                          if error is None], axis=1)
+    """
+    import fnmatch
+    import tarfile
+    import zipfile
+
+    options = (output_type, input_type, interpolate, parser, quality, stats)
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zip_file:
+            for info in zip_file.infolist():
+                if info.is_dir() or not fnmatch.fnmatch(info.filename,
+                                                        pattern):
+                    continue
+                yield _read_member(archive, info.filename,
+                                   zip_file.read(info), *options)
+    else:
+        # 'r|*' reads the (compressed) archive as a stream, from start to
+        # end, instead of jumping around in it.
+        with tarfile.open(archive, 'r|*') as tar_file:
+            for info in tar_file:
+                if not info.isfile() or not fnmatch.fnmatch(info.name,
+                                                            pattern):
+                    continue
+                content = tar_file.extractfile(info).read()
+                yield _read_member(archive, info.name, content, *options)
+
+
+# The formats ehyd_export can write, with the extension of their files.
+_EXPORT_FORMATS = {'csv': '.csv', 'npy': '.npy', 'feather': '.feather'}
+
+
+def _station_parts(station):
+    """
+    Splits the output of ehyd_reader for a single station ('df' or 'dict')
+    into its header (the metadata in EHYD_LEVELS), data_error, time series
+    (with a single 'level' column) and warnings.
+    """
+    import numpy as np
+
+    if isinstance(station, dict):
+        header = {level: station[level] for level in EHYD_LEVELS}
+        hydro_tS = station['timeseries'][['level']]
+        warnings = station.get('warnings', [])
+    else:
+        # The column header holds numpy values, turn them back into what
+        # ehyd_reader found in the header. station_move is a numpy float
+        # there as well.
+        header = {level: value.item() if hasattr(value, 'item') else value
+                  for level, value in zip(station.columns.names,
+                                          station.columns[0])}
+        if header['station_move'] != 'NaN':
+            header['station_move'] = np.float64(header['station_move'])
+        hydro_tS = station.iloc[:, [0]].set_axis(['level'], axis=1)
+        warnings = station.attrs.get('warnings', [])
+    data_error = header.pop('data_error')
+    return header, data_error, hydro_tS, warnings
+
+
+def _export_path(out_dir, header):
+    """
+    Returns the path of the json file ehyd_export writes for a station. The
+    files are named after its datatype and HZB, e.g. Groundwater_314922, as
+    the HZB alone isn't unique across datatypes (the same key as in
+    ehyd_store).
+    """
+    return os.path.join(out_dir, '%s_%s.json' % (header['datatype'],
+                                                 header['HZB']))
+
+
+def _write_export(out_dir, header, data_error, hydro_tS, warnings,
+                  file_format='csv'):
+    """
+    Writes a single station for ehyd_export: the values into
+    <datatype>_<HZB>.csv/.npy/.feather and everything else into
+    <datatype>_<HZB>.json. Returns the path of the json file.
+    """
+    import json
+    import numpy as np
+
+    json_path = _export_path(out_dir, header)
+    name = os.path.splitext(json_path)[0]
+    data_path = name + _EXPORT_FORMATS[file_format]
+    levels = hydro_tS.iloc[:, 0].to_numpy(dtype=float)
+    dates = hydro_tS.index.values
+
+    if file_format == 'csv':
+        # ehyd_reader leaves only whole days, so the time can be left out.
+        day_dates = dates.astype('datetime64[D]')
+        unit = 'D' if (day_dates == dates).all() else 's'
+        date_texts = np.datetime_as_string(dates, unit=unit).tolist()
+        # numpy writes the shortest text that gives back the exact same
+        # float, and is a lot quicker at it than to_csv.
+        level_texts = levels.astype(str)
+        level_texts[np.isnan(levels)] = ''
+        lines = [date + ',' + level + '\n'
+                 for date, level in zip(date_texts, level_texts.tolist())]
+        with open(data_path, 'w', encoding='utf-8') as f1:
+            f1.write('date,level\n')
+            f1.write(''.join(lines))
+    elif file_format == 'npy':
+        table = np.empty(len(levels), dtype=[('date', dates.dtype),
+                                             ('level', np.float64)])
+        table['date'] = dates
+        table['level'] = levels
+        np.save(data_path, table)
+    elif file_format == 'feather':
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        feather.write_feather(pa.table({'date': dates, 'level': levels}),
+                              data_path)
+    else:
+        raise ValueError("file_format has to be 'csv', 'npy' or 'feather', "
+                         "not %r." % file_format)
+
+    sidecar = {'format': file_format,
+               'data_file': os.path.basename(data_path),
+               'metadata': _typed_metadata(header, data_error),
+               'date_type': str(dates.dtype),
+               'freq': hydro_tS.index.freqstr,
+               'length': len(levels),
+               'warnings': list(warnings)}
+    with open(json_path, 'w', encoding='utf-8') as f1:
+        json.dump(sidecar, f1, indent=1)
+    return json_path
+
+
+def _export_one(job):
+    """
+    Reads a single file and exports it, for ehyd_export. Lives on the module
+    level, so it can be sent to the worker processes. Returns the filename,
+    the path of the json file written (or None) and the error (or None).
+    """
+    (filename, out_dir, file_format, input_type, interpolate, parser,
+     cache_dir) = job
+    try:
+        if cache_dir is None:
+            station = ehyd_reader(filename, 'dict', input_type=input_type,
+                                  interpolate=interpolate, parser=parser)
+        else:
+            station = ehyd_reader_cached(filename, 'dict',
+                                         cache_dir=cache_dir,
+                                         input_type=input_type,
+                                         interpolate=interpolate,
+                                         parser=parser)
+        json_path = _write_export(out_dir, *_station_parts(station),
+                                  file_format=file_format)
+    except Exception as error:
+        return filename, None, '%s: %s' % (type(error).__name__, error)
+    return filename, json_path, None
+
+
+def ehyd_export(stations, out_dir='ehyd_export', file_format='csv',
+                input_type='csv', interpolate='False', parser='fast',
+                workers=None, chunksize=8, cache_dir=None):
+    """
+    Writes stations into a simple format that is quick to read back in.
+
+    write_csv='True' of ehyd_reader writes a csv file with the whole
+    metadata as a 20 line header, which is slow to write and awkward to read
+    back in. Here, every station gets two files, named after its datatype
+    and HZB number (e.g. Groundwater_314922.csv and .json):
+      * the time series, as a plain csv file with two columns (date as
+        yyyy-mm-dd and level, empty for NaN), or as a binary file ('npy' for
+        numpy, 'feather' for pyarrow),
+      * a json file with the metadata, the warnings and what's needed to
+        restore the exact output of ehyd_reader.
+    ehyd_load reads a station back in and gives the same output as
+    ehyd_reader.
+
+    stations can be a list of files (or a pattern like 'downloads/*.csv'),
+    which get read and written in parallel by worker processes, each
+    taking chunksize files at a time. It can also be the output of
+    ehyd_reader ('df' or 'dict') or a list of those, or the dataframe of
+    ehyd_read_many. Since the stations in the latter share their dates, only
+    the dates from the first to the last valid value of each station get
+    written, and the warnings get lost.
+
+    Returns a dict with the files (or station names) that couldn't be read
+    or written, and a short description of the error. This includes
+    stations with the same datatype and HZB as one exported before them,
+    which would overwrite its files; only the first one gets exported.
+
+    Parameters
+    ----------
+    stations : str, list, DataFrame or dict
+        the files or stations to export
+    out_dir : str
+        the folder to write to, gets created if needed
+    file_format : str
+        can be 'csv' for csv files, 'npy' for numpy files or 'feather' for
+        feather files (needs pyarrow)
+    input_type, interpolate, parser
+        see ehyd_reader, used for reading files
+    workers : int
+        number of worker processes for reading files, see ehyd_read_many
+    chunksize : int
+        number of files handed to a worker process at once
+    cache_dir : str
+        cache to read the files with, see ehyd_reader_cached
+
+    Examples
+    --------
+    # Export all files in the downloads folder:
+    errors = ehyd_export('downloads/*.csv', 'exported', workers=4)
+    # and read one of them back in:
+    ehyd_df = ehyd_load('exported/Groundwater_314922.json', 'df')
+    """
+    import glob
+
+    os.makedirs(out_dir, exist_ok=True)
+    if isinstance(stations, str):
+        stations = sorted(glob.glob(stations))
+    if isinstance(stations, dict) or (hasattr(stations, 'columns')
+                                      and stations.shape[1] == 1):
+        stations = [stations]
+
+    errors = {}
+    # The file (or name and parts of the station) each json file was
+    # written for, to catch stations that would overwrite another one.
+    written = {}
+
+    def collision(json_path):
+        first = written[json_path]
+        return 'FileExistsError: same datatype and HZB as %s' % (
+            first if isinstance(first, str) else first[0]['station_name'])
+
+    if hasattr(stations, 'columns'):
+        for position in range(stations.shape[1]):
+            station_df = stations.iloc[:, [position]]
+            level = station_df.iloc[:, 0]
+            station_df = station_df.loc[level.first_valid_index():
+                                        level.last_valid_index()]
+            station_df.attrs = {}
+            header, data_error, hydro_tS, warnings = _station_parts(
+                station_df)
+            json_path = _export_path(out_dir, header)
+            if json_path in written:
+                errors[header['station_name']] = collision(json_path)
+                continue
+            try:
+                _write_export(out_dir, header, data_error, hydro_tS,
+                              warnings, file_format)
+            except (OSError, ValueError) as error:
+                errors[header['station_name']] = '%s: %s' % (
+                    type(error).__name__, error)
+            written[json_path] = (header,)
+        return errors
+
+    files = [station for station in stations
+             if not isinstance(station, dict)
+             and not hasattr(station, 'columns')]
+    for station in stations:
+        if isinstance(station, dict) or hasattr(station, 'columns'):
+            parts = _station_parts(station)
+            json_path = _export_path(out_dir, parts[0])
+            if json_path in written:
+                errors[parts[0]['station_name']] = collision(json_path)
+                continue
+            _write_export(out_dir, *parts, file_format=file_format)
+            written[json_path] = parts
+    jobs = [(filename, out_dir, file_format, input_type, interpolate, parser,
+             cache_dir) for filename in files]
+    # The files get written in parallel, so a later file with the same
+    # datatype and HZB may have overwritten the first one; export that one
+    # again in the end.
+    overwritten = set()
+    for filename, json_path, error in _run_jobs(_export_one, jobs, workers,
+                                                chunksize):
+        if error is not None:
+            errors[filename] = error
+        elif json_path in written:
+            errors[filename] = collision(json_path)
+            overwritten.add(json_path)
+        else:
+            written[json_path] = filename
+    for json_path in sorted(overwritten):
+        first = written[json_path]
+        if isinstance(first, str):
+            _export_one((first, out_dir, file_format, input_type,
+                         interpolate, parser, cache_dir))
+        else:
+            _write_export(out_dir, *first, file_format=file_format)
+    return errors
+
+
+def ehyd_load(filename, output_type='df'):
+    """
+    Reads a station written by ehyd_export.
+
+    Gives the exact same output as ehyd_reader gave for the original file,
+    including the warnings, in a fraction of the time.
+
+    Parameters
+    ----------
+    filename : str
+        the json file of the station (or its data file), e.g.
+        'exported/Groundwater_314922.json'
+    output_type : str
+        can be 'df', 'dict' or 'compact', see ehyd_reader
+
+    Examples
+    --------
+    ehyd_df = ehyd_load('exported/Groundwater_314922.json', 'df')
+    # Read all stations of a folder into one dataframe:
+    import glob
+    import pandas as pd
+    stations = pd.concat([ehyd_load(json_file) for json_file
+                          in sorted(glob.glob('exported/*.json'))], axis=1)
+    """
+    import json
+    import numpy as np
+    import pandas as pd
+
+    base = os.path.splitext(filename)[0]
+    with open(base + '.json', encoding='utf-8') as f1:
+        sidecar = json.load(f1)
+    header, data_error = _untyped_metadata(sidecar['metadata'])
+    data_path = os.path.join(os.path.dirname(base), sidecar['data_file'])
+
+    if sidecar['format'] == 'csv':
+        # round_trip gives back exactly the floats that got written.
+        table = pd.read_csv(data_path, engine='c', dtype={'date': str},
+                            float_precision='round_trip')
+        dates = table['date'].to_numpy().astype(sidecar['date_type'])
+        levels = table['level'].to_numpy(dtype=float)
+    elif sidecar['format'] == 'npy':
+        table = np.load(data_path)
+        dates = table['date']
+        levels = table['level']
+    else:
+        import pyarrow.feather as feather
+
+        table = feather.read_table(data_path)
+        dates = table['date'].to_numpy()
+        levels = table['level'].to_numpy()
+
+    hydro_tS = pd.DataFrame(
+        {'level': levels},
+        index=pd.DatetimeIndex(dates.astype(sidecar['date_type']),
+                               name='date'))
+    if sidecar['freq'] is not None:
+        hydro_tS.index.freq = sidecar['freq']
+    return _build_output(header, data_error, hydro_tS, output_type,
+                         warnings=sidecar['warnings'])
+
+
+# The size of each cache directory (in bytes) as far as this process knows
+# it, so the cache only gets looked through when it might be too large.
+_CACHE_SIZES = {}
+
+
+def _cache_files(cache_dir, prefix=''):
+    """
+    Returns the paths of the cache entries whose name starts with prefix.
+    """
+    import glob
+
+    return glob.glob(os.path.join(glob.escape(cache_dir),
+                                  glob.escape(prefix) + '*.feather'))
+
+
+def _file_size(path):
+    """
+    Returns the size of a file, or 0 if some other process deleted it.
+    """
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _known_cache_size(cache_dir):
+    """
+    Returns the size of the cache in cache_dir, counting it only the first
+    time this process sees the directory. After that, the size is kept up to
+    date with every entry written or deleted.
+    """
+    key = os.path.abspath(cache_dir)
+    if key not in _CACHE_SIZES:
+        _CACHE_SIZES[key] = sum(_file_size(path)
+                                for path in _cache_files(cache_dir))
+    return _CACHE_SIZES[key]
+
+
+def _change_cache_size(cache_dir, change):
+    """
+    Adds change (in bytes) to the known size of the cache in cache_dir.
+    """
+    key = os.path.abspath(cache_dir)
+    if key in _CACHE_SIZES:
+        _CACHE_SIZES[key] = max(_CACHE_SIZES[key] + change, 0)
+
+
+def _cache_prefix(filename):
+    """
+    Returns the part of the name all cache entries of a file start with,
+    which only depends on the path of the file.
+    """
+    import hashlib
+
+    path = os.path.abspath(filename)
+    return hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+
+
+def _cache_entry_names(filename, cache_key, input_type, interpolate):
+    """
+    Returns the prefix of all cache entries of a file and the name of the
+    cache entry for its current state.
+
+    The prefix only depends on the path of the file, so all entries of a file
+    can be found again. The rest of the name depends on size and modification
+    time of the file (cache_key='stat') or its content (cache_key='content')
+    and on the options that change the result of ehyd_reader.
+    """
+    import hashlib
+
+    prefix = _cache_prefix(filename)
+    if cache_key == 'content':
+        with _open_binary(filename) as f1:
+            state = hashlib.sha1(f1.read()).hexdigest()
+    else:
+        # A file in a zip archive changes along with the archive.
+        file_stat = os.stat(_split_member(filename)[0])
+        state = '%d-%d' % (file_stat.st_size, file_stat.st_mtime_ns)
+    state = '%s|%s|%s' % (state, input_type, interpolate)
+    entry = '%s-%s.feather' % (
+        prefix, hashlib.sha1(state.encode('utf-8')).hexdigest()[:16])
+    return prefix, entry
+
+
+def _typed_metadata(header, data_error):
+    """
+    Returns the metadata of a station (header and data_error) with the name
+    of the type of each value, so it can be stored as json and restored
+    exactly with _untyped_metadata.
+    """
+    metadata = dict(header, data_error=data_error)
+    return {key: [type(value).__name__, value]
+            for key, value in metadata.items()}
+
+
+def _untyped_metadata(typed_metadata):
+    """
+    Restores the header and the data_error stored with _typed_metadata.
+    """
+    import numpy as np
+
+    # The types the metadata of a station can have, so they can be restored
+    # exactly. station_move comes as a numpy float.
+    types = {'str': str, 'int': int, 'float': float, 'float64': np.float64}
+    header = {key: types[type_name](value)
+              for key, (type_name, value) in typed_metadata.items()}
+    data_error = header.pop('data_error')
+    return header, data_error
+
+
+def _write_cache_entry(entry_path, header, data_error, hydro_tS,
+                       source=None, warnings=None):
+    """
+    Stores the time series of a station as a feather file, with all the
+    metadata and the warnings in the metadata of the file. source (see
+    _source_state) tells ehyd_reader_cached where to continue reading if
+    values get appended to the file.
+    """
+    import json
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    typed_metadata = _typed_metadata(header, data_error)
+    table = pa.Table.from_pandas(hydro_tS)
+    schema_metadata = dict(table.schema.metadata)
+    schema_metadata[b'ehyd'] = json.dumps(typed_metadata).encode('utf-8')
+    # The frequency of the index gets lost on the way, so keep it as well.
+    if hydro_tS.index.freq is not None:
+        schema_metadata[b'ehyd_freq'] = hydro_tS.index.freqstr.encode('utf-8')
+    if source is not None:
+        schema_metadata[b'ehyd_source'] = json.dumps(source).encode('utf-8')
+    schema_metadata[b'ehyd_warnings'] = json.dumps(
+        list(warnings or [])).encode('utf-8')
+    table = table.replace_schema_metadata(schema_metadata)
+    # Write to a temporary file first, so other processes never see half a
+    # cache entry.
+    temp_path = '%s.%d.tmp' % (entry_path, os.getpid())
+    feather.write_feather(table, temp_path)
+    os.replace(temp_path, entry_path)
+
+
+# What reading a broken cache entry raises: OSError and ValueError (which
+# pyarrow.ArrowInvalid is) for a damaged file, KeyError for a feather file
+# without the metadata of ehyd_reader.
+_CACHE_ERRORS = (OSError, ValueError, KeyError)
+
+
+def _read_cache_entry(entry_path):
+    """
+    Reads a cache entry written by _write_cache_entry and returns the header,
+    the data_error and the time series, just like _read_station, and the
+    warnings. Raises one of _CACHE_ERRORS if the entry is broken.
+    """
+    import json
+    import pyarrow.feather as feather
+
+    table = feather.read_table(entry_path)
+    schema_metadata = table.schema.metadata or {}
+    header, data_error = _untyped_metadata(
+        json.loads(schema_metadata[b'ehyd']))
+    hydro_tS = table.to_pandas()
+    if b'ehyd_freq' in schema_metadata:
+        hydro_tS.index.freq = schema_metadata[b'ehyd_freq'].decode()
+    # Entries written before the warnings were kept don't have them.
+    warnings = json.loads(schema_metadata.get(b'ehyd_warnings', b'[]'))
+    return header, data_error, hydro_tS, warnings
+
+
+def _read_cache_source(entry_path):
+    """
+    Returns the source stored with a cache entry (see _source_state) or None,
+    without reading the time series.
+    """
+    import json
+    import pyarrow as pa
+
+    with pa.memory_map(entry_path) as source_file:
+        schema_metadata = pa.ipc.open_file(source_file).schema.metadata or {}
+    if b'ehyd_source' not in schema_metadata:
+        return None
+    return json.loads(schema_metadata[b'ehyd_source'])
+
+
+# Number of bytes at the end of the values that have to stay the same for a
+# file to count as appended to.
+_SOURCE_TAIL = 1024
+
+
+def _source_state(filename):
+    """
+    Takes the state of a file, so _read_appended can tell later on whether
+    values have only been appended to it: its size and hashes of the header
+    and of the last _SOURCE_TAIL bytes. Only those parts of the file get
+    read.
+
+    Returns None if the file doesn't end with a line break, since its last
+    line might be incomplete.
+    """
+    import hashlib
+
+    header_sha1 = hashlib.sha1()
+    with _open_binary(filename) as f1:
+        while True:
+            line = f1.readline()
+            if not line:
+                return None
+            header_sha1.update(line)
+            if b'Werte:' in line:
+                break
+        header_end = f1.tell()
+        size = f1.seek(0, 2)
+        tail_start = max(header_end, size - _SOURCE_TAIL)
+        f1.seek(tail_start)
+        tail = f1.read()
+    if not tail.endswith(b'\n'):
+        return None
+    return {'size': size, 'header_end': header_end,
+            'header_sha1': header_sha1.hexdigest(), 'tail_start': tail_start,
+            'tail_sha1': hashlib.sha1(tail).hexdigest()}
+
+
+def _read_appended(filename, source):
+    """
+    Returns the text that got appended to a file since source was taken (see
+    _source_state), or None if the file changed in any other way.
+
+    Only the header, the last bytes before the appended text and the
+    appended text itself get read, so changes to older values in between
+    go unnoticed.
+    """
+    import hashlib
+
+    with _open_binary(filename) as f1:
+        if f1.seek(0, 2) < source['size']:
+            return None
+        f1.seek(0)
+        header = f1.read(source['header_end'])
+        if hashlib.sha1(header).hexdigest() != source['header_sha1']:
+            return None
+        f1.seek(source['tail_start'])
+        tail = f1.read(source['size'] - source['tail_start'])
+        if hashlib.sha1(tail).hexdigest() != source['tail_sha1']:
+            return None
+        appended = f1.read()
+    # Decode it just like reading the file in text mode does.
+    return _decode(appended)
+
+
+def _check_appendable(filename, header, hydro_tS, input_type, interpolate,
+                      record=None):
+    """
+    Checks the time series as read from a file (see _check_station). If the
+    checks left it as it was, values appended to the file later on can just
+    be appended to it as well, so the source of the file gets taken for the
+    cache entry. Otherwise, the source is None.
+    """
+    raw_index = hydro_tS.index
+    data_error, hydro_tS, report = _check_station(header, hydro_tS,
+                                                  input_type, interpolate,
+                                                  record=record)
+    source = None
+    if interpolate != 'True' and hydro_tS.index.equals(raw_index.normalize()):
+        source = _source_state(filename)
+    if source is not None:
+        source.update(input_type=input_type, interpolate=interpolate)
+    return data_error, hydro_tS, source
+
+
+# The codes of the warnings about the header. These stay the same when values
+# get appended to a file, the warnings about the values get found again.
+_HEADER_WARNINGS = ('station_moved', 'missing_coords', 'moved_4_times',
+                    'unknown_move', 'move_distance')
+
+
+def _update_station(cache_dir, prefix, filename, input_type, interpolate,
+                    parser, record=None):
+    """
+    Brings an older cache entry of a file up to date, by reading only the
+    values that got appended to the file since and checking the whole time
+    series again.
+
+    Returns the header, data_error, time series and the new source, or None
+    if there is no fitting entry or the file changed in any other way.
+    The time of reading the entry and the new values is counted as stage
+    'update' of record (see ReadStats), and the warnings of the new time
+    series get added to it.
+    """
+    start = time.perf_counter()
+    import pandas as pd
+
+    for entry_path in _cache_files(cache_dir, prefix):
+        try:
+            source = _read_cache_source(entry_path)
+        except _CACHE_ERRORS:
+            # Broken entries are of no use, and get removed along with the
+            # other old entries of the file.
+            continue
+        if (source is None or source['input_type'] != input_type
+                or source['interpolate'] != interpolate):
+            continue
+        appended = _read_appended(filename, source)
+        if appended is None:
+            return None
+        try:
+            header, data_error, hydro_tS, warnings = _read_cache_entry(
+                entry_path)
+        except _CACHE_ERRORS:
+            break
+        if record is not None:
+            record['warnings'] += [warning for warning in warnings
+                                   if warning['code'] in _HEADER_WARNINGS]
+        if appended.strip():
+            hydro_tS = pd.concat([hydro_tS, _read_values(appended, input_type,
+                                                         parser, record)])
+        _lap(record, 'update', start)
+        data_error, hydro_tS, source = _check_appendable(
+            filename, header, hydro_tS, input_type, interpolate, record)
+        return header, data_error, hydro_tS, source
+    _lap(record, 'update', start)
+    return None
+
+
+def _trim_cache(cache_dir, max_cache_size):
+    """
+    Deletes the least recently used cache entries until the cache is smaller
+    than max_cache_size bytes.
+
+    Only looks through the cache if its known size (see _known_cache_size)
+    is too large. Other processes writing to the same cache are not counted
+    until then, so the cache can get somewhat larger than max_cache_size
+    while several processes fill it.
+    """
+    if _known_cache_size(cache_dir) <= max_cache_size:
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.feather'):
+            entry_stat = entry.stat()
+            entries.append((entry_stat.st_mtime, entry_stat.st_size,
+                            entry.path))
+    cache_size = sum(entry[1] for entry in entries)
+    # Oldest first. The modification time gets updated on every cache hit.
+    for mtime, size, path in sorted(entries):
+        if cache_size <= max_cache_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Some other process was quicker.
+            pass
+        cache_size -= size
+    _CACHE_SIZES[os.path.abspath(cache_dir)] = cache_size
+
+
+def ehyd_reader_cached(filename, output_type, cache_dir='ehyd_cache',
+                       max_cache_size=2**30, cache_key='stat',
+                       write_csv='False', input_type='csv',
+                       interpolate='False', parser='fast', update='False',
+                       stats=None):
+    """
+    Same as ehyd_reader, but keeps the results in a cache on disk.
+
+    The first time a file is read, the time series and all the metadata get
+    stored in cache_dir as a feather file. As long as the file doesn't
+    change, the next call reads only this feather file, skipping the header
+    and the data parsing completely, and gives the exact same output as
+    ehyd_reader. The warnings get stored as well, but they don't go to the
+    logger again in this case.
+
+    By default, a file counts as changed when its size or modification time
+    changes. Use cache_key='content' to compare the content of the files
+    instead, which is slower, but survives copying the files around.
+    If the cache grows larger than max_cache_size bytes, the least recently
+    used entries get deleted. Use clear_ehyd_cache to get rid of entries
+    yourself.
+
+    Files downloaded again from ehyd usually only got some new values at their
+    end. With update='True', an older cache entry of such a file gets brought
+    up to date by reading only the new values, instead of the whole file.
+    The data_error gets determined again for the whole time series. This only
+    works if the header of the file and the last values before the new ones
+    are unchanged (changes to older values in between are not noticed) and
+    if ehyd_reader left the time series as it was read, i.e. without
+    interpolating, removing duplicates or resampling. Otherwise, the whole
+    file gets read.
+
+    Needs pyarrow to store the cache.
+
+    Parameters
+    ----------
+    filename : str
+        path to and name of the file to be read
+    output_type : str
+        can be 'df' for a dataframe as output or 'dict" for a dictionary
+    cache_dir : str
+        the directory the cache is kept in. Gets created if necessary.
+    max_cache_size : int
+        the maximum size of the cache, in bytes
+    cache_key : str
+        can be 'stat' to use size and modification time of the file or
+        'content' to use its content to find out if it changed
+    write_csv, input_type, interpolate, parser
+        see ehyd_reader
+    update : bool
+        if 'True', only the values appended to a file since it was cached
+        get read, if possible
+    stats : callable
+        see ehyd_reader. The record tells whether the file came from the
+        cache ('cache_hit' in its counts), and has the stages 'cache_read',
+        'update' and 'cache_write' besides those of ehyd_reader.
+
+    Examples
+    --------
+    # Read in a csv file, which is much quicker the second time:
+    ehyd_df = ehyd_reader_cached('filename.csv', 'df', cache_dir='cache')
+    # After downloading the file again, only read the new values:
+    ehyd_df = ehyd_reader_cached('filename.csv', 'df', cache_dir='cache',
+                                 update='True')
+    """
+    import importlib.util
+
+    if importlib.util.find_spec('pyarrow') is None:
+        raise ImportError('ehyd_reader_cached needs pyarrow to store the '
+                          'cache. Use ehyd_reader instead or install pyarrow.')
+
+    record = _new_record(filename)
+    first = start = time.perf_counter()
+    os.makedirs(cache_dir, exist_ok=True)
+    prefix, entry = _cache_entry_names(filename, cache_key, input_type,
+                                       interpolate)
+    entry_path = os.path.join(cache_dir, entry)
+    try:
+        header, data_error, hydro_tS, warnings = _read_cache_entry(entry_path)
+    except FileNotFoundError:
+        pass
+    except _CACHE_ERRORS as error:
+        # A broken entry (e.g. cut short when the disk ran full, or written
+        # by another program) counts as missing and gets written anew.
+        _debug('Unreadable cache entry %s for %s: %s', entry_path, filename,
+               error)
+        _remove_cache_entries(cache_dir, entry)
+    else:
+        # Mark the entry as recently used.
+        os.utime(entry_path)
+        start = _lap(record, 'cache_read', start)
+        record['warnings'] = warnings
+        output = _build_output(header, data_error, hydro_tS, output_type,
+                               write_csv, warnings)
+        if stats is not None:
+            _lap(record, 'output', start)
+            record.update(HZB=header.get('HZB'), data_error=data_error,
+                          total=time.perf_counter() - first)
+            record['counts'].update(cache_hit=1, values=len(hydro_tS))
+            stats(record)
+        return output
+    start = _lap(record, 'cache_read', start)
+
+    updated = None
+    if update == 'True':
+        updated = _update_station(cache_dir, prefix, filename, input_type,
+                                  interpolate, parser, record)
+    if updated is None:
+        header, hydro_tS = _read_raw(filename, input_type, parser, record)
+        data_error, hydro_tS, source = _check_appendable(
+            filename, header, hydro_tS, input_type, interpolate, record)
+    else:
+        header, data_error, hydro_tS, source = updated
+    start = time.perf_counter()
+    _known_cache_size(cache_dir)
+    # Entries of older versions of the file are of no use anymore.
+    _remove_cache_entries(cache_dir, prefix)
+    _write_cache_entry(entry_path, header, data_error, hydro_tS, source,
+                       record['warnings'])
+    _change_cache_size(cache_dir, _file_size(entry_path))
+    _trim_cache(cache_dir, max_cache_size)
+    start = _lap(record, 'cache_write', start)
+    output = _build_output(header, data_error, hydro_tS, output_type,
+                           write_csv, record['warnings'])
+    if stats is not None:
+        _lap(record, 'output', start)
+        record.update(HZB=header.get('HZB'),
+                      total=time.perf_counter() - first)
+        record['counts']['cache_hit'] = 0
+        stats(record)
+    return output
+
+
+def _remove_cache_entries(cache_dir, prefix):
+    """
+    Deletes all cache entries whose name starts with prefix.
+    """
+    for path in _cache_files(cache_dir, prefix):
+        size = _file_size(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        _change_cache_size(cache_dir, -size)
+
+
+def clear_ehyd_cache(cache_dir='ehyd_cache', filename=None):
+    """
+    Deletes the cache entries of a file or the whole cache of
+    ehyd_reader_cached.
+
+    Parameters
+    ----------
+    cache_dir : str
+        the directory the cache is kept in
+    filename : str
+        the file whose entries should be deleted. If None, all entries are
+        deleted.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    if filename is None:
+        prefix = ''
+    else:
+        prefix = _cache_prefix(filename)
+    _remove_cache_entries(cache_dir, prefix)
+    if filename is None:
+        _CACHE_SIZES.pop(os.path.abspath(cache_dir), None)
+
+
+# The columns of the station catalog that hold numbers. Everything else is
+# kept as text, apart from the columns in EHYD_CATEGORIES, which only have a
+# few different values and become categories in metadata_table.
+_CATALOG_NUMBERS = ['lat', 'lon', 'station_move', 'elev', 'depth', 'teufe',
+                    'catchment_size']
+EHYD_CATEGORIES = ['datatype', 'catchment_symbol', 'region_name',
+                   'province', 'operator', 'meta_error']
+
+
+def _read_header_one(job):
+    """
+    Reads the header of a single file for ehyd_catalog. Returns the
+    filename, the metadata (or None) and the error (or None).
+    """
+    filename, input_type = job
+    try:
+        header = parse_header(filename, input_type)
+    except Exception as error:
+        return filename, None, '%s: %s' % (type(error).__name__, error)
+    return filename, header, None
+
+
+def metadata_table(rows, columns=None):
+    """
+    Turns the metadata of many stations into a dataframe with proper types,
+    as in ehyd_catalog and CompactStations: HZB as integer, the numbers
+    (lat, lon, catchment_size, ...) as floats with NaN for missing values
+    and the columns in EHYD_CATEGORIES as categories.
+
+    Parameters
+    ----------
+    rows : list
+        the metadata of every station, as a list of values in the order of
+        columns or as a dict, e.g. the header of ehyd_reader or parse_header
+    columns : list
+        the columns of rows, need to include EHYD_LEVELS apart from
+        data_error. Default to the ones of ehyd_catalog.
+    """
+    import pandas as pd
+
+    if columns is None:
+        columns = ['file', 'size', 'mtime'] + [level for level in EHYD_LEVELS
+                                               if level != 'data_error']
+    catalog = pd.DataFrame(rows, columns=columns)
+    catalog['HZB'] = pd.to_numeric(catalog['HZB'],
+                                   errors='coerce').astype('Int64')
+    # catchment_size is written the german way, e.g. '4.360,1'.
+    catalog['catchment_size'] = (catalog['catchment_size'].astype(str)
+                                 .str.strip()
+                                 .str.replace('.', '', regex=False)
+                                 .str.replace(',', '.', regex=False))
+    for column in _CATALOG_NUMBERS:
+        # 'NaN' strings become proper NaN.
+        catalog[column] = pd.to_numeric(catalog[column], errors='coerce')
+    for column in EHYD_CATEGORIES:
+        # parse_header fills in 'NaN' for missing text as well, make it a
+        # missing value instead of a category of its own.
+        values = catalog[column]
+        catalog[column] = values.where(values != 'NaN').astype('category')
+    for column in ['size', 'mtime']:
+        if column in catalog:
+            catalog[column] = catalog[column].astype('int64')
+    return catalog
+
+
+def ehyd_catalog(directory, catalog_file='ehyd_catalog.feather',
+                 pattern='*.csv', input_type='csv', workers=None,
+                 chunksize=32):
+    """
+    Builds a table of the metadata of all ehyd files in a directory.
+
+    Only the headers of the files get read (see parse_header), in parallel.
+    The catalog has one row per file, with the path, size and modification
+    time of the file and the metadata found in its header. Numbers (e.g.
+    lat, lon, elev, teufe and catchment_size) are stored as floats, the HZB
+    as integer and missing values as NaN, so the catalog can be used to
+    select stations without reading them, e.g. with
+    catalog.query("datatype == 'Groundwater' and catchment_symbol == 'MUR'
+    and elev > 400").
+
+    The catalog gets stored as a feather file in the directory (needs
+    pyarrow). The next time, only files that are new or have changed get
+    read, and files that are gone get removed from the catalog.
+
+    Parameters
+    ----------
+    directory : str
+        the directory containing the ehyd files
+    catalog_file : str
+        name of the file the catalog gets stored in, relative to directory.
+        Use None to not store the catalog.
+    pattern : str
+        glob pattern of the files to be included
+    input_type : str
+        can be 'csv' for CSV files or 'dat' for DAT files
+    workers : int
+        number of worker processes. Defaults to the number of CPUs.
+    chunksize : int
+        number of files handed to a worker process at once
+
+    Returns
+    -------
+    catalog : DataFrame
+        one row per file, sorted by the path of the file
+    errors : dict
+        the files whose header couldn't be read, with a short description
+        of the error
+
+    Examples
+    --------
+    catalog, errors = ehyd_catalog('downloads')
+    mur_wells = catalog.query("datatype == 'Groundwater' and "
+                              "catchment_symbol == 'MUR' and elev > 400")
+    stations, errors = ehyd_read_many(list(mur_wells.file))
+    """
+    import glob
+    import pandas as pd
+
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+    if catalog_file is not None:
+        catalog_path = os.path.join(directory, catalog_file)
+        files = [filename for filename in files
+                 if os.path.abspath(filename) != os.path.abspath(catalog_path)]
+
+    file_stats = {}
+    for filename in files:
+        file_stat = os.stat(filename)
+        file_stats[filename] = (file_stat.st_size, file_stat.st_mtime_ns)
+
+    known_rows = None
+    if catalog_file is not None and os.path.exists(catalog_path):
+        old_catalog = pd.read_feather(catalog_path)
+        # Keep the rows of files that didn't change.
+        unchanged = [file_stats.get(filename) == (size, mtime)
+                     for filename, size, mtime in zip(old_catalog['file'],
+                                                      old_catalog['size'],
+                                                      old_catalog['mtime'])]
+        known_rows = old_catalog[unchanged]
+    known_files = set() if known_rows is None else set(known_rows['file'])
+
+    jobs = [(filename, input_type) for filename in files
+            if filename not in known_files]
+    results = _run_jobs(_read_header_one, jobs, workers, chunksize)
+
+    new_rows = []
+    errors = {}
+    for filename, header, error in results:
+        if error is None:
+            size, mtime = file_stats[filename]
+            new_rows.append(dict(header, file=filename, size=size,
+                                 mtime=mtime))
+        else:
+            errors[filename] = error
+
+    catalog = metadata_table(new_rows)
+    if known_rows is not None:
+        catalog = pd.concat([known_rows, catalog], ignore_index=True)
+        # Concatenating categories only keeps them if they're the same, so
+        # set them up again (without the 'NaN' of older catalog files).
+        for column in EHYD_CATEGORIES:
+            values = catalog[column].astype(object)
+            catalog[column] = values.where(values != 'NaN').astype(
+                'category')
+    catalog = catalog.sort_values('file').reset_index(drop=True)
+
+    if catalog_file is not None:
+        catalog.to_feather(catalog_path)
+    return catalog, errors
@@ -0,0 +1,242 @@
+#coding=UTF-8
+"""
+Spatial queries across many ehyd stations.
+
+Put this file next to ehyd_reader.py to use it. The stations get sorted into
+a grid of cells on their coordinates, so a query only has to calculate the
+distances to the stations in the cells around the point it's looking at.
+"""
+import numpy as np
+
+from ehyd_reader import haversine
+
+# Radius of the earth in meters, as used by haversine.
+_EARTH_RADIUS = 6371 * 1000
+
+
+class StationIndex:
+    """
+    Spatial index of stations, for radius and nearest neighbour queries.
+
+    The stations are put into cells of cell_size degrees (latitude and
+    longitude). All distances are in meters and get calculated with the
+    haversine formula, just like the station_move of ehyd_reader.
+    Stations without coordinates (NaN) are left out.
+
+    Parameters
+    ----------
+    lat, lon : array-like
+        coordinates of the stations in decimal degrees, as they come out of
+        ehyd_reader or ehyd_catalog
+    ids : array-like
+        identifiers of the stations, e.g. the HZB numbers. Defaults to
+        0, 1, 2, ...
+    cell_size : float
+        size of the grid cells in degrees. The default of 0.1 degrees is
+        around 11 km north-south and 7.5 km east-west in Austria.
+
+    Examples
+    --------
+    # All precipitation stations within 15 km of groundwater well 314922:
+    catalog, errors = ehyd_catalog('downloads')
+    precip = StationIndex.from_catalog(
+        catalog.query("datatype == 'Precipitation'"))
+    well = catalog.set_index('HZB').loc[314922]
+    precip.within(well.lat, well.lon, 15000)
+    """
+
+    def __init__(self, lat, lon, ids=None, cell_size=0.1):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        if ids is None:
+            ids = np.arange(len(lat))
+        ids = np.asarray(ids)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        self.cell_size = cell_size
+
+        # Sort the stations by their cell, so all stations of a cell follow
+        # each other and can be found with a single searchsorted.
+        lat_cells = np.floor(lat[valid] / cell_size).astype(np.int64)
+        lon_cells = np.floor(lon[valid] / cell_size).astype(np.int64)
+        # Number of cells around the globe, plus some margin, so every pair of
+        # latitude and longitude cell gets a key of its own.
+        self._lon_cells_total = int(np.ceil(360 / cell_size)) + 2
+        cells = self._cell_key(lat_cells, lon_cells)
+        order = np.argsort(cells, kind='stable')
+        self._cells = cells[order]
+        self.lat = lat[valid][order]
+        self.lon = lon[valid][order]
+        self.ids = ids[valid][order]
+
+    @classmethod
+    def from_catalog(cls, catalog, id_column='HZB', cell_size=0.1):
+        """
+        Builds the index from a station catalog (see ehyd_catalog) or any
+        other dataframe with 'lat' and 'lon' columns.
+        """
+        return cls(catalog['lat'], catalog['lon'], catalog[id_column],
+                   cell_size=cell_size)
+
+    @classmethod
+    def from_dataframe(cls, stations, id_level='HZB', cell_size=0.1):
+        """
+        Builds the index from a dataframe with the column MultiIndex of
+        ehyd_reader, e.g. the output of ehyd_read_many.
+        """
+        columns = stations.columns
+        return cls(columns.get_level_values('lat'),
+                   columns.get_level_values('lon'),
+                   columns.get_level_values(id_level), cell_size=cell_size)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell_key(self, lat_cells, lon_cells):
+        return lat_cells * self._lon_cells_total + lon_cells
+
+    def _candidates(self, lat, lon, radius):
+        """
+        Finds the stations in the cells that are touched by a circle of
+        radius meters around each of the points lat, lon (arrays). Returns
+        the number of the point and the position of the station for every
+        pair, sorted by point and then position, without duplicates.
+        """
+        lat_radius = np.degrees(radius / _EARTH_RADIUS)
+        lat_min = np.maximum(lat - lat_radius, -90.0)
+        lat_max = np.minimum(lat + lat_radius, 90.0)
+        # Degrees of longitude get shorter towards the poles.
+        widest = np.cos(np.radians(np.maximum(np.abs(lat_min),
+                                              np.abs(lat_max))))
+        with np.errstate(divide='ignore'):
+            lon_radius = np.where(widest > 0, lat_radius / widest, np.inf)
+        everywhere = lon_radius >= 180
+        lon_radius = np.where(everywhere, 0.0, lon_radius)
+
+        # The ranges of longitude to look at, up to three per point: the
+        # circle itself, and the parts of it that wrap around the date line.
+        points = np.arange(len(lat))
+        west = lon - lon_radius
+        east = lon + lon_radius
+        wraps_west = ~everywhere & (west < -180)
+        wraps_east = ~everywhere & (east > 180)
+        range_points = np.concatenate(
+            [points, points[wraps_west], points[wraps_east]])
+        lon_starts = np.concatenate([
+            np.where(everywhere, -180.0, np.maximum(west, -180.0)),
+            west[wraps_west] + 360, np.full(wraps_east.sum(), -180.0)])
+        lon_ends = np.concatenate([
+            np.where(everywhere, 180.0, np.minimum(east, 180.0)),
+            np.full(wraps_west.sum(), 180.0), east[wraps_east] - 360])
+        lon_first = np.floor(lon_starts / self.cell_size).astype(np.int64)
+        # None at all for a negative radius.
+        n_lon = np.maximum(np.floor(lon_ends / self.cell_size).astype(
+            np.int64) - lon_first + 1, 0)
+        lat_first = np.floor(lat_min / self.cell_size).astype(np.int64)
+        n_lat = np.maximum(np.floor(lat_max / self.cell_size).astype(
+            np.int64) - lat_first + 1, 0)[range_points]
+        lat_first = lat_first[range_points]
+
+        # Every cell of every range: the cells of a range are numbered
+        # row by row, with n_lon cells in each row.
+        n_cells = n_lat * n_lon
+        cell_ranges = np.repeat(np.arange(len(range_points)), n_cells)
+        cell_numbers = (np.arange(n_cells.sum())
+                        - np.repeat(np.cumsum(n_cells) - n_cells, n_cells))
+        lat_cells = lat_first[cell_ranges] + cell_numbers // n_lon[cell_ranges]
+        lon_cells = lon_first[cell_ranges] + cell_numbers % n_lon[cell_ranges]
+        # Look up where each cell starts and ends in the sorted cells.
+        keys = self._cell_key(lat_cells, lon_cells)
+        starts = np.searchsorted(self._cells, keys, side='left')
+        counts = np.searchsorted(self._cells, keys, side='right') - starts
+        pair_points = np.repeat(range_points[cell_ranges], counts)
+        positions = (np.repeat(starts - np.cumsum(counts) + counts, counts)
+                     + np.arange(counts.sum()))
+        # The ranges of a point can share a cell at their edges.
+        n_stations = max(len(self), 1)
+        pairs = np.unique(pair_points * n_stations + positions)
+        return pairs // n_stations, pairs % n_stations
+
+    def within(self, lat, lon, radius):
+        """
+        Finds all stations within radius meters of a point.
+
+        Returns a Series with the distances in meters, indexed by the ids of
+        the stations and sorted from the closest to the farthest station.
+        """
+        import pandas as pd
+
+        positions = self._candidates(np.array([lat], dtype=float),
+                                     np.array([lon], dtype=float), radius)[1]
+        distances = haversine(lat, lon, self.lat[positions],
+                              self.lon[positions])
+        inside = distances <= radius
+        positions = positions[inside]
+        distances = distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return pd.Series(distances[order], index=self.ids[positions][order],
+                         name='distance')
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Finds the k stations closest to a point.
+
+        Returns a Series with the distances in meters, indexed by the ids of
+        the stations and sorted from the closest to the farthest station.
+        """
+        k = min(k, len(self))
+        if k == 0:
+            return self.within(lat, lon, -1.0)
+        # Start with the size of a cell and widen the search until there are
+        # enough stations inside. Every station within the radius is found,
+        # so the k closest of them are the k closest overall.
+        radius = self.cell_size * np.pi / 180 * _EARTH_RADIUS
+        while True:
+            found = self.within(lat, lon, radius)
+            if len(found) >= k or radius > np.pi * _EARTH_RADIUS:
+                return found.iloc[:k]
+            radius *= 2
+
+    def pairs(self, lat, lon, radius, query_ids=None):
+        """
+        Finds all stations within radius meters of each of many points.
+
+        Useful to pair e.g. groundwater wells with the precipitation stations
+        around them. Returns a dataframe with one row per pair, with the
+        columns 'query' (the ids of the points, see query_ids), 'station'
+        and 'distance' (in meters).
+
+        Parameters
+        ----------
+        lat, lon : array-like
+            coordinates of the points
+        radius : float
+            the search radius in meters
+        query_ids : array-like
+            identifiers of the points. Defaults to 0, 1, 2, ...
+        """
+        import pandas as pd
+
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        if query_ids is None:
+            query_ids = np.arange(len(lat))
+        query_ids = np.asarray(query_ids)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        query_ids = query_ids[valid]
+        lat = lat[valid]
+        lon = lon[valid]
+        # All points at once: the candidates in the cells around every
+        # point, and their distances in a single go.
+        points, positions = self._candidates(lat, lon, radius)
+        distances = haversine(lat[points], lon[points], self.lat[positions],
+                              self.lon[positions])
+        inside = distances <= radius
+        points = points[inside]
+        positions = positions[inside]
+        distances = distances[inside]
+        # In the order of the points, each from the closest to the farthest
+        # station, as within has them.
+        order = np.lexsort((positions, distances, points))
+        return pd.DataFrame({'query': query_ids[points][order],
+                             'station': self.ids[positions][order],
+                             'distance': distances[order]})
@@ -0,0 +1,296 @@
+#coding=UTF-8
+"""
+A columnar store for the time series of many ehyd stations.
+
+Put this file next to ehyd_reader.py to use it. Needs pyarrow.
+
+Instead of one wide dataframe with a 20 level header, the stations get stored
+as a long table (date, level) in parquet files, with a folder for each
+datatype and station, plus a table with the metadata of all stations:
+
+    ehyd_store/
+        metadata.parquet
+        data/datatype=Groundwater/HZB=314922/part-0.parquet
+        data/datatype=Precipitation/HZB=105239/part-0.parquet
+        ...
+
+When reading, only the folders of the selected stations get opened, and
+within their files only the row groups that overlap the selected dates.
+"""
+import json
+import os
+
+from ehyd_reader import (EHYD_CATEGORIES, EHYD_LEVELS, ehyd_read_each,
+                         metadata_table)
+
+_METADATA_FILE = 'metadata.parquet'
+_DATA_DIR = 'data'
+# The columns of the metadata table: the metadata of the station, the first
+# and last date and the number of values, and all the metadata as json, to
+# get back the exact column header of ehyd_reader.
+_METADATA_COLUMNS = EHYD_LEVELS + ['start', 'end', 'length', 'metadata']
+
+
+def _station_metadata(station_df):
+    """
+    Returns the metadata of a single station from the column MultiIndex of
+    its dataframe, as python values.
+    """
+    values = [value.item() if hasattr(value, 'item') else value
+              for value in station_df.columns[0]]
+    return dict(zip(station_df.columns.names, values))
+
+
+def _write_station(data_dir, metadata, level, row_group_size):
+    """
+    Writes the series of a single station (a Series indexed by date) into
+    its folder of the store, replacing what was there before. Dates that
+    appear more than once only keep their first value, like in ehyd_reader,
+    so every station has a single value per date in the store. Returns the
+    series as it was written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not isinstance(metadata['HZB'], int):
+        raise ValueError('Station %s has no HZB number, it can not be '
+                         'stored.' % metadata['station_name'])
+    station_dir = os.path.join(data_dir, 'datatype=%s' % metadata['datatype'],
+                               'HZB=%d' % metadata['HZB'])
+    os.makedirs(station_dir, exist_ok=True)
+    level = level[~level.index.duplicated()]
+    table = pa.table({'date': level.index.values,
+                      'level': level.to_numpy(dtype=float)})
+    # Files starting with a dot are skipped when reading the store, so
+    # nobody ever sees half a file.
+    temp_path = os.path.join(station_dir, '.part-0.%d.tmp' % os.getpid())
+    pq.write_table(table, temp_path, row_group_size=row_group_size)
+    os.replace(temp_path, os.path.join(station_dir, 'part-0.parquet'))
+    return level
+
+
+def _metadata_row(metadata, level):
+    return dict(metadata, start=level.index.min(), end=level.index.max(),
+                length=len(level),
+                metadata=json.dumps([metadata[name] for name in EHYD_LEVELS]))
+
+
+def _update_metadata(store_dir, rows):
+    """
+    Adds the metadata of newly written stations to the metadata table,
+    replacing older entries of the same stations.
+    """
+    import pandas as pd
+
+    metadata_path = os.path.join(store_dir, _METADATA_FILE)
+    new_table = metadata_table(rows, _METADATA_COLUMNS)
+    if os.path.exists(metadata_path):
+        old_table = pd.read_parquet(metadata_path)
+        new_keys = set(zip(new_table['datatype'].astype(str),
+                           new_table['HZB']))
+        keep = [key not in new_keys
+                for key in zip(old_table['datatype'].astype(str),
+                               old_table['HZB'])]
+        new_table = pd.concat([old_table[keep], new_table], ignore_index=True)
+    # Concatenating categories only keeps them if they're the same, so set
+    # them up again.
+    for column in EHYD_CATEGORIES + ['data_error']:
+        new_table[column] = new_table[column].astype(object).astype(
+            'category')
+    new_table = new_table.sort_values(['datatype', 'HZB']).reset_index(
+        drop=True)
+    temp_path = '%s.%d.tmp' % (metadata_path, os.getpid())
+    new_table.to_parquet(temp_path)
+    os.replace(temp_path, metadata_path)
+
+
+def write_store(stations, store_dir='ehyd_store', input_type='csv',
+                interpolate='False', workers=None, batch_size=100,
+                cache_dir=None, row_group_size=3653):
+    """
+    Writes the time series of many stations into the store.
+
+    Stations that are in the store already (same datatype and HZB) get
+    replaced, all others are kept, so a store can be filled bit by bit.
+
+    stations can be a dataframe with the column MultiIndex of ehyd_reader,
+    e.g. from ehyd_reader or ehyd_read_many. Since the stations in such a
+    dataframe share their dates, only the dates from the first to the last
+    valid value of each station get stored.
+    stations can also be a list of files (or a pattern like
+    'downloads/*.csv'). These get read in parallel, batch_size files at a
+    time, and written right away, so all the stations never have to fit into
+    memory at once.
+
+    Returns a dict with the files that couldn't be read or stations that
+    couldn't be written, and a short description of the error.
+
+    Parameters
+    ----------
+    stations : DataFrame, list or str
+        the stations or the files to store
+    store_dir : str
+        folder of the store, gets created if needed
+    input_type, interpolate : str
+        see ehyd_reader, used for reading files
+    workers : int
+        number of worker processes for reading files, see ehyd_read_many
+    batch_size : int
+        number of files read before they get written
+    cache_dir : str
+        cache to read the files with, see ehyd_reader_cached
+    row_group_size : int
+        number of values per row group. Reading only some dates skips the
+        row groups outside of them. The default is ten years of daily data.
+
+    Examples
+    --------
+    # Put all files from the downloads folder into the store:
+    errors = write_store('downloads/*.csv', 'ehyd_store', workers=4)
+    """
+    import glob
+
+    data_dir = os.path.join(store_dir, _DATA_DIR)
+    os.makedirs(data_dir, exist_ok=True)
+    errors = {}
+
+    if isinstance(stations, str):
+        stations = sorted(glob.glob(stations))
+    if isinstance(stations, list):
+        for first in range(0, len(stations), batch_size):
+            rows = []
+            for filename, station_df, error in ehyd_read_each(
+                    stations[first:first + batch_size], input_type,
+                    interpolate, workers=workers, cache_dir=cache_dir):
+                if error is not None:
+                    errors[filename] = error
+                    continue
+                metadata = _station_metadata(station_df)
+                level = station_df.iloc[:, 0]
+                try:
+                    level = _write_station(data_dir, metadata, level,
+                                           row_group_size)
+                except ValueError as error:
+                    errors[filename] = 'ValueError: %s' % error
+                    continue
+                rows.append(_metadata_row(metadata, level))
+            if rows:
+                _update_metadata(store_dir, rows)
+        return errors
+
+    rows = []
+    for position in range(stations.shape[1]):
+        station_df = stations.iloc[:, [position]]
+        metadata = _station_metadata(station_df)
+        level = station_df.iloc[:, 0]
+        level = level.loc[level.first_valid_index():level.last_valid_index()]
+        try:
+            level = _write_station(data_dir, metadata, level, row_group_size)
+        except ValueError as error:
+            errors[metadata['station_name']] = 'ValueError: %s' % error
+            continue
+        rows.append(_metadata_row(metadata, level))
+    if rows:
+        _update_metadata(store_dir, rows)
+    return errors
+
+
+def read_store(store_dir='ehyd_store', output_type='long', HZB=None,
+               datatype=None, start=None, end=None):
+    """
+    Reads stations from the store.
+
+    Only the files of the selected stations get opened, and of those only the
+    row groups with dates between start and end.
+
+    Use 'long' to get a dataframe with the columns 'datatype', 'HZB', 'date'
+    and 'level', 'df' to get a wide dataframe with the column MultiIndex of
+    ehyd_reader, just like ehyd_read_many, or 'meta' to only get the
+    metadata table of the selected stations.
+
+    Parameters
+    ----------
+    store_dir : str
+        folder of the store
+    output_type : str
+        can be 'long', 'df' or 'meta'
+    HZB : int or list of int
+        the stations to read, all if None
+    datatype : str or list of str
+        the datatypes to read, e.g. 'Groundwater', all if None
+    start, end : str or Timestamp
+        the first and last date to read (both included), e.g. '1975-01-01'
+
+    Examples
+    --------
+    # Groundwater levels of 1975 to 1980 of some wells:
+    levels = read_store('ehyd_store', 'df', HZB=[314922, 315010],
+                        datatype='Groundwater', start='1975-01-01',
+                        end='1980-12-31')
+    # Select stations by their metadata first:
+    meta = read_store('ehyd_store', 'meta', datatype='Groundwater')
+    deep = meta.query('depth > 20')
+    levels = read_store('ehyd_store', 'df', HZB=list(deep.HZB))
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if isinstance(HZB, int):
+        HZB = [HZB]
+    if isinstance(datatype, str):
+        datatype = [datatype]
+
+    metadata = pd.read_parquet(os.path.join(store_dir, _METADATA_FILE))
+    if HZB is not None:
+        metadata = metadata[metadata['HZB'].isin(HZB)]
+    if datatype is not None:
+        metadata = metadata[metadata['datatype'].isin(datatype)]
+    metadata = metadata.reset_index(drop=True)
+    if output_type == 'meta':
+        return metadata
+
+    # The folder names tell the datatype and HZB of each file, so files of
+    # other stations get skipped without opening them.
+    partitioning = ds.partitioning(pa.schema([('datatype', pa.string()),
+                                              ('HZB', pa.int64())]),
+                                   flavor='hive')
+    dataset = ds.dataset(os.path.join(store_dir, _DATA_DIR),
+                         format='parquet', partitioning=partitioning)
+    conditions = []
+    if HZB is not None:
+        conditions.append(ds.field('HZB').isin(HZB))
+    if datatype is not None:
+        conditions.append(ds.field('datatype').isin(datatype))
+    # The dates get compared with the statistics of each row group, so row
+    # groups outside of start and end don't get read.
+    if start is not None:
+        conditions.append(ds.field('date') >= pd.Timestamp(start))
+    if end is not None:
+        conditions.append(ds.field('date') <= pd.Timestamp(end))
+    condition = None
+    for each_condition in conditions:
+        condition = (each_condition if condition is None
+                     else condition & each_condition)
+    table = dataset.to_table(filter=condition)
+
+    values = table.to_pandas()
+    values['datatype'] = values['datatype'].astype(str)
+    values = values[['datatype', 'HZB', 'date', 'level']].sort_values(
+        ['datatype', 'HZB', 'date'], kind='stable').reset_index(drop=True)
+    if output_type == 'long':
+        return values
+
+    # pivot needs a single value per station and date. The store only has
+    # one, unless its files were written by something else than
+    # write_store, so keep the first then, like ehyd_reader does.
+    values = values[~values.duplicated(['datatype', 'HZB', 'date'])]
+    wide = values.pivot(index='date', columns=['datatype', 'HZB'],
+                        values='level')
+    headers = {(row_datatype, row_HZB): tuple(json.loads(row_metadata))
+               for row_datatype, row_HZB, row_metadata
+               in zip(metadata['datatype'].astype(str), metadata['HZB'],
+                      metadata['metadata'])}
+    wide.columns = pd.MultiIndex.from_tuples(
+        [headers[key] for key in wide.columns], names=EHYD_LEVELS)
+    return wide
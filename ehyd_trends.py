@@ -0,0 +1,467 @@
+#coding=UTF-8
+"""
+Trend tests for many ehyd stations at once.
+
+Put this file next to ehyd_reader.py and ehyd_panel.py to use it. Works on
+panels (see build_panel): the Mann-Kendall test and Sen's slope of all
+stations get calculated together with NumPy, a block of stations at a time.
+
+Both compare all pairs of values of a station, so a daily panel of 30 years
+has around 60 million pairs per station. These are never kept in memory at
+once: the values get compared with the values lag steps later, one lag after
+another, and Sen's slope (the median of the slopes of all pairs) gets found
+by narrowing down the range of slopes around the median over a few such
+sweeps, until the slopes in that range fit into memory.
+"""
+import numpy as np
+
+from ehyd_panel import panel_seasons
+
+# The most values compared at once in a block (32 MB for each array on the
+# way), which limits the number of stations in a block.
+_SWEEP_SIZE = 2 ** 22
+# The number of slopes of each station sampled to narrow down the range
+# around the median. More narrow it down faster, but need more memory for a
+# block.
+_SAMPLE_SIZE = 2 ** 13
+# The most slopes of a block collected in a sweep to find the medians
+# (128 MB). If there are more in the ranges, they get narrowed down further.
+_MAX_GATHER = 2 ** 24
+# A few sweeps are enough, this only guards against an endless loop.
+_MAX_SWEEPS = 64
+
+
+def _erfc(x):
+    """
+    The complementary error function of an array, from scipy if it's there.
+    Otherwise uses the approximation of Numerical Recipes (erfcc), with a
+    relative error below 1.2e-7 everywhere, so small p-values stay right.
+    """
+    try:
+        from scipy.special import erfc
+    except ImportError:
+        pass
+    else:
+        return erfc(x)
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x)
+    t = 1 / (1 + 0.5 * z)
+    polynomial = np.full_like(t, 0.17087277)
+    for coefficient in [-0.82215223, 1.48851587, -1.13520398, 0.27886807,
+                        -0.18628806, 0.09678418, 0.37409196, 1.00002368]:
+        polynomial = coefficient + t * polynomial
+    result = t * np.exp(-z * z - 1.26551223 + t * polynomial)
+    return np.where(x >= 0, result, 2 - result)
+
+
+def _tie_sums(values):
+    """
+    Returns the sum of t(t - 1)(2t + 5) over all groups of t equal values in
+    each column, for the variance of the Mann-Kendall S. NaN are left out.
+    """
+    n_rows, n_cols = values.shape
+    ordered = np.sort(values, axis=0)
+    # Equal neighbours after sorting, plus a row of False, so the runs of
+    # one column don't go on into the next one.
+    same = np.zeros((n_rows, n_cols), dtype=np.int8)
+    same[:-1] = ordered[1:] == ordered[:-1]
+    flat = np.concatenate(([0], same.ravel(order='F'), [0]))
+    steps = np.diff(flat)
+    run_starts = np.flatnonzero(steps == 1)
+    ties = np.flatnonzero(steps == -1) - run_starts + 1
+    return np.bincount(run_starts // n_rows,
+                       weights=ties * (ties - 1) * (2 * ties + 5),
+                       minlength=n_cols)
+
+
+def _pair_counts(values):
+    """
+    Returns the number of pairs of valid values in each column.
+    """
+    count = (~np.isnan(values)).sum(axis=0)
+    return count * (count - 1) // 2
+
+
+def _slope_sweep(values, years, seasons):
+    """
+    Yields the slopes between all pairs of values of each row of values
+    (a station per row, the values in order of time), a lag at a time: the
+    slopes between every value and the one lag steps later, within each
+    season. Pairs with NaN give NaN.
+    """
+    for rows in seasons:
+        # Not values[:, rows], which would give the columns in Fortran
+        # order and make counting along the rows several times slower.
+        season_values = np.take(values, rows, axis=1)
+        season_years = years[rows]
+        for lag in range(1, len(rows)):
+            yield ((season_values[:, lag:] - season_values[:, :-lag])
+                   / (season_years[lag:] - season_years[:-lag]))
+
+
+def _order_statistics(rows, slopes, n_rows, ranks):
+    """
+    Returns the slopes at ranks (counted from 0, a row of ranks per row)
+    among the slopes of each row, where rows tells the row of every slope.
+    Rows with a negative rank get NaN.
+    """
+    order = np.argsort(rows, kind='stable')
+    slopes = slopes[order]
+    offsets = np.searchsorted(rows[order], np.arange(n_rows + 1))
+    result = np.full(ranks.shape, np.nan)
+    for row in np.flatnonzero((ranks >= 0).any(axis=1)):
+        wanted = ranks[row] >= 0
+        row_slopes = slopes[offsets[row]:offsets[row + 1]]
+        row_slopes.partition(np.unique(ranks[row, wanted]))
+        result[row, wanted] = row_slopes[ranks[row, wanted]]
+    return result
+
+
+def _sample_pairs(values, years, seasons, rng):
+    """
+    Returns the slopes of _SAMPLE_SIZE random pairs (within the same season)
+    of each row of values, as the row and the slope of each one. The same
+    pairs are drawn for all rows, those with NaN are left out.
+    """
+    sizes = np.array([len(rows) for rows in seasons])
+    weights = sizes * (sizes - 1) / 2
+    season = rng.choice(len(seasons), _SAMPLE_SIZE, p=weights / weights.sum())
+    first = rng.integers(sizes[season])
+    second = rng.integers(sizes[season] - 1)
+    second += second >= first
+    starts = np.concatenate(([0], np.cumsum(sizes)))[season]
+    times = np.concatenate(seasons)
+    earlier = times[starts + np.minimum(first, second)]
+    later = times[starts + np.maximum(first, second)]
+    slopes = ((values[:, later] - values[:, earlier])
+              / (years[later] - years[earlier]))
+    rows, columns = np.nonzero(~np.isnan(slopes))
+    return rows, slopes[rows, columns]
+
+
+def _narrow_bins(rows, sample, ranks, count, low, high):
+    """
+    Returns a bin (its lower and upper edge) within the range from low to
+    high of each row, which contains the slopes at ranks (counted from the
+    first slope in the range) most likely, and the number of slopes expected
+    in it. The count slopes in the range are known from a sample of them,
+    where rows tells the row of every slope of the sample.
+    """
+    n_sampled = np.bincount(rows, minlength=len(count))
+    share = n_sampled / np.maximum(count, 1)
+    # The rank of a slope in the sample is off by less than six standard
+    # deviations (at most half of the square root of the sample size) but
+    # in a few cases out of a billion, which only cost another sweep.
+    margin = 3 * np.sqrt(n_sampled) + 1
+    lower = np.floor(ranks[:, 0] * share - margin).astype(np.int64)
+    upper = np.ceil(ranks[:, 1] * share + margin).astype(np.int64)
+    last = np.maximum(n_sampled - 1, 0)
+    edges = _order_statistics(
+        rows, sample, len(count),
+        np.where(n_sampled[:, None] > 0,
+                 np.stack([np.clip(lower, 0, last), np.clip(upper, 0, last)],
+                          axis=1), -1))
+    bin_low = np.where((n_sampled > 0) & (lower >= 0), edges[:, 0], low)
+    bin_high = np.where((n_sampled > 0) & (upper <= last), edges[:, 1], high)
+    expected = np.where(n_sampled > 0,
+                        (np.minimum(upper, last) - np.maximum(lower, 0) + 1)
+                        / np.maximum(n_sampled, 1) * count, count)
+    return bin_low, bin_high, expected
+
+
+def _kendall_sen(values, years, seasons, rng):
+    """
+    Returns the Mann-Kendall S and Sen's slope of each row of values, with
+    one station per row and the values in order of time. Only pairs within
+    the same season get compared. NaN are left out.
+
+    S gets counted in the first sweep over all pairs. For Sen's slope, the
+    two middle slopes of each station (the same one for an odd number of
+    pairs) are known to be between low and high, with below slopes under
+    low. A sample of random pairs gives a small bin around them, and every
+    sweep counts the slopes below and in the bin and collects those strictly
+    inside of it (as long as they fit). If both middle slopes are in the bin
+    and all its slopes got collected (or the middle slopes are at the edges
+    of the bin), the median is found. If not all could be collected, the
+    range shrinks to the bin, and a sample of it gives the next, smaller
+    bin. If a middle slope is outside of the bin, the range shrinks to the
+    part it's in. Slopes equal to the edges are only counted, so many tied
+    slopes don't need memory.
+    """
+    n_stations = len(values)
+    pairs = sum(_pair_counts(values[:, rows].T) for rows in seasons)
+    ranks = np.stack([(pairs - 1) // 2, pairs // 2], axis=1)
+    S = np.zeros(n_stations)
+    medians = np.full(n_stations, np.nan)
+    low = np.full(n_stations, -np.inf)
+    high = np.full(n_stations, np.inf)
+    below = np.zeros(n_stations, dtype=np.int64)
+    inside = pairs.copy()
+    rows, sample = _sample_pairs(values, years, seasons, rng)
+    bin_low, bin_high, expected = _narrow_bins(rows, sample, ranks, inside,
+                                               low, high)
+    # Stations without pairs have S = 0 and no slope, so they need no sweep.
+    todo = pairs > 0
+
+    sweep = 0
+    while todo.any():
+        if sweep == _MAX_SWEEPS:
+            raise RuntimeError("Sen's slope could not be narrowed down in "
+                               "%d sweeps." % _MAX_SWEEPS)
+        active = np.flatnonzero(todo)
+        n_active = len(active)
+        active_bin_low = bin_low[active, None]
+        active_bin_high = bin_high[active, None]
+        # Only collect the slopes in the bins if they'll likely fit, and
+        # only sample them if they'll likely not.
+        total = expected[active].sum()
+        gathered = [] if total <= 2 * _MAX_GATHER else None
+        n_gathered = 0
+        sampled = [] if total > _MAX_GATHER / 2 else None
+        if sampled is not None:
+            # About _SAMPLE_SIZE slopes of the bin of each station: draw
+            # columns at the highest rate needed, then thin out per station.
+            rate = np.minimum(1.0, _SAMPLE_SIZE
+                              / np.maximum(expected[active], 1))
+            top_rate = rate.max()
+            thinning = (rate / top_rate)[:, None]
+
+        counts = {name: np.zeros(n_active, dtype=np.int64)
+                  for name in ['before', 'binned', 'at_low', 'at_high']}
+        for slopes in _slope_sweep(values[active], years, seasons):
+            if sweep == 0:
+                S[active] += (np.count_nonzero(slopes > 0, axis=1)
+                              - np.count_nonzero(slopes < 0, axis=1))
+            before = np.count_nonzero(slopes < active_bin_low, axis=1)
+            counts['before'] += before
+            counts['binned'] += np.count_nonzero(
+                slopes <= active_bin_high, axis=1) - before
+            counts['at_low'] += np.count_nonzero(slopes == active_bin_low,
+                                                 axis=1)
+            counts['at_high'] += np.count_nonzero(slopes == active_bin_high,
+                                                  axis=1)
+            if gathered is not None:
+                rows, columns = np.nonzero((slopes > active_bin_low)
+                                           & (slopes < active_bin_high))
+                n_gathered += len(rows)
+                if n_gathered > _MAX_GATHER:
+                    # Too many for this sweep, narrow the bins down first.
+                    gathered = None
+                else:
+                    gathered.append((rows, slopes[rows, columns]))
+            if sampled is not None:
+                width = slopes.shape[1]
+                if top_rate < 1:
+                    columns = rng.choice(width, rng.binomial(width, top_rate),
+                                         replace=False)
+                    part = slopes[:, columns]
+                else:
+                    part = slopes
+                keep = (part >= active_bin_low) & (part <= active_bin_high)
+                if (thinning < 1).any():
+                    keep &= rng.random(part.shape) < thinning
+                rows, columns = np.nonzero(keep)
+                sampled.append((rows, part[rows, columns]))
+        sweep += 1
+
+        active_ranks = ranks[active]
+        # The ranks of the first slope in the bin, the first one above the
+        # lower edge, the first one at the upper edge and the first one
+        # above the bin.
+        bin_start = counts['before']
+        bin_end = bin_start + counts['binned']
+        at_high = np.where(bin_low[active] == bin_high[active], 0,
+                           counts['at_high'])
+        inner_start = (bin_start + counts['at_low'])[:, None]
+        inner_end = (bin_end - at_high)[:, None]
+        in_bin = ((active_ranks >= bin_start[:, None])
+                  & (active_ranks < bin_end[:, None])).all(axis=1)
+        # The middle slopes at the edges of the bin are known already.
+        found = np.where(active_ranks < inner_start, active_bin_low,
+                         np.where(active_ranks >= inner_end,
+                                  active_bin_high, np.nan))
+        inner = (active_ranks >= inner_start) & (active_ranks < inner_end)
+        complete = np.zeros(n_active, dtype=bool)
+        if gathered is not None:
+            rows = np.concatenate([rows for rows, _ in gathered]
+                                  + [np.empty(0, dtype=np.int64)])
+            complete = np.bincount(rows, minlength=n_active) == (
+                inner_end - inner_start)[:, 0]
+            lookup = (in_bin & complete)[:, None] & inner
+            inner_slopes = _order_statistics(
+                rows, np.concatenate([slopes for _, slopes in gathered]
+                                     + [np.empty(0)]),
+                n_active, np.where(lookup, active_ranks - inner_start, -1))
+            found = np.where(lookup, inner_slopes, found)
+        finished = in_bin & (complete | ~inner.any(axis=1))
+        medians[active[finished]] = (found[finished, 0]
+                                     + found[finished, 1]) / 2
+        todo[active[finished]] = False
+
+        # Where the middle slopes are outside of the bin, the range shrinks
+        # to the parts of it they're in, and gets swept as a whole next.
+        first, last = active_ranks[:, 0], active_ranks[:, 1]
+        old_bin_low = bin_low[active]
+        old_bin_high = bin_high[active]
+        old_end = below[active] + inside[active]
+        new_low = np.where(first < bin_start, low[active],
+                           np.where(first < bin_end, old_bin_low,
+                                    np.nextafter(old_bin_high, np.inf)))
+        new_below = np.where(first < bin_start, below[active],
+                             np.where(first < bin_end, bin_start, bin_end))
+        new_high = np.where(last < bin_start,
+                            np.nextafter(old_bin_low, -np.inf),
+                            np.where(last < bin_end, old_bin_high,
+                                     high[active]))
+        new_end = np.where(last < bin_start, bin_start,
+                           np.where(last < bin_end, bin_end, old_end))
+        go_on = ~finished
+        stations = active[go_on]
+        low[stations] = new_low[go_on]
+        high[stations] = new_high[go_on]
+        below[stations] = new_below[go_on]
+        inside[stations] = (new_end - new_below)[go_on]
+        bin_low[stations] = low[stations]
+        bin_high[stations] = high[stations]
+        expected[stations] = inside[stations]
+
+        # Where they are in the bin, but not all of its slopes could be
+        # collected, the sample of the bin gives a smaller bin around them.
+        narrow = go_on & in_bin
+        if sampled is None or not narrow.any():
+            continue
+        rows = np.concatenate([rows for rows, _ in sampled])
+        sample = np.concatenate([slopes for _, slopes in sampled])
+        narrow_low, narrow_high, narrow_expected = _narrow_bins(
+            rows, sample, active_ranks - bin_start[:, None],
+            counts['binned'], low[active], high[active])
+        stations = active[narrow]
+        bin_low[stations] = narrow_low[narrow]
+        bin_high[stations] = narrow_high[narrow]
+        expected[stations] = narrow_expected[narrow]
+    return S, medians
+
+
+def trend_tests(panel, method='mann_kendall', alpha=0.05, min_count=10,
+                skip_errors=None, block_size=None, seed=0):
+    """
+    Tests all stations of a panel for a monotonic trend at once.
+
+    Works on a panel (see build_panel) or any dataframe with a DatetimeIndex
+    and one column per station. For each station, it gives
+      * the Mann-Kendall test (with the correction for ties): S, its
+        variance, Z and the two-sided p-value, and Kendall's tau,
+      * Sen's slope, the median of the slopes between all pairs of values,
+        in units per year.
+    With method='seasonal', values only get compared within the same month
+    (or day of the year for daily panels), as in the seasonal Kendall test
+    of Hirsch et al. (1982), which takes care of seasonal cycles. Sen's slope
+    is then the median of the slopes within the seasons.
+
+    NaN are left out, so the panel doesn't have to be filled (see fill_gaps).
+    All pairs of values get compared, so the time grows with the square of
+    the length of the panel, but the memory doesn't: a daily panel of
+    decades takes a few sweeps over all pairs, but works.
+
+    Returns a dataframe with a row per station and the columns 'n' (number
+    of values), 'S', 'var_S', 'Z', 'p', 'tau', 'slope' and 'trend', which is
+    'increasing' or 'decreasing' if p < alpha, else 'none'. Stations with
+    less than min_count values get 'too_short' and those skipped due to
+    their data_error get 'skipped', with NaN everywhere else.
+
+    Parameters
+    ----------
+    panel : DataFrame
+        the stations, with dates as index
+    method : str
+        can be 'mann_kendall' or 'seasonal'
+    alpha : float
+        the significance level for 'trend'
+    min_count : int
+        the number of values a station needs to be tested
+    skip_errors : list
+        the data_error (see ehyd_reader) of stations to leave out, e.g.
+        ['short_data', '10+percent_gap']. Needs the data_error in the column
+        header of the panel.
+    block_size : int
+        number of stations tested at once, which limits the memory needed on
+        the way. Defaults to as many as fit into the limits of the module.
+    seed : int
+        seed of the random samples used to find Sen's slope. The results
+        are exact and don't depend on it, only the time it takes.
+
+    Examples
+    --------
+    panel = build_panel(stations, 'MS', start='1970-01-01', end='2019-12-31')
+    trends = trend_tests(panel.xs('Groundwater', level='datatype', axis=1),
+                         'seasonal', skip_errors=['short_data'])
+    trends['trend'].value_counts()
+    """
+    import pandas as pd
+
+    if method not in ('mann_kendall', 'seasonal'):
+        raise ValueError("method can be 'mann_kendall' or 'seasonal', not "
+                         "%r." % method)
+    values = panel.to_numpy(dtype=float)
+    n_rows, n_stations = values.shape
+    years = panel.index.values.astype('datetime64[D]').astype(
+        np.int64) / 365.25
+    if method == 'seasonal':
+        season, n_seasons = panel_seasons(panel.index)
+        seasons = [np.flatnonzero(season == number)
+                   for number in range(n_seasons)]
+        seasons = [rows for rows in seasons if len(rows) > 1]
+    else:
+        seasons = [np.arange(n_rows)]
+    max_block_size = max(min(_SWEEP_SIZE // max(n_rows, 1),
+                             _SWEEP_SIZE // _SAMPLE_SIZE), 1)
+    if block_size is None or block_size > max_block_size:
+        block_size = max_block_size
+    rng = np.random.default_rng(seed)
+
+    tested = np.ones(n_stations, dtype=bool)
+    if skip_errors is not None:
+        tested = ~np.isin(panel.columns.get_level_values('data_error'),
+                          list(skip_errors))
+    stations = np.flatnonzero(tested)
+
+    results = {name: np.full(n_stations, np.nan)
+               for name in ['n', 'S', 'var_S', 'slope']}
+    results['n'][:] = (~np.isnan(values)).sum(axis=0)
+    for block_start in range(0, len(stations), block_size):
+        block = stations[block_start:block_start + block_size]
+        # A row per station, so the values of a station are next to each
+        # other in memory.
+        block_values = np.ascontiguousarray(values[:, block].T)
+        S, slope = _kendall_sen(block_values, years, seasons, rng)
+        var_S = np.zeros(len(block))
+        for rows in seasons:
+            season_values = block_values[:, rows].T
+            count = (~np.isnan(season_values)).sum(axis=0)
+            var_S += (count * (count - 1) * (2 * count + 5)
+                      - _tie_sums(season_values)) / 18
+        results['S'][block] = S
+        results['var_S'][block] = var_S
+        results['slope'][block] = slope
+
+    n = results['n']
+    short = tested & (n < max(min_count, 2))
+    for name in ['S', 'var_S', 'slope']:
+        results[name][~tested | short] = np.nan
+    S = results['S']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # With the continuity correction, S = 0 gives no trend at all.
+        Z = (S - np.sign(S)) / np.sqrt(results['var_S'])
+        tau = S / np.sum([_pair_counts(values[rows]) for rows in seasons],
+                         axis=0)
+    Z[S == 0] = 0.0
+    p = _erfc(np.abs(Z) / np.sqrt(2))
+
+    trend = np.where(p < alpha, np.where(Z > 0, 'increasing', 'decreasing'),
+                     'none').astype(object)
+    trend[short] = 'too_short'
+    trend[~tested] = 'skipped'
+    return pd.DataFrame({'n': n.astype(np.int64), 'S': S,
+                         'var_S': results['var_S'], 'Z': Z, 'p': p,
+                         'tau': tau, 'slope': results['slope'],
+                         'trend': trend}, index=panel.columns)